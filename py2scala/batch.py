@@ -0,0 +1,318 @@
+'''batch -- convert the modules of a project
+
+Usage::
+
+  $ python -m py2scala.batch [--index sigs.idx] [--out DIR]
+        [--shard I/N] [--report shard.json] [--stubs STUB_DIR]
+        [--pass NAME] [--no-pass NAME] [--jobs N] a.py b.py ...
+  $ python -m py2scala.batch --merge shard1.json shard2.json ...
+
+Each module is converted to DIR/module.scala, with a source map
+(see srcmap) in DIR/module.scala.map. DIR/module.scala.chunks notes
+where each top-level definition went, so that when the module is
+converted again, only definitions that changed are converted; the
+rest are copied from the last output (see splice).
+
+With `--jobs N`, the top-level definitions of each large module are
+converted by a pool of N worker processes, so that one very large
+module does not hold up the batch; the output is the same.
+
+With `--index`, a project-level signature index (see sigindex) is
+kept up to date and consulted at call sites. Only modules whose
+source changed, or that import a module whose signatures changed,
+are reconverted. A module that failed to convert, or that was left
+to another shard, is left out of the index, so it is converted next
+time.
+
+With `--shard I/N`, only the I-th of N shards (counting from 1) is
+converted. Each machine given the same modules computes the same
+partition, balanced by source size. `--report` saves diagnostics and
+timing for each module converted; `--merge` combines such reports.
+
+If any module fails to convert, its output is left as it was and
+the exit status is 1.
+
+Where a module has types observed at run time beside it, in
+`a.py.types` (see observe), they are used for definitions whose
+docstrings give none; a change to them also calls for reconversion.
+
+With `--stubs`, scala stubs for imported third-party modules are
+generated in STUB_DIR; see stubs.
+
+Rewrite passes (see passes) are chosen as in p2s; the report notes
+the time each took and how many nodes it added or removed.
+
+'''
+
+from functools import partial
+import StringIO
+import hashlib
+import json
+import logging
+from os.path import splitext, basename
+
+import p2s
+from sigindex import SigIndex, module_sigs, digest
+from srcmap import SourceMap
+from stubs import StubCache, update_stubs
+
+log = logging.getLogger(__name__)
+
+
+def main(argv, open, exists, join, makedirs, getmtime, stdout, clock,
+         find_package, find_source, mk_pool,
+         level=logging.INFO):
+    logging.basicConfig(level=logging.DEBUG if '--debug' in argv else level)
+    if '--merge' in argv:
+        reports = [json.load(open(fn))
+                   for fn in arguments(argv, [])]
+        json.dump(merge_reports(reports), stdout, indent=1, sort_keys=True)
+        return
+
+    index_fn = option(argv, '--index')
+    out_dir = option(argv, '--out', '.')
+    pkg = option(argv, '--package')
+    report_fn = option(argv, '--report')
+    shard_ix, shards = [int(n) for n in option(argv, '--shard',
+                                               '1/1').split('/')]
+    stubs_dir = option(argv, '--stubs')
+    pass_names = p2s.pass_options(argv)
+    jobs = int(option(argv, '--jobs', '1'))
+    filenames = arguments(argv, ['--index', '--out', '--package',
+                                 '--report', '--shard', '--stubs',
+                                 '--pass', '--no-pass', '--jobs'])
+
+    sources = dict((fn, open(fn).read()) for fn in filenames)
+    observed = dict((fn, open(fn + '.types').read()) for fn in filenames
+                    if exists(fn + '.types'))
+    index = (SigIndex.load(open(index_fn))
+             if index_fn and exists(index_fn) else SigIndex())
+    changed, planned = plan(sources, index, observed)
+    mine = shard(dict((fn, len(src)) for (fn, src) in sources.items()),
+                 shards)[shard_ix - 1]
+    todo = [fn for fn in planned if fn in mine]
+
+    def save_scala_fp(fn, suffix=''):
+        return open(join(out_dir, scala_name(fn) + suffix), 'w')
+
+    def previous(fn):
+        scala_fn = join(out_dir, scala_name(fn))
+        if not (exists(scala_fn) and exists(scala_fn + '.chunks')):
+            return None
+        return open(scala_fn).read(), json.load(open(scala_fn + '.chunks'))
+
+    report = {}
+    for fn in todo:
+        log.info('converting %s', fn)
+        report[fn] = convert_one(fn, sources[fn], save_scala_fp,
+                                 find_package, clock,
+                                 pkg=pkg, sigs=index,
+                                 pass_names=pass_names,
+                                 previous=previous(fn),
+                                 mk_pool=(partial(mk_pool, jobs)
+                                          if jobs > 1 else None),
+                                 observed=(json.loads(observed[fn])
+                                           if fn in observed else None))
+    log.info('converted %d of %d modules', len(todo), len(filenames))
+
+    if stubs_dir:
+        cache_fn = join(stubs_dir, 'stubs.idx')
+        cache = (StubCache.load(open(cache_fn))
+                 if exists(cache_fn) else StubCache())
+
+        def save_stub_fp(parts):
+            there = join(stubs_dir, *parts[:-1])
+            if not exists(there):
+                makedirs(there)
+            return open(join(there, parts[-1] + '.scala'), 'w')
+
+        def stub_exists(name):
+            return exists(join(stubs_dir, *name.split('.')) + '.scala')
+
+        done = update_stubs(sources, cache, find_package, find_source,
+                            lambda path: open(path).read(), getmtime,
+                            save_stub_fp, stub_exists)
+        log.info('generated %d stubs', len(done))
+        cache.save(open(cache_fn, 'w'))
+
+    if report_fn:
+        json.dump(dict(shard='%d/%d' % (shard_ix, shards), modules=report),
+                  open(report_fn, 'w'), indent=1, sort_keys=True)
+
+    failed = sorted(fn for (fn, result) in report.items()
+                    if 'error' in result)
+    # Modules left to other shards, like those that failed, are not
+    # up to date here.
+    unconverted = failed + [fn for fn in planned if fn not in mine]
+    for fn in unconverted:
+        index.discard(modname(fn))
+
+    if index_fn:
+        if unconverted or index.needs_compaction():
+            index.save(open(index_fn, 'w'))
+        else:
+            index.save(open(index_fn, 'a'), changed)
+
+    if failed:
+        log.error('%d modules failed: %s', len(failed), ', '.join(failed))
+        return 1
+    return 0
+
+
+def option(argv, name, default=None):
+    return argv[argv.index(name) + 1] if name in argv else default
+
+
+def arguments(argv, with_values):
+    skip = [ix + 1 for (ix, arg) in enumerate(argv) if arg in with_values]
+    return [arg for (ix, arg) in enumerate(argv)
+            if ix > 0 and ix not in skip and not arg.startswith('--')]
+
+
+def modname(fn):
+    return splitext(basename(fn))[0]
+
+
+def scala_name(fn):
+    return modname(fn) + '.scala'
+
+
+def plan(sources, index, observed={}):
+    '''Index the sources and find which of them need conversion.
+
+    :param sources: source text by filename
+    :param observed: text of observed types by filename, as a
+                     part of the source
+    :return: (changed index entries, filenames to convert)
+    '''
+    entries = [module_sigs(modname(fn), src, fn)
+               for (fn, src) in sorted(sources.items())]
+    for entry, fn in zip(entries, sorted(sources)):
+        if fn in observed:
+            entry['src_digest'] = digest(sources[fn] + observed[fn])
+    changed, todo = index.update(entries)
+    return changed, [fn for fn in sorted(sources) if modname(fn) in todo]
+
+
+def shard(sizes, n):
+    '''Partition modules among n shards, balancing total source size.
+
+    Largest modules are placed first, each on the least loaded shard;
+    ties are broken by a stable hash of the filename, so the
+    partition depends only on the filenames and their sizes::
+
+      >>> shard({'a.py': 10, 'b.py': 6, 'c.py': 5, 'd.py': 1}, 2)
+      [['a.py', 'd.py'], ['b.py', 'c.py']]
+
+    :param sizes: source size by filename
+    :rtype: Seq[Seq[String]]
+    '''
+    loads = [0] * n
+    shards = [[] for _ in range(n)]
+    for fn in sorted(sizes, key=lambda fn: (-sizes[fn], stable_hash(fn))):
+        ix = min(range(n), key=lambda ix: (loads[ix], ix))
+        shards[ix].append(fn)
+        loads[ix] += sizes[fn]
+    return [sorted(fns) for fns in shards]
+
+
+def stable_hash(fn):
+    return hashlib.md5(fn).hexdigest()
+
+
+def convert_one(fn, src, save_scala_fp, find_package, clock,
+                pkg=None, sigs=None, pass_names=None, previous=None,
+                mk_pool=None, observed=None):
+    '''Convert one module, noting diagnostics, errors and timing.
+
+    Output is saved only if conversion succeeds; a failure leaves the
+    output of the last conversion, if any, as it was.
+
+    :param previous: (scala text, chunks record) of the last
+                     conversion; see splice
+    :param mk_pool: see p2s.convert
+    :param observed: see p2s.convert
+    '''
+    t0 = clock()
+    result = {}
+    source_map = SourceMap(fn)
+    pass_stats = []
+    chunks = {}
+    out = StringIO.StringIO()
+    try:
+        result['diagnostics'] = p2s.convert(fn, src, out, find_package,
+                                            pkg=pkg, sigs=sigs,
+                                            source_map=source_map,
+                                            pass_names=pass_names,
+                                            pass_stats=pass_stats,
+                                            chunks=chunks,
+                                            previous=previous,
+                                            mk_pool=mk_pool,
+                                            observed=observed,
+                                            interactive=False)
+    except Exception as ex:
+        log.error('%s: conversion failed: %r', fn, ex)
+        result['error'] = repr(ex)
+    else:
+        with save_scala_fp(fn) as scala_out:
+            scala_out.write(out.getvalue())
+        with save_scala_fp(fn, '.map') as map_out:
+            source_map.save(map_out)
+        with save_scala_fp(fn, '.chunks') as chunks_out:
+            json.dump(chunks, chunks_out, sort_keys=True,
+                      separators=(',', ':'))
+    result['passes'] = dict((name, dict(seconds=seconds, nodes=delta))
+                            for (name, seconds, delta) in pass_stats)
+    result['seconds'] = clock() - t0
+    return result
+
+
+def merge_reports(reports):
+    '''Combine per-shard reports.
+
+      >>> merged = merge_reports([
+      ...     dict(shard='2/2', modules={'b.py': dict(seconds=1.5)}),
+      ...     dict(shard='1/2', modules={'a.py': dict(seconds=2.0,
+      ...                                             error='oops')})])
+      >>> sorted(merged['modules'])
+      ['a.py', 'b.py']
+      >>> sorted(merged['shards']['1/2'].items())
+      [('errors', 1), ('modules', 1), ('seconds', 2.0)]
+    '''
+    modules, shards = {}, {}
+    for report in reports:
+        mods = report['modules']
+        modules.update(mods)
+        shards[report['shard']] = dict(
+            modules=len(mods),
+            errors=len([1 for m in mods.values() if 'error' in m]),
+            seconds=sum(m['seconds'] for m in mods.values()))
+    return dict(shards=shards, modules=modules)
+
+
+if __name__ == '__main__':
+    def _with_caps(main):
+        from imp import find_module
+        from os import path as os_path, makedirs
+        from multiprocessing import Pool
+        from sys import argv, stdout, path as sys_path
+        from time import time
+
+        from stubs import mk_find_source
+
+        return main(argv=argv[:],
+                    open=open,
+                    exists=os_path.exists,
+                    join=os_path.join,
+                    makedirs=makedirs,
+                    getmtime=os_path.getmtime,
+                    stdout=stdout,
+                    clock=time,
+                    find_package=p2s.mk_find_package(find_module,
+                                                     os_path.split,
+                                                     sys_path),
+                    find_source=mk_find_source(find_module, os_path.join,
+                                               sys_path),
+                    mk_pool=Pool)
+
+    raise SystemExit(_with_caps(main))
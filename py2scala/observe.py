@@ -0,0 +1,348 @@
+r'''observe -- note the types that functions see at run time
+
+Usage::
+
+  $ python -m py2scala.observe [--out DIR] --test NAME [--test NAME ...]
+        a.py b.py ...
+
+Most legacy modules have no `:type:` docstrings, so their arguments
+convert to `Any`. Running their tests under `Observer`, a
+`sys.setprofile` hook, notes the types of the arguments and return
+values of the functions they define::
+
+  >>> src = ('def add(x, y):\n'
+  ...        '    return x + y\n'
+  ...        'class C(object):\n'
+  ...        '    def size(self, xs):\n'
+  ...        '        return len(xs)\n')
+  >>> ns = {}
+  >>> exec compile(src, 'm.py', 'exec') in ns
+  >>> obs = Observer(['m.py'])
+  >>> with obs.profiling(sys.setprofile):
+  ...     _ = ns['add'](1, 2), ns['add']('a', 'b'), ns['C']().size([1.5])
+  >>> types = obs.types('m.py', src)
+  >>> types['add']['args']['x'], types['add']['returns']
+  (['Int', 'String'], ['Int', 'String'])
+  >>> types['C.size']['args']['xs'], types['C.size']['returns']
+  (['Seq[Double]'], ['Int'])
+
+The types of each module are saved beside it, in `a.py.types`, and
+p2s and batch use them where docstrings give none; see
+`ObservedTypes`. Functions that saw more than one type are listed.
+
+'''
+
+from contextlib import contextmanager
+from itertools import islice
+import __builtin__
+import ast
+import dis
+import hashlib
+import json
+import re
+import sys
+import types
+
+CO_VARARGS = 0x04
+CO_GENERATOR = 0x20
+RETURN_VALUE = chr(dis.opmap['RETURN_VALUE'])
+INTERPRETER_TYPES = frozenset(t for t in vars(types).values()
+                              if isinstance(t, type))
+
+
+def main(argv, open, stdout, setprofile, run_tests, abspath):
+    out_dir = argv[argv.index('--out') + 1] if '--out' in argv else None
+    tests = [argv[ix + 1] for (ix, arg) in enumerate(argv[:-1])
+             if arg == '--test']
+    skip = [ix + 1 for (ix, arg) in enumerate(argv)
+            if arg in ('--out', '--test')]
+    filenames = [arg for (ix, arg) in enumerate(argv)
+                 if ix > 0 and ix not in skip and not arg.startswith('--')]
+
+    obs = Observer(filenames, abspath)
+    with obs.profiling(setprofile):
+        run_tests(tests)
+
+    for fn in filenames:
+        types = obs.types(fn, open(fn).read())
+        out_fn = (fn if out_dir is None
+                  else out_dir + '/' + fn.rsplit('/', 1)[-1]) + '.types'
+        with open(out_fn, 'w') as out:
+            save(types, out)
+        for line in polymorphic(fn, types):
+            stdout.write(line + '\n')
+
+
+class Observer(object):
+    '''Note argument and return types of functions defined in some
+    source files.
+    '''
+    def __init__(self, filenames, normpath=lambda fn: fn):
+        self._normpath = normpath
+        self._files = set(normpath(fn) for fn in filenames)
+        self._code = {}
+
+    @contextmanager
+    def profiling(self, setprofile):
+        setprofile(self.profile)
+        try:
+            yield
+        finally:
+            setprofile(None)
+
+    def profile(self, frame, event, arg):
+        if event == 'call':
+            seen = self._seen(frame.f_code)
+            if seen is None:
+                return
+            args, _ = seen
+            f_locals = frame.f_locals
+            for (name, vararg, types) in args:
+                if name not in f_locals:
+                    continue
+                value = f_locals[name]
+                types.update([describe(item) for item in value[:3]]
+                             if vararg else [describe(value)])
+        elif event == 'return':
+            code = frame.f_code
+            seen = self._code.get(code)
+            # Exceptions and yields also end a call; skip those.
+            if (seen is not None and not code.co_flags & CO_GENERATOR and
+                    code.co_code[frame.f_lasti] == RETURN_VALUE):
+                seen[1].add(describe(arg))
+
+    def _seen(self, code):
+        if code not in self._code:
+            self._code[code] = (
+                ([(name, vararg, set())
+                  for (name, vararg) in arg_names(code)], set())
+                if self._normpath(code.co_filename) in self._files
+                else None)
+        return self._code[code]
+
+    def types(self, filename, src):
+        '''Types seen by the functions defined in src, by qualified name.
+
+        :return: {name: {'args': {arg: [type]}, 'returns': [type]}}
+        '''
+        names = dict(((node.lineno, node.name), name)
+                     for (name, node) in definitions(ast.parse(src)))
+        found = {}
+        for (code, seen) in self._code.items():
+            if (seen is None or
+                    self._normpath(code.co_filename) !=
+                    self._normpath(filename)):
+                continue
+            name = names.get((code.co_firstlineno, code.co_name))
+            if name is None:
+                continue
+            args, returns = seen
+            found[name] = dict(
+                args=dict((arg, unify(types)) for (arg, _, types) in args
+                          if types),
+                returns=unify(returns))
+        return found
+
+
+def arg_names(code):
+    '''Names of a function's parameters, noting which is `*args`,
+    whose elements are observed rather than the tuple of them.
+    '''
+    names = code.co_varnames[:code.co_argcount]
+    return [(name, False) for name in names if not name.startswith('.')] + (
+        [(code.co_varnames[code.co_argcount], True)]
+        if code.co_flags & CO_VARARGS else [])
+
+
+def definitions(module):
+    '''Functions in a module, with their qualified names.
+
+    Only statement lists are searched, since only they can hold
+    definitions.
+
+    :rtype: Iterator[(String, ast.FunctionDef)]
+    '''
+    def walk(stmts, prefix):
+        for stmt in stmts:
+            if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+                name = prefix + stmt.name
+                if isinstance(stmt, ast.FunctionDef):
+                    yield name, stmt
+                for found in walk(stmt.body, name + '.'):
+                    yield found
+                continue
+            for field in ('body', 'orelse', 'finalbody'):
+                for found in walk(getattr(stmt, field, []), prefix):
+                    yield found
+            for handler in getattr(stmt, 'handlers', []):
+                for found in walk(handler.body, prefix):
+                    yield found
+    return walk(module.body, '')
+
+
+def describe(value,
+             depth=2, sample=3):
+    '''Scala type of a python value, as far as it shows.
+
+    Elements of containers are sampled; `?` stands for elements of
+    empty containers.
+
+      >>> describe(1), describe(2 ** 40), describe('s'), describe(None)
+      ('Int', 'Long', 'String', 'None')
+      >>> describe([1, 2]), describe({'a': (1, 2.0)}), describe([])
+      ('Seq[Int]', 'Dict[String, (Int, Double)]', 'Seq[?]')
+    '''
+    t = type(value)
+    if t is bool:
+        return 'Boolean'
+    if t in (int, long):
+        return ('Int' if -2 ** 31 <= value < 2 ** 31 else
+                'Long' if -2 ** 63 <= value < 2 ** 63 else 'BigInt')
+    if t is float:
+        return 'Double'
+    if t in (str, unicode):
+        return 'String'
+    if value is None:
+        return 'None'
+    if t is file:
+        return 'File'
+    if depth == 0:
+        return 'Any'
+
+    def elements(items):
+        types = unify([describe(item, depth - 1)
+                       for item in islice(items, sample)])
+        return ('?' if not types else
+                types[0] if len(types) == 1 else 'Any')
+
+    if t is list:
+        return 'Seq[%s]' % elements(value)
+    if t in (set, frozenset):
+        return 'Set[%s]' % elements(value)
+    if t is dict:
+        return 'Dict[%s, %s]' % (elements(value.iterkeys()),
+                                 elements(value.itervalues()))
+    if t is tuple:
+        if not 1 < len(value) <= 22:
+            return 'Any'
+        return '(%s)' % ', '.join(describe(item, depth - 1)
+                                  for item in value)
+    cls = getattr(value, '__class__', t)
+    if (getattr(__builtin__, cls.__name__, None) is cls or
+            cls in INTERPRETER_TYPES):
+        return 'Any'
+    return cls.__name__
+
+
+def unify(types):
+    '''Merge types that differ only in unknown elements, or in the
+    width of integers.
+
+      >>> unify(['Seq[?]', 'Seq[Int]', 'Int', 'Long'])
+      ['Long', 'Seq[Int]']
+      >>> unify(['Dict[?, ?]'])
+      ['Dict[Any, Any]']
+    '''
+    merged = []
+    for t in sorted(set(types), key=lambda t: (t.count('?'), t)):
+        if not [u for u in merged if specializes(u, t)]:
+            merged.append(t)
+    widths = ['Int', 'Long', 'BigInt']
+    ints = [t for t in merged if t in widths]
+    if len(ints) > 1:
+        merged = [t for t in merged if t not in widths] + [
+            max(ints, key=widths.index)]
+    return sorted(t.replace('?', 'Any') for t in merged)
+
+
+def specializes(specific, general):
+    pattern = re.escape(general).replace(re.escape('?'), '.+')
+    return re.match('^%s$' % pattern, specific) is not None
+
+
+def polymorphic(filename, types):
+    '''Describe the observations with more than one type.
+    '''
+    for (name, seen) in sorted(types.items()):
+        for (arg, arg_types) in sorted(seen['args'].items()):
+            if len(arg_types) > 1:
+                yield '%s: %s(%s): %s' % (filename, name, arg,
+                                          ' | '.join(arg_types))
+        if len(seen['returns']) > 1:
+            yield '%s: %s returns %s' % (filename, name,
+                                         ' | '.join(seen['returns']))
+
+
+def save(types, out):
+    json.dump(types, out, indent=1, sort_keys=True)
+    out.write('\n')
+
+
+class ObservedTypes(object):
+    r'''Types observed at run time, for the definitions in a module.
+
+    Definitions are found by position, so rewritten or copied trees
+    of the module find them too.
+
+      >>> module = ast.parse('def f(x, y=1):\n    return x\n')
+      >>> obs = ObservedTypes({'f': dict(args={'x': ['Int', 'String']},
+      ...                               returns=['None'])}, module)
+      >>> obs.arg_types(module.body[0], ['x', 'y'])
+      ([], [('x', ['Int', 'String'])])
+      >>> obs.return_type(module.body[0])
+      ('Unit', None)
+    '''
+    def __init__(self, types, module):
+        self.digest = hashlib.md5(json.dumps(types, sort_keys=True)
+                                  ).hexdigest()
+        self._by_node = dict((position(node), types[name])
+                             for (name, node) in definitions(module)
+                             if name in types)
+
+    def arg_types(self, node, names):
+        '''Observed types of parameters.
+
+        :return: (name, type) pairs for those observed with one type,
+                 and (name, types) for those observed with several
+        '''
+        seen = self._by_node.get(position(node), {}).get('args', {})
+        found = [(name, seen.get(name, [])) for name in names]
+        return ([(name, types[0]) for (name, types) in found
+                 if len(types) == 1 and types[0] != 'None'],
+                [(name, types) for (name, types) in found
+                 if len(types) > 1])
+
+    def return_type(self, node):
+        '''Observed return type.
+
+        :return: (type or None, types if several were observed)
+        '''
+        types = self._by_node.get(position(node), {}).get('returns', [])
+        if len(types) > 1:
+            return None, types
+        return ({'None': 'Unit'}.get(types[0], types[0]) if types
+                else None), None
+
+
+def position(node):
+    return node.lineno, node.col_offset, node.name
+
+
+if __name__ == '__main__':
+    def _with_caps(main):
+        from os.path import abspath
+        from sys import argv, stdout, setprofile
+        import unittest
+
+        def run_tests(names):
+            suite = unittest.TestLoader().loadTestsFromNames(names)
+            unittest.TextTestRunner().run(suite)
+
+        return main(argv=argv[:],
+                    open=open,
+                    stdout=stdout,
+                    setprofile=setprofile,
+                    run_tests=run_tests,
+                    abspath=abspath)
+
+    _with_caps(main)
@@ -17,12 +17,20 @@ from contextlib import contextmanager
 from os.path import splitext, basename
 import StringIO
 import ast
+import copy
+import json
 import logging
 import re
 import tokenize
 from ast import copy_location as loc
 
 from fp import option_iter, option_fold, partition
+from observe import ObservedTypes
+from scala_ir import Builder, Printer
+from srcmap import SourceMap
+import passes
+import ranges
+import splice
 
 log = logging.getLogger(__name__)
 
@@ -33,29 +41,158 @@ def main(argv, open, stdout, find_package,
     [pkg, infn] = (argv[2:4] if ['--package'] == argv[1:2]
                    else (None, argv[1]))
     api = '--api' in argv
+    observed = (json.load(open(argv[argv.index('--types') + 1]))
+                if '--types' in argv else None)
     convert(infn, open(infn).read(), stdout, find_package,
             pkg=None,
-            api=api)
+            api=api,
+            pass_names=pass_options(argv),
+            observed=observed)
+
+
+def pass_options(argv):
+    '''Select rewrite passes with `--pass NAME` and `--no-pass NAME`.
+
+    >>> pass_options(['p2s', 'm.py', '--no-pass', 'fold'])
+    ['inert', 'fp-idioms', 'fuse']
+    '''
+    def values(opt):
+        return [argv[ix + 1] for (ix, arg) in enumerate(argv[:-1])
+                if arg == opt]
+    return passes.selected(values('--pass'), values('--no-pass'))
 
 
 def convert(infn, src, out, find_package,
             pkg=None,
-            api=False):
-    modname = splitext(basename(infn))[0]
+            api=False,
+            sigs=None,
+            modname=None,
+            package_object=False,
+            source_map=None,
+            pass_names=None,
+            pass_stats=None,
+            chunks=None,
+            previous=None,
+            mk_pool=None,
+            observed=None,
+            interactive=True):
+    '''Convert python module source to scala.
+
+    :param sigs: signatures of other modules in the project;
+                 see sigindex.SigIndex
+    :param modname: by default, taken from infn
+    :param package_object: convert a package's __init__ module
+    :param source_map: a srcmap.SourceMap to record scala lines in
+    :param pass_names: rewrite passes to run; by default,
+                       `passes.selected()`
+    :param pass_stats: see `passes.run`
+    :param chunks: dict to fill with a record of top-level definitions
+                   and their output; see splice
+    :param previous: (scala text, chunks record) of an earlier
+                     conversion, whose unchanged definitions are
+                     copied rather than converted again
+    :param mk_pool: makes a `multiprocessing.Pool`, given `initializer`
+                    and `initargs`, with which to convert the top-level
+                    definitions of a large module in parallel; the
+                    output is the same as without
+    :param observed: types observed at run time, for definitions
+                     whose docstrings give none; see observe
+    :param interactive: stop in the debugger at a limitation or an
+                        unhandled node; otherwise, just raise
+                        NotImplementedError
+    :return: diagnostics: (line number, message) pairs
+    '''
+    with debugging(interactive):
+        return _convert(infn, src, out, find_package, pkg, api, sigs,
+                        modname, package_object, source_map, pass_names,
+                        pass_stats, chunks, previous, mk_pool, observed)
+
+
+def _convert(infn, src, out, find_package, pkg, api, sigs, modname,
+             package_object, source_map, pass_names, pass_stats, chunks,
+             previous, mk_pool, observed):
+    modname = modname or splitext(basename(infn))[0]
+    pass_names = passes.selected() if pass_names is None else pass_names
+    incremental = not (chunks is None and previous is None and
+                       mk_pool is None)
     t = ast.parse(src, infn)
-    tl = PyToScala.tokens_per_line(src)
+    if api:
+        t = APIFilter.api_only(t)
+    if api and not incremental:
+        tl = PyToScala.tokens_for_lines(
+            src, [n.lineno for n in ast.walk(t) if isinstance(n, ast.stmt)])
+    else:
+        tl = list(PyToScala.tokens_per_line(src))
+    sp = (splice.Splice(src, t.body, (tok for (_, toks) in tl for tok in toks),
+                        previous, options=pass_names)
+          if incremental else None)
     p2s = PyToScala(modname, out, tl,
                     find_package=lambda n, lvl=0: find_package(infn, n, lvl),
-                    pkg=pkg, api=api)
+                    pkg=pkg, api=api, sigs=sigs,
+                    package_object=package_object,
+                    source_map=source_map, splice=sp, mk_pool=mk_pool,
+                    observed=option_fold(observed,
+                                         lambda types: ObservedTypes(types, t),
+                                         None))
+    skip = (p2s.plan(t, pass_names) if incremental else
+            APIFilter.definitions(t) if api else ())
+    t = passes.run(t, pass_names, pass_stats, skip=skip)
     p2s.visit(t)
+    p2s.flush()
+    if chunks is not None:
+        chunks.update(sp.record)
+    return p2s.diagnostics
+
+
+def convert_chunk(job):
+    '''Convert one top-level definition, as in a worker process; see
+    `Incremental.convert_parallel`.
+
+    Rewrite passes run here, after the import statements that
+    precede the definition.
+
+    :return: scala text and a chunk record, as from splice.Splice
+    '''
+    ((stmt, prior, pass_names), state, token_lines, first, last, depth,
+     (modname, pkg, api, package_object, observed)) = job
+    stmt = passes.run(ast.Module(body=prior + [stmt]), pass_names).body[-1]
+    out = StringIO.StringIO()
+    conv = PyToScala(modname, out, token_lines, find_package=None,
+                     pkg=pkg, api=api, package_object=package_object,
+                     observed=observed)
+    conv._printer = Printer(out, token_lines, depth=depth)
+    conv._printer.marks = SourceMap(None)
+    conv.restore_state(state)
+    conv.visit(stmt)
+    conv._out.comments(last)
+    conv.flush()
+    return out.getvalue(), dict(
+        marks=[(scala_line - 1, py_line - first, col)
+               for (scala_line, py_line, col)
+               in conv._printer.marks.entries()],
+        diagnostics=[(lineno - first, msg)
+                     for (lineno, msg) in conv.diagnostics])
+
+
+_chunk_jobs = []
+
+
+def share_chunk_jobs(jobs):
+    '''Pool initializer: keep jobs in this (worker) process.
+    '''
+    _chunk_jobs[:] = jobs
+
+
+def convert_shared_chunk(ix):
+    return convert_chunk(_chunk_jobs[ix])
 
 
 class LineSyntax(object):
-    def __init__(self, out, token_lines):
-        self._out = out
-        self._lines = list(token_lines)
-        self._col = 0
-        self._line_ix = 0
+    '''Build scala layout (see scala_ir) and print it to out.
+    '''
+    def __init__(self, out, token_lines, source_map=None):
+        self._printer = Printer(out, token_lines, source_map)
+        self._out = Builder()
 
     @classmethod
     def tokens_per_line(cls, src):
@@ -76,32 +213,46 @@ class LineSyntax(object):
         if line:
             yield (row, line)
 
+    @classmethod
+    def tokens_for_lines(cls, src, linenos):
+        '''Tokenize only the given lines, each on its own.
+
+        Tokens of a line that continues onto the next are cut short.
+        Lines without a `#` cannot hold a comment, so they are not
+        tokenized at all.
+
+        :rtype: Iterator[(Int, Seq[Token])]
+        '''
+        lines = src.splitlines(True)
+        for row in sorted(set(linenos)):
+            line = []
+            if '#' not in lines[row - 1]:
+                yield (row, line)
+                continue
+            try:
+                for tok in tokenize.generate_tokens(
+                        iter([lines[row - 1]]).next):
+                    line.append(tok)
+            except tokenize.TokenError:
+                pass
+            yield (row, line)
+
     def _sync(self, node):
-        wr = self._out.write
         if isinstance(node, ast.expr) or isinstance(node, ast.stmt):
-            while node.lineno >= self._lines[self._line_ix][0]:
-                for tok in self._lines[self._line_ix][1]:
-                    if tok[0] == tokenize.COMMENT:
-                        wr('//' + tok[1][1:])
-                        self.newline()
-                self._line_ix += 1
-        return wr
+            self._out.sync(node.lineno, node.col_offset)
+        return self._out.write
 
-    @contextmanager
     def _block(self):
-        wr = self._out.write
-        self._col += 2
-        wr('{\n')
-        wr(' ' * self._col)
-        yield
-        self._col -= 2
-        wr('}\n')
-        wr(' ' * self._col)
+        return self._out.block()
+
+    def _paren(self, needed=True):
+        return self._out.paren(needed)
 
     def newline(self):
-        wr = self._out.write
-        wr('\n')
-        wr(' ' * self._col)
+        self._out.newline()
+
+    def flush(self):
+        self._out.flush(self._printer)
 
 
 class ModuleAttributes(LineSyntax):
@@ -146,15 +297,137 @@ class APIFilter(object):
     '''Optionally filter out implementation details, leaving only the API.
 
     In API mode:
-       - Skip _xyz functions.
+       - Skip _xyz functions, classes and module-level bindings.
        - Leave body empty in the rest.
     '''
-    # TODO: investigate whether we can do this in a generic
-    # way in NodeVisitor.visit.
-    # Or consider using: for do_impl in self.filter_fundef():
     def __init__(self, api):
         self._api = api
 
+    @classmethod
+    def api_only(cls, module):
+        '''Strip implementation details from a module before visiting it.
+
+        Only imports, public bindings, definitions and their docstrings
+        remain::
+
+          >>> t = APIFilter.api_only(ast.parse(
+          ...     'import os\\n_x = 1\\nx = 2\\nprint x\\n'
+          ...     'def f():\\n  "doc"\\n  return 1\\n'))
+          >>> [stmt.__class__.__name__ for stmt in t.body]
+          ['Import', 'Assign', 'FunctionDef']
+          >>> t.body[-1].body[0].value.s
+          'doc'
+
+        Conditional definitions and imports remain, with their
+        suites filtered the same way::
+
+          >>> t = APIFilter.api_only(ast.parse(
+          ...     'try:\\n  import json\\n'
+          ...     'except ImportError:\\n  json = None\\n'
+          ...     'if x:\\n  def f(): return 1\\n  print x\\n'
+          ...     'if y:\\n  print y\\n'))
+          >>> [stmt.__class__.__name__ for stmt in t.body]
+          ['TryExcept', 'If']
+          >>> [stmt.__class__.__name__ for stmt in t.body[1].body]
+          ['FunctionDef']
+        '''
+        return loc(ast.Module(body=cls._api_suite(module.body, False)),
+                   module)
+
+    @staticmethod
+    def definitions(module):
+        '''Ids of the top-level definitions of a stripped module, which
+        rewrite passes can leave alone: only signatures and docstrings
+        remain of them.
+
+        :rtype: Set[Int]
+        '''
+        return set(id(stmt) for stmt in module.body
+                   if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)))
+
+    @classmethod
+    def _api_suite(cls, body, in_class):
+        doc = (body[:1] if body and tmatch(body[0],
+                                           ast.Expr(value=ast.Str(s=None)))
+               else [])
+        return doc + cls._api_stmts(body, in_class)
+
+    @classmethod
+    def _api_stmts(cls, body, in_class):
+        return [api_stmt
+                for stmt in body
+                for api_stmt in cls._api_stmt(stmt, in_class)]
+
+    @classmethod
+    def _api_branches(cls, stmt, in_class):
+        '''Keep a conditional statement such as `try: import json`
+        `except ImportError: ...`, with each of its suites filtered.
+
+        :return: the filtered statement or None if nothing remains.
+        '''
+        def suite(body):
+            return cls._api_stmts(body, in_class)
+
+        def required(body):
+            return body or [loc(ast.Pass(), stmt)]
+
+        if isinstance(stmt, ast.If):
+            body, orelse = suite(stmt.body), suite(stmt.orelse)
+            return loc(ast.If(test=stmt.test, body=required(body),
+                              orelse=orelse),
+                       stmt) if body or orelse else None
+        if isinstance(stmt, ast.TryExcept):
+            body, orelse = suite(stmt.body), suite(stmt.orelse)
+            handled = [(h, suite(h.body)) for h in stmt.handlers]
+            if not (body or orelse or [h_body for (_, h_body) in handled]):
+                return None
+            handlers = [loc(ast.ExceptHandler(type=h.type, name=h.name,
+                                              body=required(h_body)), h)
+                        for (h, h_body) in handled]
+            return loc(ast.TryExcept(body=required(body), handlers=handlers,
+                                     orelse=orelse), stmt)
+        body, final = suite(stmt.body), suite(stmt.finalbody)
+        return loc(ast.TryFinally(body=required(body), finalbody=final),
+                   stmt) if body or final else None
+
+    @classmethod
+    def _api_stmt(cls, stmt, in_class):
+        if isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            return [] if in_class else [stmt]
+        if isinstance(stmt, ast.Assign):
+            names = [n for target in stmt.targets for n in ast.walk(target)
+                     if isinstance(n, ast.Name)]
+            public = not [n for n in names if n.id.startswith('_')]
+            return [stmt] if names and public else []
+        if isinstance(stmt, ast.ClassDef) and not stmt.name.startswith('_'):
+            return [loc(ast.ClassDef(name=stmt.name, bases=stmt.bases,
+                                     body=cls._api_suite(stmt.body, True),
+                                     decorator_list=stmt.decorator_list),
+                        stmt)]
+        if isinstance(stmt, ast.FunctionDef):
+            if in_class and stmt.name in ('__init__', '__new__'):
+                body = cls._api_suite(stmt.body, False)
+                fields = [s for s in stmt.body
+                          if isinstance(s, ast.Assign) and
+                          [1 for t in s.targets
+                           if tmatch(t, ast.Attribute(
+                               value=ast.Name(id='self', ctx=None),
+                               attr=None, ctx=None)) and
+                           not t.attr.startswith('_')]]
+                body = [s for s in body if not isinstance(s, ast.Assign)]
+            elif stmt.name.startswith('_'):
+                return []
+            else:
+                body, fields = cls._api_suite(stmt.body[:1], False), []
+                body = [s for s in body if isinstance(s, ast.Expr)]
+            return [loc(ast.FunctionDef(name=stmt.name, args=stmt.args,
+                                        body=body + fields,
+                                        decorator_list=stmt.decorator_list),
+                        stmt)]
+        if isinstance(stmt, (ast.If, ast.TryExcept, ast.TryFinally)):
+            return list(option_iter(cls._api_branches(stmt, in_class)))
+        return []
+
     def check_fun_name(self, name):
         if self._api and name.startswith('_'):
             raise ImplementationDetail
@@ -165,8 +438,17 @@ class APIFilter(object):
 
 
 class TypeDecls(object):
-    def __init__(self):
+    call_types = {'open': 'File', 'file': 'File', 'len': 'Int',
+                  'logging.getLogger': 'logging.Logger'}
+
+    def __init__(self, observed=None):
         self._def_stack = []
+        self._scope_types = [{}]
+        self._scope_vars = [set()]
+        self._int_ranges = []
+        self._int_demands = []
+        self._widening = None
+        self._observed = observed
 
     @classmethod
     def parse_types(cls, txt):
@@ -209,18 +491,51 @@ class TypeDecls(object):
                 rtypes[0] if rtypes else None,
                 '[' + foralls[0] + ']' if foralls else '')
 
-    def fun_sig(self, node):
+    def fun_sig(self, node, tailrec=False):
         wr, body, doc = self._doc(node)
 
         arg_types, rtype, foralls = option_fold(doc,
                                                 self.parse_types,
                                                 (None, None, ''))
+        arg_types, rtype = self.observed_types(
+            node, arg_types, rtype, self._def_stack[-1:] == ['ClassDef'])
 
+        if tailrec:
+            wr('@annotation.tailrec')
+            self.newline()
         wr('def %s%s(' % (node.name, foralls))
         self.visit_arguments(node.args, types=arg_types)
         rtypedecl = ': ' + rtype if rtype else ''
         wr(')%s = ' % rtypedecl)
-        return rtype, body
+        return rtype, body, arg_types or []
+
+    def observed_types(self, node, arg_types, rtype, method):
+        '''Add types observed at run time (see observe) for parameters
+        and result that the docstring leaves out.
+
+        Observations of several types are noted as diagnostics and
+        not used.
+
+        :param method: whether to skip the first parameter
+        :return: arg_types, rtype
+        '''
+        if self._observed is None:
+            return arg_types, rtype
+        declared = dict(arg_types or [])
+        args = node.args.args[1:] if method else node.args.args
+        names = [arg.id for arg in args
+                 if isinstance(arg, ast.Name) and arg.id not in declared] + [
+            name for name in option_iter(node.args.vararg)
+            if name not in declared]
+        found, several = self._observed.arg_types(node, names)
+        if rtype is None:
+            rtype, rtypes = self._observed.return_type(node)
+            several = several + [('result', types)
+                                 for types in option_iter(rtypes)]
+        for name, types in several:
+            self.diagnostic(node, 'observed %s of %s as %s', name,
+                            node.name, ' | '.join(types))
+        return (arg_types or []) + found or None, rtype
 
     def add_arg_type(self, wr, expr, default, types):
         arg_type = self._arg_type(expr, default, types)
@@ -228,16 +543,17 @@ class TypeDecls(object):
             wr(': ' + arg_type)
 
     def _arg_type(self, arg, default, types):
-        '''
-        .. note: TODO: log a warning when falling back to Any
-        '''
         fallback = None if self._def_stack[-1:] == ['lambda'] else 'Any'
-        return ((types.get(arg.id) if isinstance(arg, ast.Name) else
-                 types.get(arg) if isinstance(arg, type('')) else None)
-                or
-                (self._literal_type(default) if default else None)
-                or
-                fallback)
+        found = ((types.get(arg.id) if isinstance(arg, ast.Name) else
+                  types.get(arg) if isinstance(arg, type('')) else None)
+                 or
+                 (self._literal_type(default) or self.expr_type(default)
+                  if default else None))
+        if not found and fallback:
+            self.diagnostic(arg, 'no type for %s; using %s',
+                            arg.id if isinstance(arg, ast.Name) else arg,
+                            fallback)
+        return found or fallback
 
     def _literal_type(self, expr):
         types1 = [t for (pat, t)
@@ -246,16 +562,18 @@ class TypeDecls(object):
                      (ast.Name(id='True', ctx=None), 'Boolean'),
                      (ast.Name(id='False', ctx=None), 'Boolean')]
                  if tmatch(expr, pat)]
-        types2 = [('Double' if isinstance(expr.n, type(1.0)) else 'Int')
+        types2 = [('Double' if isinstance(expr.n, type(1.0)) else
+                   ranges.width((expr.n, expr.n)))
                   if t == 'Num' else t
                   for t in types1]
         return types2[0] if types2 else None
 
-    def fun_body(self, body, rtype):
+    def fun_body(self, body, rtype, arg_types=()):
         try:
             self.filter_funbody()
         except ImplementationDetail:
-            pass
+            self._out.write('TODO')
+            self.newline()
         else:
             suite1, ret = self.split_ret(body)
             suite = (suite1 + [loc(ast.Expr(ret.value), ret)]
@@ -263,9 +581,229 @@ class TypeDecls(object):
                      else body)
 
             self._def_stack.append('FunctionDef')
+            self._scope_types.append(dict(arg_types))
+            self._scope_vars.append(set())
+            self._int_ranges.append(self.analyze_ranges(suite, arg_types))
+            self._int_demands.append(self.int_demands(suite))
             self._suite(suite)
+            self._int_demands.pop()
+            self._int_ranges.pop()
+            self._scope_vars.pop()
+            self._scope_types.pop()
             self._def_stack.pop()
 
+    int_bounds = {'Int': ranges.INT, 'Long': ranges.LONG}
+
+    def analyze_ranges(self, suite, arg_types):
+        '''Find bounds of the integers in a function body (see ranges),
+        given those of its parameters and of enclosing functions.
+        '''
+        known = dict(self._int_ranges[-1]) if self._int_ranges else {}
+        known.update((name, self.int_bounds.get(t, ranges.TOP))
+                     for (name, t) in arg_types)
+        known.update(ranges.analyze(suite, known))
+        return known
+
+    def bounded(self, name):
+        return bool(self._int_ranges and name in self._int_ranges[-1] and
+                    ranges.width(self._int_ranges[-1][name]))
+
+    def expr_range(self, expr):
+        return ranges.interval(
+            expr, self._int_ranges[-1] if self._int_ranges else {})
+
+    int_widths = ['Int', 'Long', 'BigInt']
+
+    def int_demands(self, suite):
+        '''Widest type of the widened arithmetic (see
+        `NumericOps.widened_op`) in the values assigned to each name,
+        such as `i * 3000000` in `total = total + i * 3000000`, even
+        where the name itself is unbounded.
+        '''
+        demands = {}
+        for node in own_nodes(suite):
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                    isinstance(node.targets[0], ast.Name)):
+                name, value = node.targets[0].id, node.value
+            elif (isinstance(node, ast.AugAssign) and
+                  isinstance(node.target, ast.Name)):
+                name, value = node.target.id, node.value
+            else:
+                continue
+            for part in ast.walk(value):
+                if isinstance(part, ast.BinOp):
+                    wide = self.widened_op(part)
+                    if wide and (self.int_widths.index(wide) >
+                                 self.int_widths.index(
+                                     demands.get(name, 'Int'))):
+                        demands[name] = wide
+        return demands
+
+    def int_width(self, name, t):
+        '''Type to declare for name, where its values need a wider
+        integer type than t, the type of its first value.
+        '''
+        widths = self.int_widths
+        if t not in widths or not self._int_ranges:
+            return None
+        found = [wide
+                 for wide in (ranges.width(self._int_ranges[-1].get(name)),
+                              self._int_demands[-1].get(name))
+                 if wide]
+        wide = max(found, key=widths.index) if found else None
+        return (wide if wide and widths.index(wide) > widths.index(t)
+                else None)
+
+    def declare_type(self, name, t):
+        if t:
+            self._scope_types[-1][name] = t
+
+    def declare_targets(self, target, t):
+        '''Declare the names a for loop or comprehension binds, taking
+        tuples of names apart.
+        '''
+        if isinstance(target, ast.Name):
+            self.declare_type(target.id, t)
+        elif isinstance(target, ast.Tuple) and t:
+            parts = tuple_types(t)
+            if len(parts) == len(target.elts):
+                for elt, part in zip(target.elts, parts):
+                    self.declare_targets(elt, part)
+
+    def element_type(self, expr):
+        '''Type of the items of an iterable, where it's evident.
+        '''
+        if tmatch(expr, ast.Call(func=ast.Name(id=None, ctx=None),
+                                 args=None, keywords=[], starargs=None,
+                                 kwargs=None)) and (
+                                     expr.func.id in ('range', 'xrange')):
+            return 'Int'
+        if (tmatch(expr, ast.Call(func=ast.Name(id=None, ctx=None),
+                                  args=None, keywords=[], starargs=None,
+                                  kwargs=None)) and
+                expr.func.id in ('enumerate', 'zip') and expr.args):
+            types = (['Int', self.element_type(expr.args[0])]
+                     if expr.func.id == 'enumerate' else
+                     [self.element_type(arg) for arg in expr.args])
+            return (None if None in types else
+                    '(%s)' % ', '.join(types))
+        m = re.match(r'(?:Seq|List|Vector|Set|Iterable|Iterator)\[(.*)\]$',
+                     self.expr_type(expr) or '')
+        return m.group(1) if m else None
+
+    def expr_type(self, expr):
+        '''Find the scala type of an expression, where it's evident.
+
+        Declared types of names in scope, `typed()` ascriptions,
+        literals, calls to well-known functions and constructor calls::
+
+          >>> TypeDecls().expr_type(ast.parse('open("f")').body[0].value)
+          'File'
+
+        :rtype: Option[String]
+        '''
+        if isinstance(expr, ast.Name):
+            for scope in reversed(self._scope_types):
+                if expr.id in scope:
+                    return scope[expr.id]
+            for bounds in self._int_ranges[-1:]:
+                if expr.id in bounds:
+                    return ranges.width(bounds[expr.id])
+        elif isinstance(expr, ast.Call):
+            if (tmatch(expr, ast.Call(func=ast.Name(id='typed', ctx=None),
+                                      args=[None, ast.Str(s=None)],
+                                      keywords=[], starargs=None,
+                                      kwargs=None))):
+                return expr.args[1].s
+            if isinstance(expr.func, ast.Name):
+                if expr.func.id in self.call_types:
+                    return self.call_types[expr.func.id]
+                if expr.func.id in ('min', 'max', 'abs') and expr.args:
+                    return self.numeric_join(*map(self.expr_type, expr.args))
+            elif dotted_name(expr.func) in self.call_types:
+                return self.call_types[dotted_name(expr.func)]
+            for kind, sig in option_iter(self.imported_sig(expr.func)):
+                return (sig['rtype'] if kind == 'function'
+                        else dotted_name(expr.func))
+            if class_ref_name(expr.func):
+                return dotted_name(expr.func)
+        elif isinstance(expr, (ast.Num, ast.Str)):
+            return self._literal_type(expr)
+        elif isinstance(expr, ast.BinOp):
+            return self._binop_type(expr)
+        elif isinstance(expr, ast.UnaryOp):
+            return ('Boolean' if isinstance(expr.op, ast.Not)
+                    else self.numeric_join(self.expr_type(expr.operand)))
+        return None
+
+    numeric_types = ['Int', 'Long', 'Double']
+
+    @classmethod
+    def numeric_join(cls, *types):
+        '''Type of arithmetic on operands of the given types.
+
+          >>> TypeDecls.numeric_join('Int', 'Long')
+          'Long'
+          >>> TypeDecls.numeric_join('Int', 'String') is None
+          True
+        '''
+        if [t for t in types if t not in cls.numeric_types]:
+            return None
+        return max(types, key=cls.numeric_types.index)
+
+    def _binop_type(self, expr):
+        if is_int_constant(expr):
+            return ranges.width(self.expr_range(expr))
+        left, right = self.expr_type(expr.left), self.expr_type(expr.right)
+        widened = self.widened_op(expr)
+        if widened:
+            return widened
+        if isinstance(expr.op, ast.Pow):
+            return (left if self.pow_unrolled(expr)
+                    else 'BigInt' if self.int_power(expr)
+                    else 'Double' if self.numeric_join(left, right)
+                    else None)
+        if isinstance(expr.op, ast.Add) and left == right == 'String':
+            return 'String'
+        if isinstance(expr.op, ast.Mod) and isinstance(expr.left, ast.Str):
+            return 'String'
+        return self.numeric_join(left, right)
+
+    def int_width_of(self, expr, t):
+        '''Wider integer type that the values of expr need, if the
+        analysis bounds them.
+        '''
+        wide = ranges.width(self.expr_range(expr))
+        return (wide if wide and not ranges.within(self.expr_range(expr),
+                                                   self.int_bounds[t])
+                else None)
+
+    #: Largest constant exponent to convert as repeated multiplication.
+    pow_unroll_max = 4
+
+    def pow_unrolled(self, expr):
+        '''How many times to repeat the base of `x ** n`, if n is a
+        small constant and x a typed number.
+
+        :rtype: Option[Int]
+        '''
+        n = expr.right.n if isinstance(expr.right, ast.Num) else None
+        if (type(n) in (int, long) and 1 <= n <= self.pow_unroll_max and
+                self.numeric_join(self.expr_type(expr.left))):
+            return n
+        return None
+
+    def int_power(self, expr):
+        '''Is `x ** n` a power of integers, with n not known to be
+        negative? Python gives an int of any size for those.
+        '''
+        return (self.expr_type(expr.left) in self.int_bounds and
+                self.expr_type(expr.right) in self.int_bounds and
+                not (isinstance(expr.right, ast.Num) and expr.right.n < 0))
+
+    def imported_sig(self, func):
+        return None
+
     def split_ret(self, body):
         return ((body[:-1], body[-1]) if (len(body) > 0 and
                                           isinstance(body[-1], ast.Return) and
@@ -279,13 +817,13 @@ class TypeDecls(object):
             wr('new { def apply(')
             self.visit_arguments(node.args)
             wr(') = ')
+            self.visit(node.body)
+            wr(' }')
         else:
             wr('(')
             self.visit_arguments(node.args)
-            wr(') => { ')
-
-        self.visit(node.body)
-        wr(' }')
+            wr(') => ')
+            self.visit(node.body)
         self._def_stack.pop()
 
     def typed_expr(self, wr, node_opt,
@@ -332,6 +870,8 @@ class ClassStructure(TypeDecls):
 
     def class_body(self, wr, ctors, body,
                    this='self'):
+        self._scope_types.append({})
+        self._scope_vars.append(set())
         with self._block():
             wr('%s =>' % this)
             self.newline()
@@ -344,6 +884,8 @@ class ClassStructure(TypeDecls):
             for stmt in body:
                 self.visit(stmt)
 
+        self._scope_vars.pop()
+        self._scope_types.pop()
         self._def_stack.pop()
 
     def _find_constructors(self, suite, class_doc):
@@ -364,7 +906,47 @@ class ClassStructure(TypeDecls):
                         + [s for fd in ctors
                            for s in option_iter(ast.get_docstring(fd))])
         arg_types, _, foralls = self.parse_types(doc)
-        return ctors, other, arg_types, foralls
+        for fd in ctors:
+            arg_types, _ = self.observed_types(fd, arg_types, 'Unit', True)
+        return ctors, other, arg_types or [], foralls
+
+    def assign_name(self, wr, name, decl='val ', t=None, value=None):
+        '''Write name as an assignment target, declaring it on first
+        assignment: with its type, if it needs a wider integer type
+        than t, that of the value assigned, in which case the
+        arithmetic of the value is widened too.
+        '''
+        if name in self._scope_vars[-1]:
+            wr(fix_kw(name))
+            return
+        wide = self.int_width(name, t)
+        wr(decl + fix_kw(name) + (': ' + wide if wide else ''))
+        self.declare_type(name, wide or t)
+        if wide:
+            self._widening = value
+
+    def parallel_assign(self, wr, names, values, decl=None):
+        '''a, b = x, y: assign each in turn, after evaluating into
+        temporaries any values that mention the targets.
+
+        :param decl: declare each name this way, rather than
+                     by `assign_name`
+        '''
+        if [1 for value in values for name in names
+            if mentions(value, name.id)]:
+            temps = [self._fresh('t') for _ in values]
+            for temp, value in zip(temps, values):
+                wr('val %s = ' % temp)
+                self.visit(value)
+                self.newline()
+            values = [loc(ast.Name(id=temp, ctx=ast.Load()), value)
+                      for (temp, value) in zip(temps, values)]
+        for name, value in zip(names, values):
+            self.assign_name(wr, name.id, decl or 'val ',
+                             self.expr_type(value), value)
+            wr(' = ')
+            self.visit(value)
+            self.newline()
 
     def assign_field(self, targets):
         '''Translate self.x = ... to var x = ... .
@@ -379,8 +961,91 @@ class ClassStructure(TypeDecls):
             return []
 
 
+class ProjectSigs(object):
+    '''Consult signatures of other modules in the project.
+
+    see sigindex.SigIndex
+    '''
+    def __init__(self, sigs):
+        self._sigs = sigs
+        self._imported = {}
+        self._imported_modules = {}
+
+    def import_module_sigs(self, node):
+        for sigs in option_iter(self._sigs):
+            for alias in node.names:
+                for entry in option_iter(sigs.get(alias.name)):
+                    self._imported_modules[alias.asname or alias.name] = entry
+
+    def import_from_sigs(self, node):
+        for sigs in option_iter(self._sigs):
+            for entry in option_iter(sigs.get(node.module)):
+                for alias in node.names:
+                    for found in self._module_sig(entry, alias.name):
+                        self._imported[alias.asname or alias.name] = found
+
+    def import_sigs(self, nodes):
+        '''Note signatures imported by import statements, as converting
+        them would.
+        '''
+        for node in nodes:
+            if isinstance(node, ast.Import):
+                self.import_module_sigs(node)
+            elif isinstance(node, ast.ImportFrom):
+                for node in self.skip_special_imports(node):
+                    self.import_from_sigs(node)
+
+    def imported_digests(self, nodes):
+        '''Signature digests of the project modules that import
+        statements import.
+        '''
+        names = set()
+        for node in nodes:
+            if isinstance(node, ast.Import):
+                names.update(alias.name for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                names.add(node.module)
+        return [(name, entry['sig_digest'])
+                for sigs in option_iter(self._sigs)
+                for name in sorted(names)
+                for entry in option_iter(sigs.get(name))]
+
+    def imported_sig(self, func):
+        '''Find the signature of an imported function or class.
+
+        :return: ('function' | 'class', signature) or None
+        '''
+        if isinstance(func, ast.Name):
+            return self._imported.get(func.id)
+        if isinstance(func, ast.Attribute) and isinstance(func.value,
+                                                          ast.Name):
+            for entry in option_iter(
+                    self._imported_modules.get(func.value.id)):
+                for found in self._module_sig(entry, func.attr):
+                    return found
+        return None
+
+    def _module_sig(self, entry, name):
+        return ([('function', entry['functions'][name])]
+                if name in entry['functions'] else
+                [('class', entry['classes'][name])]
+                if name in entry['classes'] else [])
+
+
 class Assignment(object):
+    '''Assignment to names, fields and tuples.
+
+    `var, x = None, 0` declares a var; later assignments to x in the
+    same function update it. Tuple assignment from a literal tuple or
+    a call assigns each name in turn, without building and matching
+    a tuple; a swap goes through temporaries.
+    '''
     def assign_targets(self, wr, node):
+        '''Write the targets of an assignment.
+
+        :return: the value to assign, or None if the assignment
+                 has been written in full
+        '''
         targets = node.targets
         field1 = self.assign_field(targets)
         if field1:
@@ -402,10 +1067,33 @@ class Assignment(object):
             tmatch(names[0],
                    ast.Name(id='var', ctx=ast.Store()))):
             limitation(isinstance(node.value, ast.Tuple))
-            limitation(len(node.value.elts) > 1)
-            wr('var ')
-            self._items(wr, names[1:], parens=len(names) > 2)
-            return loc(ast.Tuple(elts=node.value.elts[1:]), node.value)
+            limitation(len(node.value.elts) == len(names))
+            self.parallel_assign(wr, names[1:], node.value.elts[1:],
+                                 decl='var ')
+            for name in names[1:]:
+                self._scope_vars[-1].add(name.id)
+            return None
+
+        if len(names) == 1:
+            self.assign_name(wr, names[0].id, t=self.expr_type(node.value),
+                             value=node.value)
+            return node.value
+
+        if names and isinstance(node.value, ast.Tuple):
+            limitation(len(node.value.elts) == len(names))
+            self.parallel_assign(wr, names, node.value.elts)
+            return None
+
+        if names and isinstance(node.value, ast.Call):
+            tup = self._fresh('tup')
+            wr('val %s = ' % tup)
+            self.visit(node.value)
+            self.newline()
+            for ix, name in enumerate(names):
+                self.assign_name(wr, name.id)
+                wr(' = %s._%d' % (tup, ix + 1))
+                self.newline()
+            return None
 
         if (len(names) > 0):
             wr('val ')
@@ -416,6 +1104,1070 @@ class Assignment(object):
         return node.value
 
 
+class ContextManagers(object):
+    '''Lower `with` to try/finally when we know how to exit the context.
+
+    Files and the like are closed; module-level classes that define
+    `__exit__` get the python protocol: the target is what `__enter__`
+    returns, typed by its `:rtype:` or as the class if it returns
+    self, and an exception from the body is passed to `__exit__`,
+    which suppresses it by returning true (see `exit_suppresses` in
+    the runtime). Otherwise, fall back to `with_` from the runtime.
+    '''
+    closeable_types = ('File', 'StringIO', 'StringIO.StringIO',
+                       'addinfourl', 'urllib.addinfourl')
+
+    def __init__(self):
+        self._context_classes = {}
+        self._enter_types = {}
+
+    def scan_context_classes(self, body):
+        for stmt in body:
+            if isinstance(stmt, ast.ClassDef):
+                methods = dict((fd.name, fd) for fd in stmt.body
+                               if isinstance(fd, ast.FunctionDef))
+                for meth in [m for m in ['__exit__', 'close']
+                             if m in methods][:1]:
+                    self._context_classes[stmt.name] = meth
+                for enter in option_iter(methods.get('__enter__')):
+                    self._enter_types[stmt.name] = self._enter_type(
+                        stmt.name, enter)
+
+    @classmethod
+    def _enter_type(cls, class_name, enter):
+        _, rtype, _ = TypeDecls.parse_types(ast.get_docstring(enter) or '')
+        returns = [node.value for node in own_nodes(enter.body)
+                   if isinstance(node, ast.Return)]
+        return rtype or (class_name if returns and not [
+            value for value in returns
+            if not tmatch(value, ast.Name(id='self', ctx=None))] else None)
+
+    def context_exit(self, expr,
+                     closing_id='closing'):
+        '''Find the resource managed by a context expression and
+        the method that exits the context.
+
+        :return: (resource expr, exit method name or None)
+        '''
+        if tmatch(expr, ast.Call(func=ast.Name(id=closing_id, ctx=None),
+                                 args=[None], keywords=[], starargs=None,
+                                 kwargs=None)):
+            return expr.args[0], 'close'
+        t = self.expr_type(expr)
+        return expr, ('close' if t in self.closeable_types
+                      else self._context_classes.get(t))
+
+    def with_try(self, wr, node, resource, exit):
+        '''locally { val x = expr; try { ... } finally { x.close() } }
+
+        or, for `__exit__`, pass an exception from the body to it,
+        and exit with nulls if there was none. The block keeps the
+        target to the with statement, as `with_` does, so that two
+        with statements in a suite can use the same name; `locally`
+        keeps scala from taking a bare block as an argument to the
+        statement before it.
+        '''
+        wr('locally ')
+        with self._block():
+            self._with_try(node, resource, exit)
+
+    def _with_try(self, node, resource, exit):
+        wr = self._out.write
+        target = node.optional_vars
+        mgr = (fix_kw(target.id) if target and exit == 'close'
+               else self._fresh('_with'))
+        wr('val %s = ' % mgr)
+        self.visit(resource)
+        self.newline()
+        if exit == 'close':
+            if target:
+                self.declare_type(target.id, self.expr_type(resource))
+            wr('try ')
+            self._suite(node.body)
+            wr(' finally ')
+            with self._block():
+                wr('%s.close()' % mgr)
+                self.newline()
+            return
+
+        if target:
+            wr('val %s = %s.__enter__()' % (fix_kw(target.id), mgr))
+            self.newline()
+            self.declare_type(target.id, self._enter_types.get(
+                self.expr_type(resource)))
+        else:
+            wr('%s.__enter__()' % mgr)
+            self.newline()
+        raised, ex = mgr + '_raised', self._fresh('_ex')
+        wr('var %s = false' % raised)
+        self.newline()
+        wr('try ')
+        self._suite(node.body)
+        wr(' catch ')
+        with self._block():
+            wr('case %s: Exception => ' % ex)
+            with self._block():
+                wr('%s = true' % raised)
+                self.newline()
+                wr('if (!exit_suppresses(%s.__exit__(%s.getClass, %s, null))) '
+                   'throw %s' % (mgr, ex, ex, ex))
+                self.newline()
+        wr(' finally ')
+        with self._block():
+            wr('if (!%s) %s.__exit__(null, null, null)' % (raised, mgr))
+            self.newline()
+
+
+class StringFormat(object):
+    '''Specialize "fmt" % args when the format is a literal.
+
+    Conversions are resolved at conversion time to a sequence of
+    StringBuilder appends; other formats go to `%` in the runtime, as
+    do those with an operand not known to suit its conversion, such
+    as `%d` of a Double, which the `f` interpolator would reject.
+    '''
+    #: operand types that each numeric conversion takes as it is
+    conversion_types = dict(
+        [(conv, ('Int', 'Long')) for conv in 'diouxX'] +
+        [(conv, ('Double',)) for conv in 'eEfFgG'])
+
+    conversion = re.compile(
+        r'%([-#0 +]*)(\d*)(?:\.(\d+))?[hlL]?([diouxXeEfFgGcs%])')
+
+    @classmethod
+    def parse_format(cls, fmt):
+        '''Split a format into literal text and (spec, conversion) pairs.
+
+          >>> StringFormat.parse_format('%s: %5.2f%%')
+          [('%s', 's'), ': ', ('%5.2f', 'f'), '%']
+
+        Mapping keys, `*` widths and `%r` aren't handled here::
+
+          >>> StringFormat.parse_format('%(x)s') is None
+          True
+
+        :rtype: Option[Seq[String | (String, String)]]
+        '''
+        pieces = []
+        pos = 0
+        while pos < len(fmt):
+            pct = fmt.find('%', pos)
+            if pct < 0:
+                pieces.append(fmt[pos:])
+                break
+            if pct > pos:
+                pieces.append(fmt[pos:pct])
+            m = cls.conversion.match(fmt, pct)
+            if not m:
+                return None
+            flags, width, prec, conv = m.groups()
+            if conv == '%':
+                pieces.append('%')
+            else:
+                pieces.append(('%' + flags + width +
+                               ('.' + prec if prec else '') +
+                               ('d' if conv in 'iu' else conv), conv))
+            pos = m.end()
+
+        merged = []
+        for piece in pieces:
+            if (merged and not isinstance(piece, tuple) and
+                    not isinstance(merged[-1], tuple)):
+                merged[-1] += piece
+            else:
+                merged.append(piece)
+        return merged
+
+    def format_literal(self, wr, node_opt):
+        for node in node_opt:
+            pieces = (self.parse_format(node.left.s)
+                      if (isinstance(node.op, ast.Mod) and
+                          isinstance(node.left, ast.Str))
+                      else None)
+            if pieces is None:
+                continue
+            convs = [p for p in pieces if isinstance(p, tuple)]
+            args = (node.right.elts if isinstance(node.right, ast.Tuple)
+                    else [node.right] if len(convs) == 1
+                    else None)
+            if args is None or len(args) != len(convs) or [
+                    arg for (arg, (_, conv)) in zip(args, convs)
+                    if conv != 's' and self.expr_type(arg)
+                    not in self.conversion_types.get(conv, ())]:
+                continue
+
+            wr('new StringBuilder()')
+            args = iter(args)
+            for piece in pieces:
+                wr('.append(')
+                if isinstance(piece, tuple):
+                    self._format_arg(wr, piece, next(args))
+                else:
+                    wr(scala_str(piece))
+                wr(')')
+            wr('.toString')
+            return []
+        return node_opt
+
+    def _format_arg(self, wr, piece, arg):
+        spec, _ = piece
+        if spec in ('%s', '%d'):
+            self.visit(arg)
+        else:
+            wr('f"${')
+            self.visit(arg)
+            wr('}' + spec + '"')
+
+
+class Accumulators(object):
+    '''Use a StringBuilder for strings accumulated in a loop.
+
+    `s = ''` followed by a loop that only does `s += piece` becomes
+    `val s_sb = new StringBuilder("")`, with appends in the loop and
+    `val s = s_sb.toString` at the loop exit. Likewise for `parts = []`
+    with `parts.append(piece)` in a loop feeding `''.join(parts)`.
+
+    Builders belong to the function they're made in: a nested function
+    or class starts with none, and a loop whose nested definitions
+    mention the accumulator keeps it as it is.
+    '''
+    def __init__(self):
+        self._builders = {}
+
+    @contextmanager
+    def own_builders(self):
+        '''Convert a nested function or class with no builders in scope.
+        '''
+        outer, self._builders = self._builders, {}
+        try:
+            yield
+        finally:
+            self._builders = outer
+
+    def plan_accumulators(self, body):
+        '''Find accumulators in a suite.
+
+        :return: init statements and loops, by id, with their accumulators
+        '''
+        inits, loops = {}, {}
+        for ix, stmt in enumerate(body):
+            for acc in self._acc_init(stmt):
+                name, kind, _ = acc
+                rest = body[ix + 1:]
+                for jx, later in enumerate(rest):
+                    if not mentions(later, name):
+                        continue
+                    if (isinstance(later, (ast.For, ast.While)) and
+                        self._only_accumulates(later, name, kind) and
+                        (kind == 'str' or
+                         self._joined_once(rest[jx + 1:], name))):
+                        inits[id(stmt)] = acc
+                        loops.setdefault(id(later), []).append(acc)
+                    break
+        return inits, loops
+
+    def _acc_init(self, stmt):
+        '''s = '', parts = [] or var, s = None, ''
+
+        :return: [(name, kind, is_var)] or []
+        '''
+        if not (isinstance(stmt, ast.Assign) and len(stmt.targets) == 1):
+            return []
+        target, value, is_var = stmt.targets[0], stmt.value, False
+        if (tmatch(target, ast.Tuple(elts=[ast.Name(id='var', ctx=None),
+                                           ast.Name(id=None, ctx=None)],
+                                     ctx=None)) and
+                isinstance(value, ast.Tuple) and len(value.elts) == 2):
+            target, value, is_var = target.elts[1], value.elts[1], True
+        if not isinstance(target, ast.Name):
+            return []
+        kind = ('str' if isinstance(value, ast.Str) else
+                'join' if tmatch(value, ast.List(elts=[], ctx=None)) else
+                None)
+        return [(target.id, kind, is_var)] if kind else []
+
+    def _only_accumulates(self, loop, name, kind):
+        if kind == 'str':
+            ok = [id(n.target) for n in ast.walk(loop)
+                  if isinstance(n, ast.AugAssign) and
+                  isinstance(n.op, ast.Add) and
+                  tmatch(n.target, ast.Name(id=name, ctx=None)) and
+                  not mentions(n.value, name)]
+        else:
+            ok = [id(n.func.value) for n in ast.walk(loop)
+                  if self._is_append(n, name) and
+                  not mentions(n.args[0], name)]
+        return not nested_mentions([loop], name) and not [
+            n for n in ast.walk(loop)
+            if isinstance(n, ast.Name) and n.id == name and id(n) not in ok]
+
+    def _is_append(self, node, name):
+        return tmatch(node, ast.Call(
+            func=ast.Attribute(value=ast.Name(id=name, ctx=None),
+                               attr='append', ctx=None),
+            args=[None], keywords=[], starargs=None, kwargs=None))
+
+    def _is_join(self, node, name):
+        return tmatch(node, ast.Call(
+            func=ast.Attribute(value=ast.Str(s=''), attr='join', ctx=None),
+            args=[ast.Name(id=name, ctx=None)], keywords=[],
+            starargs=None, kwargs=None))
+
+    def _joined_once(self, rest, name):
+        uses = [n for stmt in rest for n in ast.walk(stmt)
+                if isinstance(n, ast.Name) and n.id == name]
+        joins = [n for stmt in rest for n in ast.walk(stmt)
+                 if self._is_join(n, name)]
+        return (len(uses) == 1 and len(joins) == 1 and
+                not nested_mentions(rest, name))
+
+    def init_builder(self, stmt, acc):
+        name, kind, _ = acc
+        wr = self._sync(stmt)
+        wr('val %s_sb = new StringBuilder(' % fix_kw(name))
+        if kind == 'str':
+            self.visit(stmt.value.elts[1] if isinstance(stmt.value, ast.Tuple)
+                       else stmt.value)
+        wr(')')
+        self.newline()
+
+    def accumulate(self, loop, accs):
+        for name, _, _ in accs:
+            self._builders[name] = fix_kw(name) + '_sb'
+        self.visit(loop)
+        wr = self._out.write
+        for name, kind, is_var in accs:
+            if kind == 'str':
+                del self._builders[name]
+                wr('%s %s = %s_sb.toString' % ('var' if is_var else 'val',
+                                               fix_kw(name), fix_kw(name)))
+                self.newline()
+
+    def builder_calls(self, wr, node_opt):
+        '''parts.append(x) => parts_sb.append(x); ''.join(parts) likewise.
+        '''
+        for node in node_opt:
+            for name, builder in self._builders.items():
+                if self._is_append(node, name):
+                    wr('%s.append(' % builder)
+                    self.visit(node.args[0])
+                    wr(')')
+                    return []
+                if self._is_join(node, name):
+                    wr('%s.toString' % builder)
+                    return []
+        return node_opt
+
+
+class LoopJumps(object):
+    '''Lower loops with break or continue to while loops with flags.
+
+    Scala has no continue, and scala.util.control.Breaks throws an
+    exception per break. Instead, `for x in xs:` with a break becomes::
+
+      val it1 = xs.iterator
+      var brk2 = false
+      while (! brk2 && it1.hasNext) {
+        val x = it1.next()
+        ...
+        }
+
+    A break sets `brk2`, a continue sets a `cnt3` flag that is reset
+    each time around, and statements after one that may set either
+    are guarded by `if (! brk2 && ! cnt3)`. An else clause runs if
+    `! brk2`, as in python.
+    '''
+    def __init__(self):
+        self._loop_flags = []
+
+    @classmethod
+    def jumps(cls, body):
+        '''Kinds of jump (ast.Break, ast.Continue) out of body
+        to the enclosing loop.
+        '''
+        found = set()
+
+        def walk(node):
+            if isinstance(node, (ast.Break, ast.Continue)):
+                found.add(node.__class__)
+            elif isinstance(node, (ast.For, ast.While)):
+                for stmt in node.orelse:
+                    walk(stmt)
+            elif not isinstance(node, (ast.FunctionDef, ast.ClassDef,
+                                       ast.Lambda, ast.expr)):
+                for child in ast.iter_child_nodes(node):
+                    walk(child)
+        for stmt in body:
+            walk(stmt)
+        return found
+
+    def while_loop(self, wr, node):
+        '''Lower a loop to a while loop; see also LoopShapes.
+        '''
+        kinds = self.jumps(node.body)
+        if isinstance(node, ast.For):
+            cond, bind = self.iteration(wr, node)
+        brk = (self._fresh('brk')
+               if ast.Break in kinds or node.orelse else None)
+        cnt = self._fresh('cnt') if ast.Continue in kinds else None
+        if brk:
+            wr('var %s = false' % brk)
+            self.newline()
+
+        wr('while (')
+        if brk:
+            wr('! %s && ' % brk)
+        if isinstance(node, ast.For):
+            wr(cond)
+        else:
+            self.operand(node.test, self.infix('&&') + 1)
+        wr(') ')
+        with self._block():
+            if isinstance(node, ast.For):
+                bind()
+            if cnt:
+                wr('var %s = false' % cnt)
+                self.newline()
+            self._loop_flags.append((brk, cnt))
+            self._stmts(node.body)
+            self._loop_flags.pop()
+
+        if node.orelse:
+            wr('if (! %s) ' % brk)
+            self._suite(node.orelse)
+
+    def may_jump(self, stmt):
+        return self._loop_flags and self.jumps([stmt])
+
+    def continuing(self):
+        '''Condition for going on with the current loop iteration.
+        '''
+        return ' && '.join('! ' + flag for flag in self._loop_flags[-1]
+                           if flag)
+
+    def jump(self, wr, kind):
+        '''Set the flag for a break (0) or continue (1).
+        '''
+        flag = self._loop_flags[-1][kind] if self._loop_flags else None
+        if flag:
+            wr('%s = true' % flag)
+        else:
+            wr(['break', 'continue'][kind])
+        self.newline()
+
+
+class LoopShapes(object):
+    '''Step through enumerate(xs), zip(xs, ys) and d.items() without
+    building intermediate collections or a tuple per item.
+
+    Each shape gives the setup, the loop condition, and how to bind
+    the loop variables; for example, `for ix, x in enumerate(xs)`::
+
+      val it1 = xs.iterator
+      var ix2 = 0
+      while (it1.hasNext) {
+        val ix = ix2
+        ix2 += 1
+        val x = it1.next()
+        ...
+
+    Other loops use `it.next()` on the iterable's iterator.
+    '''
+    def special_iteration(self, node):
+        target, it = node.target, node.iter
+        names = (len(target.elts)
+                 if isinstance(target, ast.Tuple) and not [
+                         elt for elt in target.elts
+                         if not isinstance(elt, ast.Name)]
+                 else 0)
+        if not names or not isinstance(it, ast.Call) or (
+                it.keywords or it.starargs or it.kwargs):
+            return None
+        if (names == 2 and tmatch(it.func, ast.Name(id='enumerate',
+                                                    ctx=None)) and
+                len(it.args) in (1, 2)):
+            return 'enumerate'
+        if (names == len(it.args) > 1 and
+                tmatch(it.func, ast.Name(id='zip', ctx=None))):
+            return 'zip'
+        if (names == 2 and not it.args and
+                tmatch(it.func, ast.Attribute(value=None, attr=None,
+                                              ctx=None)) and
+                it.func.attr in ('items', 'iteritems')):
+            return 'items'
+        return None
+
+    def iteration(self, wr, node):
+        '''Write the setup for stepping through the iterable of a
+        for loop.
+
+        :return: loop condition, and a thunk to bind the loop variables
+        '''
+        shape = self.special_iteration(node)
+        it = node.iter
+
+        def iterator_of(expr):
+            iterator = self._fresh('it')
+            wr('val %s = ' % iterator)
+            self.operand(expr, self.simple)
+            wr('.iterator')
+            self.newline()
+            return iterator
+
+        if shape == 'enumerate':
+            iterator = iterator_of(it.args[0])
+            ix = self._fresh('ix')
+            wr('var %s = ' % ix)
+            if len(it.args) > 1:
+                self.visit(it.args[1])
+            else:
+                wr('0')
+            self.newline()
+            name, item = node.target.elts
+
+            def bind():
+                self.bind_name(wr, name, ix, 'Int')
+                wr('%s += 1' % ix)
+                self.newline()
+                self.bind_name(wr, item, '%s.next()' % iterator,
+                               self.element_type(it.args[0]))
+            return '%s.hasNext' % iterator, bind
+
+        if shape == 'zip':
+            iterators = [iterator_of(seq) for seq in it.args]
+
+            def bind():
+                for name, iterator, seq in zip(node.target.elts, iterators,
+                                               it.args):
+                    self.bind_name(wr, name, '%s.next()' % iterator,
+                                   self.element_type(seq))
+            return ' && '.join('%s.hasNext' % iterator
+                               for iterator in iterators), bind
+
+        if shape == 'items':
+            cursor = self._fresh('cur')
+            wr('val %s = item_cursor(' % cursor)
+            self.visit(it.func.value)
+            wr(')')
+            self.newline()
+            key, value = node.target.elts
+            key_type, value_type = self.item_types(it.func.value)
+
+            def bind():
+                wr('%s.next()' % cursor)
+                self.newline()
+                self.bind_name(wr, key, '%s.key' % cursor, key_type)
+                self.bind_name(wr, value, '%s.value' % cursor, value_type)
+            return '%s.hasNext' % cursor, bind
+
+        iterator = iterator_of(it)
+
+        def bind():
+            if isinstance(node.target, ast.Name):
+                self.bind_name(wr, node.target, '%s.next()' % iterator,
+                               self.element_type(it))
+            else:
+                self.declare_targets(node.target, self.element_type(it))
+                wr('val ')
+                self.visit(node.target)
+                wr(' = %s.next()' % iterator)
+                self.newline()
+        return '%s.hasNext' % iterator, bind
+
+    def item_types(self, expr):
+        '''Key and value types of a dict, where they're evident.
+        '''
+        m = re.match(r'(?:Dict|Map)\[(.*)\]$', self.expr_type(expr) or '')
+        types = tuple_types('(%s)' % m.group(1)) if m else []
+        return types if len(types) == 2 else (None, None)
+
+    def bind_name(self, wr, name, value, t=None):
+        if t:
+            self.declare_type(name.id, t)
+        self.assign_name(wr, name.id)
+        wr(' = ' + value)
+        self.newline()
+
+
+class TailCalls(object):
+    '''Turn self tail calls into loops, by way of `@annotation.tailrec`.
+
+    A function whose recursive calls are all in tail position is
+    rewritten so that its result is the value of its last expression,
+    with no `return` (scalac does not follow tail calls out of
+    `return`); early returns such as::
+
+      if n <= 1:
+          return acc
+      return fact(n - 1, acc * n)
+
+    become `if (n <= 1) { acc } else { fact(n - 1, acc * n) }`. Where
+    the function has default arguments, the loop is a local helper,
+    `fact_loop`, that takes them all, so each call gives them
+    explicitly. Methods are left alone, since scalac only loops in
+    methods that cannot be overridden.
+
+    Functions that recur under an associative operator, as in
+    `return 1 + depth(rest)`, are noted in the diagnostics: an
+    accumulator argument would put them in tail form.
+    '''
+    accumulating = {ast.Add: '+', ast.Mult: '*', ast.BitOr: '|',
+                    ast.BitAnd: '&', ast.BitXor: '^'}
+
+    def tail_recursion(self, node):
+        '''Rewrite a self tail recursive function's body in tail form.
+
+        :return: body without docstring, or None if node is not
+                 self tail recursive
+        '''
+        args = node.args
+        if (self._def_stack[-1:] == ['ClassDef'] or args.vararg or
+                args.kwarg or self._api):
+            return None
+        names = [arg.id for arg in args.args if isinstance(arg, ast.Name)]
+        if len(names) != len(args.args) or node.name in names or [
+                n for n in own_nodes(node.body)
+                if isinstance(n, ast.Name) and n.id == node.name and
+                not isinstance(n.ctx, ast.Load)]:
+            return None
+        calls = [n for n in own_nodes(node.body) if self.self_call(node, n)]
+        if not calls:
+            return None
+        body = node.body[1:] if ast.get_docstring(node) else node.body
+        tails = []
+        helper = node.name + '_loop' if args.defaults else None
+
+        def tail(value):
+            if not self.self_call(node, value):
+                return value
+            call = (value if helper is None else
+                    self.explicit_call(node, value, helper))
+            if call is not None:
+                tails.append(value)
+            return call or value
+
+        tail_body = self.tail_form(body, tail)
+        if tail_body is not None and not [
+                call for call in calls if call not in tails]:
+            return tail_body
+        for value in [n.value for n in own_nodes(node.body)
+                      if isinstance(n, ast.Return) and n.value]:
+            if (isinstance(value, ast.BinOp) and
+                    value.op.__class__ in self.accumulating and
+                    len([operand for operand in (value.left, value.right)
+                         if self.self_call(node, operand)]) == 1 and
+                    not [n for n in ast.walk(value.left) if
+                         n is not value.left and self.self_call(node, n)] and
+                    not [n for n in ast.walk(value.right) if
+                         n is not value.right and self.self_call(node, n)]):
+                self.diagnostic(
+                    value, 'recursion in %s is not a tail call; '
+                    'accumulating the %s in an argument would make it one',
+                    node.name, self.accumulating[value.op.__class__])
+        return None
+
+    @classmethod
+    def self_call(cls, node, expr):
+        return (isinstance(expr, ast.Call) and
+                tmatch(expr.func, ast.Name(id=node.name, ctx=None)) and
+                not (expr.starargs or expr.kwargs))
+
+    @classmethod
+    def explicit_call(cls, node, call, helper):
+        '''Call helper with all of node's arguments, filling in
+        defaults.
+
+        :return: the call, or None if the arguments do not match
+        '''
+        names = [arg.id for arg in node.args.args]
+        given = dict(zip(names, call.args))
+        given.update((kw.arg, kw.value) for kw in call.keywords)
+        defaults = dict(zip(names[len(names) - len(node.args.defaults):],
+                            node.args.defaults))
+        if (len(call.args) > len(names) or
+                [name for name in given if name not in names] or
+                [name for name in names
+                 if name not in given and name not in defaults]):
+            return None
+        return loc(ast.Call(func=loc(ast.Name(id=helper, ctx=ast.Load()),
+                                     call.func),
+                            args=[given.get(name, defaults.get(name))
+                                  for name in names],
+                            keywords=[], starargs=None, kwargs=None), call)
+
+    def tail_form(self, stmts, tail):
+        '''Rewrite a suite to end in its result rather than return it.
+
+        :param tail: rewrites each result
+        :return: the suite, or None if it returns from elsewhere than
+                 its end (or from a loop), or falls off the end
+        '''
+        for ix, stmt in enumerate(stmts):
+            if isinstance(stmt, ast.Return):
+                if ix < len(stmts) - 1 or stmt.value is None:
+                    return None
+                return stmts[:ix] + [loc(ast.Expr(value=tail(stmt.value)),
+                                         stmt)]
+            returns = [n for n in own_nodes([stmt])
+                       if isinstance(n, ast.Return)]
+            if isinstance(stmt, ast.If) and returns:
+                then = self.tail_form(stmt.body, tail)
+                orelse = self.tail_form(stmt.orelse + stmts[ix + 1:], tail)
+                if then is None or orelse is None:
+                    return None
+                return stmts[:ix] + [loc(ast.If(test=stmt.test, body=then,
+                                                orelse=orelse), stmt)]
+            if returns:
+                return None
+        return None
+
+    def tail_helper(self, node, body, rtype, arg_types):
+        '''Loop in a local helper, for a function with default arguments.
+        '''
+        wr = self._out.write
+        types = dict(arg_types)
+        args = node.args
+        for arg, default in zip(args.args[len(args.args) -
+                                          len(args.defaults):],
+                                args.defaults):
+            types.setdefault(arg.id, self._literal_type(default) or
+                             self.expr_type(default) or 'Any')
+        helper = node.name + '_loop'
+        names = [fix_kw(arg.id) for arg in args.args]
+        with self._block():
+            wr('@annotation.tailrec')
+            self.newline()
+            wr('def %s(' % helper)
+            wr(', '.join('%s: %s' % (name, types.get(arg.id, 'Any'))
+                         for (name, arg) in zip(names, args.args)))
+            wr(')%s = ' % (': ' + rtype if rtype else ''))
+            self.fun_body(body, rtype, types.items())
+            wr('%s(%s)' % (helper, ', '.join(names)))
+            self.newline()
+
+
+def own_nodes(stmts):
+    '''Nodes of a suite, leaving out nested functions and classes.
+    '''
+    todo = list(stmts)
+    while todo:
+        node = todo.pop()
+        yield node
+        if not isinstance(node, (ast.FunctionDef, ast.ClassDef,
+                                 ast.Lambda)):
+            todo.extend(ast.iter_child_nodes(node))
+
+
+class LogGuards(object):
+    '''Skip the arguments of debug and info logging when the level
+    is disabled.
+
+    `log.debug('%s items', len(xs))`, on a logger from
+    `logging.getLogger`, becomes::
+
+      if (log.isEnabledFor(py.logging.DEBUG)) log.debug("%s items", len(xs))
+
+    so the arguments are neither evaluated nor boxed for nothing.
+    Calls with only a literal message are left alone.
+    '''
+    guarded_levels = {'debug': 'DEBUG', 'info': 'INFO'}
+
+    def log_guard(self, wr, call):
+        if not (isinstance(call, ast.Call) and
+                isinstance(call.func, ast.Attribute) and
+                call.func.attr in self.guarded_levels and
+                dotted_name(call.func.value) and
+                self.expr_type(call.func.value) == 'logging.Logger'):
+            return
+        if not (call.keywords or call.starargs or call.kwargs or
+                [arg for arg in call.args if not isinstance(arg, ast.Str)]):
+            return
+        wr('if (')
+        self.visit(call.func.value)
+        wr('.isEnabledFor(%s.logging.%s)) ' % (
+            self._batteries_pfx, self.guarded_levels[call.func.attr]))
+
+
+class HoistedPatterns(object):
+    '''Compile literal regular expressions once, in module-level vals.
+
+    In a top-level function or class, `re.compile`, `re.match` and
+    `re.search` of a literal pattern use a val put just before it::
+
+      private val headers_re1 = py.re.compile("^#+ ")
+      ...
+          if (headers_re1.match_(line)) {
+
+    Each top-level definition gets its own vals, kept in the
+    `scala_ir.Decls` made before it, so it converts the same way on
+    its own; where definitions share a name, the later ones get a
+    numbered prefix. Other patterns go through the cache in the
+    runtime `re`.
+
+    Calls are recognized under the names module-level imports give,
+    as in `import re as r` or `from re import search`.
+    '''
+    #: arity of the `re` functions whose patterns are hoisted
+    pattern_functions = {'compile': 1, 'match': 2, 'search': 2}
+
+    def __init__(self):
+        self._pattern_decls = None
+        self._hoist_prefix = None
+        self._re_functions = dict(('re.' + name, name)
+                                  for name in self.pattern_functions)
+        self._hoist_prefixes = {}
+
+    def note_re_import(self, node):
+        '''Note names an import binds to `re` or its functions.
+        '''
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == 're':
+                    self._re_functions.update(
+                        ('%s.%s' % (alias.asname or 're', name), name)
+                        for name in self.pattern_functions)
+        elif node.module == 're' and not node.level:
+            for alias in node.names:
+                if alias.name in self.pattern_functions:
+                    self._re_functions[alias.asname or alias.name] = (
+                        alias.name)
+
+    def scan_hoist_prefixes(self, body):
+        '''Choose distinct prefixes for the vals of top-level definitions
+        that share a name.
+
+        :return: prefixes by (name, line) of the later definitions
+        '''
+        defs = [stmt for stmt in body
+                if isinstance(stmt, (ast.FunctionDef, ast.ClassDef))]
+        taken = set(stmt.name for stmt in defs)
+        counts, prefixes = {}, {}
+        for stmt in defs:
+            counts[stmt.name] = n = counts.get(stmt.name, 0) + 1
+            if n == 1:
+                continue
+            while '%s_%d' % (stmt.name, n) in taken:
+                n += 1
+            prefixes[(stmt.name, stmt.lineno)] = prefix = '%s_%d' % (
+                stmt.name, n)
+            taken.add(prefix)
+        self._hoist_prefixes = prefixes
+        return prefixes
+
+    @contextmanager
+    def hoisting(self, stmt):
+        '''Put vals for the literal patterns in a top-level definition
+        before it.
+        '''
+        if self._def_stack or self._api:
+            yield
+            return
+        self._pattern_decls = self._out.decls()
+        self._hoist_prefix = self._hoist_prefixes.get(
+            (stmt.name, stmt.lineno), stmt.name)
+        try:
+            yield
+        finally:
+            self._pattern_decls = None
+
+    def _literal_pattern(self, node):
+        return (isinstance(node, ast.Call) and
+                self.pattern_functions.get(
+                    self._re_functions.get(dotted_name(node.func))) ==
+                len(node.args) and isinstance(node.args[0], ast.Str) and
+                not (node.keywords or node.starargs or node.kwargs))
+
+    def hoisted_pattern(self, wr, node_opt):
+        for node in node_opt:
+            decls = self._pattern_decls
+            if decls is None or not self._literal_pattern(node):
+                continue
+            pattern = node.args[0].s
+            if decls.get(pattern) is None:
+                name = '%s_re%d' % (self._hoist_prefix, len(decls) + 1)
+                decls.add(pattern, name, 'private val %s = %s.re.compile(%s)'
+                          % (name, self._batteries_pfx, scala_str(pattern)))
+            wr(decls.get(pattern))
+            if len(node.args) > 1:
+                wr('.%s(' % fix_kw(
+                    self._re_functions[dotted_name(node.func)]))
+                self.visit(node.args[1])
+                wr(')')
+            return []
+        return node_opt
+
+
+class Incremental(object):
+    '''Convert top-level statements one at a time, copying the scala
+    of unchanged definitions from an earlier conversion; see splice.
+
+    Fresh names start over in each definition, so that its scala does
+    not depend on the definitions before it. Given `mk_pool`, the
+    definitions of a large module are converted in worker processes;
+    see `convert_parallel`.
+    '''
+    #: source lines of definitions below which a pool is not worth making
+    parallel_min_lines = 2000
+
+    def __init__(self, splice, mk_pool):
+        self._splice = splice
+        self._mk_pool = mk_pool
+        self._ahead = []
+        self._parallel = {}
+
+    def module_state(self):
+        '''What converting a top-level definition depends on, besides
+        its syntax and conversion options.
+        '''
+        return (dict(self._imported), dict(self._imported_modules),
+                dict(self._context_classes), dict(self._enter_types),
+                dict(self._re_functions), dict(self._hoist_prefixes),
+                dict(self._scope_types[0]), set(self._scope_vars[0]))
+
+    def restore_state(self, state):
+        (imported, imported_modules, context_classes, enter_types,
+         re_functions, hoist_prefixes, types, names) = state
+        self._imported = dict(imported)
+        self._imported_modules = dict(imported_modules)
+        self._context_classes = dict(context_classes)
+        self._enter_types = dict(enter_types)
+        self._re_functions = dict(re_functions)
+        self._hoist_prefixes = dict(hoist_prefixes)
+        self._scope_types[0] = dict(types)
+        self._scope_vars[0] = set(names)
+
+    def plan(self, module, pass_names):
+        '''Note the context of top-level definitions, and choose those
+        to convert in worker processes.
+
+        Definitions that import anything are left to the serial path,
+        since workers have neither `find_package` nor the signature
+        index, and since rewrite passes over them affect what follows.
+
+        :return: ids of definitions that need no rewrite passes here:
+                 those to copy from the earlier conversion and those
+                 for workers, which run the passes themselves
+        '''
+        sp = self._splice
+        self.scan_context_classes(module.body)
+        sp.set_context(self._pkg, self._modname, self._api,
+                       self._package_object,
+                       sorted(self._context_classes.items()),
+                       sorted(self._enter_types.items()),
+                       sorted(self.scan_hoist_prefixes(module.body).items()),
+                       option_fold(self._observed,
+                                   lambda obs: obs.digest, None),
+                       self.imported_digests(
+                           [node for stmt in module.body
+                            for node in sp.imports(stmt)]))
+
+        own = [stmt for stmt in module.body
+               if isinstance(stmt, splice.chunk_types) and
+               not sp.imports(stmt)]
+        reused = [stmt for stmt in own if sp.reusable(stmt)]
+        todo = [stmt for stmt in own if not sp.reusable(stmt)]
+        if self._mk_pool is None or sum(
+                last - first + 1 for (first, last)
+                in map(sp.region, todo)) < self.parallel_min_lines:
+            todo = []
+
+        prior, ahead = [], set(id(stmt) for stmt in todo)
+        for stmt in module.body:
+            if id(stmt) in ahead:
+                self._ahead.append((stmt, list(prior), pass_names))
+            prior.extend(copy.deepcopy(node) for node in sp.imports(stmt))
+        return set(id(stmt) for stmt in reused + todo)
+
+    def convert_parallel(self, body):
+        '''Convert the definitions chosen by `plan` in a pool of worker
+        processes, ahead of the rest.
+
+        Each definition needs the module state at its place in body,
+        so a dry run over the other statements, with output discarded,
+        computes that state first.
+
+        The pool is made after parsing, and jobs are passed to it as
+        `initargs`, so forked workers inherit the syntax tree rather
+        than unpickle it.
+        '''
+        sp, printer = self._splice, self._printer
+        ahead = dict((id(stmt), (stmt, prior, pass_names))
+                     for (stmt, prior, pass_names) in self._ahead)
+        saved = (self.module_state(), self._fresh_ix, len(self.diagnostics),
+                 self._out)
+        self._printer = Printer(StringIO.StringIO(), [])
+        jobs = []
+        for stmt in body:
+            if id(stmt) in ahead:
+                first, last = sp.region(stmt)
+                jobs.append((ahead[id(stmt)], self.module_state(),
+                             printer.token_lines(first, last),
+                             first, last, printer.depth,
+                             (self._modname, self._pkg, self._api,
+                              self._package_object, self._observed)))
+            elif not isinstance(stmt, splice.chunk_types):
+                self._out = Builder()
+                self.visit(stmt)
+            self.import_sigs(sp.imports(stmt))
+        state, self._fresh_ix, diagnostics, self._out = saved
+        self._printer = printer
+        self.restore_state(state)
+        del self.diagnostics[diagnostics:]
+
+        pool = self._mk_pool(initializer=share_chunk_jobs, initargs=(jobs,))
+        try:
+            results = pool.map(convert_shared_chunk, range(len(jobs)))
+        finally:
+            pool.close()
+            pool.join()
+        self._parallel = dict((id(job[0][0]), result)
+                              for (job, result) in zip(jobs, results))
+
+    def top_level(self, stmt):
+        sp = self._splice
+        if not isinstance(stmt, splice.chunk_types):
+            self.visit(stmt)
+            for sp in option_iter(sp):
+                self._out.comments(sp.region(stmt)[1])
+            self.flush()
+            return
+
+        printer = self._printer
+        start = printer.pos
+        done = self._parallel.pop(id(stmt), None)
+        for (txt, chunk) in option_iter(done or (sp and sp.reusable(stmt))):
+            self.import_sigs(sp.imports(stmt))
+            first, last = sp.region(stmt)
+            printer.splice(txt, [(scala_line, first + py_line, col)
+                                 for (scala_line, py_line, col)
+                                 in chunk['marks']], last)
+            self.diagnostics.extend((first + lineno, msg)
+                                    for (lineno, msg)
+                                    in chunk['diagnostics'])
+            sp.add(stmt, start, printer.pos,
+                   chunk['marks'], chunk['diagnostics'])
+            return
+
+        fresh_ix, self._fresh_ix = self._fresh_ix, 0
+        line, marks = printer.line, printer.marks
+        printer.marks = SourceMap(None)
+        diagnostics = len(self.diagnostics)
+        self.visit(stmt)
+        for sp in option_iter(sp):
+            self._out.comments(sp.region(stmt)[1])
+        self.flush()
+        self._fresh_ix = fresh_ix
+        for sp in option_iter(sp):
+            first, _ = sp.region(stmt)
+            sp.add(stmt, start, printer.pos,
+                   [(scala_line - line, py_line - first, col)
+                    for (scala_line, py_line, col)
+                    in printer.marks.entries()],
+                   [(lineno - first, msg)
+                    for (lineno, msg) in self.diagnostics[diagnostics:]])
+        printer.marks = marks
+
+
 class ReRaise(object):
     def ex_wildcard(self, wr):
         wr('_ex')  # KLUDGE
@@ -482,7 +2234,7 @@ class Reify(object):
                      classof_id='classOf'):
         for node in node_opt:
             if tmatch(node, ast.Call(func=ast.Name(id=classof_id, ctx=None),
-                                     args=[None, ast.Str(s=None)],
+                                     args=[None],
                                      keywords=[], starargs=None,
                                      kwargs=None)):
                 wr('classOf[')
@@ -494,7 +2246,7 @@ class Reify(object):
     def skip_special_imports(self, node):
         '''skip: from functools import partial as pf_ (KLUDGE)
 
-        TODO: skip from ..fp import typed
+        see also passes.FpIdioms, which drops `from ..fp import typed`
         '''
         return ([]
                 if tmatch(node, ast.ImportFrom(
@@ -509,31 +2261,466 @@ class Reify(object):
             wr('new ')
 
     def _is_class_ref(self, expr):
-        '''KLUDGE: distinguish f() from new F() by capitalization.
+        sig = self.imported_sig(expr)
+        return sig[0] == 'class' if sig else class_ref_name(expr)
+
+
+class Precedence(object):
+    '''Parenthesize operands only where scala would group them
+    differently from the python syntax tree.
+
+    Scala gives infix operators the precedence of their first
+    character (`SLS 6.12.3`__), lowest first::
+
+      >>> [Precedence.infix(op) for op in ['eq', '||', '&&', '==', '<=',
+      ...                                  '+', '*', '**']]
+      [1, 2, 4, 5, 6, 8, 9, 9]
+
+    All are left-associative. Prefix operators bind tighter than any
+    infix operator, and selection and application tighter still.
+    `if` expressions and anonymous functions extend as far as they can.
+
+    __ http://www.scala-lang.org/docu/files/ScalaReference.pdf
+    '''
+    lowest, prefix, simple = 0, 11, 12
+    by_first_char = [('|', 2), ('^', 3), ('&', 4), ('=!', 5), ('<>', 6),
+                     (':', 7), ('+-', 8), ('*/%', 9)]
+
+    def __init__(self):
+        self._operand_of = (None, self.lowest)
+
+    @classmethod
+    def infix(cls, op):
+        if op[0].isalpha():
+            return 1
+        for chars, prec in cls.by_first_char:
+            if op[0] in chars:
+                return prec
+        return 10
+
+    def operand(self, node, prec):
+        '''Visit node where an expression of at least prec is needed.
+        '''
+        self._operand_of = (node, prec)
+        self.visit(node)
+
+    def _grouped(self, node, prec):
+        '''Parenthesize the conversion of node, an expression of
+        precedence prec, if its context needs more.
+        '''
+        context, need = self._operand_of
+        return self._paren(context is node and prec < need)
+
+    def infix_operands(self, wr, left, op, right):
+        prec = self.infix(op)
+        self.operand(left, prec)
+        wr(' ' + op + ' ')
+        self.operand(right, prec + 1)
+
+
+class NumericOps(object):
+    '''Convert python arithmetic that scala lacks, or spells
+    differently, by the types of the operands (see
+    `TypeDecls.expr_type`).
+
+    `x // y` rounds down, where scala's `/` rounds toward zero:
+    `Math.floorDiv(x, y)` for Int and Long, and
+    `math.floor(x / y)` for Double.
+
+    `x ** n` for a small constant n multiplies x by itself, as in
+    `x * x * x`, where x is a typed number; x is put in a val first
+    unless it takes no work to evaluate. Other powers of integers are
+    `BigInt(x).pow(n)`, which fails for a negative n, rather than lose
+    precision. Otherwise, it's `math.pow(x, n)`.
+
+    Integer `+`, `-` and `*` in functions follow the bounds found by
+    `TypeDecls.analyze_ranges`: where the result fits the type of the
+    operands, the operator stays; where it's the value of a variable
+    declared with a wider type, or where the operands are bounded by
+    the program rather than only by their type, the left operand is
+    widened, as in `val area: Long = w.toLong * h` or
+    `total = Math.addExact(total, i.toLong * 3000000)`, and so is a
+    variable it's assigned to (see `TypeDecls.int_demands`);
+    otherwise, the operation is checked, as in `Math.addExact(x, y)`,
+    to fail rather than overflow. Integer constants too big for an
+    Int are folded to a Long or BigInt literal.
+    '''
+    checked_operator = {ast.Add: 'Math.addExact',
+                        ast.Sub: 'Math.subtractExact',
+                        ast.Mult: 'Math.multiplyExact'}
+
+    def numeric_binop(self, wr, node_opt):
+        for node in node_opt:
+            if is_int_constant(node) and ranges.width(
+                    self.expr_range(node)) in ('Long', 'BigInt'):
+                lo, _ = self.expr_range(node)
+                self.visit(loc(ast.Num(n=lo), node))
+                return []
+            if self.checked_op(node):
+                self._call_with(wr, self.checked_op(node),
+                                node.left, node.right)
+                return []
+            if self.widened_op(node):
+                self.widened_binop(wr, node, self.widened_op(node))
+                return []
+            if isinstance(node.op, ast.FloorDiv):
+                self.floor_div(wr, node)
+                return []
+            if isinstance(node.op, ast.Pow):
+                self.power(wr, node)
+                return []
+        return node_opt
+
+    def checked_op(self, node):
+        '''Function for an integer operation with no bound.
+        '''
+        t = self.numeric_join(self.expr_type(node.left),
+                              self.expr_type(node.right))
+        if (node.op.__class__ not in self.checked_operator or
+                t not in self.int_bounds or not self._int_ranges or
+                ranges.within(self.expr_range(node), self.int_bounds[t]) or
+                self.widened_op(node)):
+            return None
+        return self.checked_operator[node.op.__class__]
+
+    def widened_op(self, node):
+        '''Wider type for an integer operation whose values are
+        bounded, but not by the type of its operands: either it's the
+        value of a variable declared with a wider type, or the bounds
+        of its operands are the program's own, not just those of
+        their type, as with `i * 3000000` for `i in range(1000)`.
+        '''
+        if (node.op.__class__ not in self.checked_operator or
+                not self._int_ranges):
+            return None
+        t = self.numeric_join(self.expr_type(node.left),
+                              self.expr_type(node.right))
+        if t not in self.int_bounds:
+            return None
+        lo, hi = self.int_bounds[t]
+        if node is not self._widening and [
+                iv for iv in map(self.expr_range, (node.left, node.right))
+                if iv is None or not lo < iv[0] <= iv[1] < hi]:
+            return None
+        return self.int_width_of(node, t)
+
+    def widened_binop(self, wr, node, t):
+        op = self._op(node.op)
+        prec = self.infix(op)
+        with self._grouped(node, prec):
+            if t == 'BigInt':
+                self._call_with(wr, 'BigInt', node.left)
+            else:
+                self.operand(node.left, self.simple)
+                wr('.to' + t)
+            wr(' ' + op + ' ')
+            self.operand(node.right, prec + 1)
+
+    def floor_div(self, wr, node):
+        if self.numeric_join(self.expr_type(node.left),
+                             self.expr_type(node.right)) == 'Double':
+            wr('math.floor(')
+            self.infix_operands(wr, node.left, '/', node.right)
+            wr(')')
+        else:
+            self._call_with(wr, 'Math.floorDiv', node.left, node.right)
+
+    def power(self, wr, node):
+        n = self.pow_unrolled(node)
+        if n is None and self.int_power(node):
+            wr('BigInt(')
+            self.visit(node.left)
+            wr(').pow(')
+            self.visit(node.right)
+            wr(')')
+            return
+        if n is None:
+            self._call_with(wr, 'math.pow', node.left, node.right)
+            return
+        base, temp = node.left, None
+        if n > 1 and not (isinstance(base, ast.Num) or dotted_name(base)):
+            temp = self._fresh('p')
+            self._scope_types[-1][temp] = self.expr_type(base)
+            wr('{ val %s = ' % temp)
+            self.visit(base)
+            wr('; ')
+            base = loc(ast.Name(id=temp, ctx=ast.Load()), node)
+        product = reduce(lambda left, right: loc(ast.BinOp(
+            left=left, op=ast.Mult(), right=right), node), [base] * n)
+        context, need = self._operand_of
+        if context is node and temp is None:
+            self._operand_of = (product, need)
+        self.visit(product)
+        if temp:
+            wr(' }')
+
+    def _call_with(self, wr, func, *args):
+        wr(func + '(')
+        for ix, arg in enumerate(args):
+            if ix > 0:
+                wr(', ')
+            self.operand(arg, self.lowest)
+        wr(')')
+
+
+class Slices(object):
+    '''Slices of sequences.
+
+    `xs[a:b]` is `xs.slice(a, b)` and `xs[a:]` is `xs.drop(a)`; both
+    copy. Where a slice is only read -- iterated by a for loop that
+    does not otherwise mention xs, or passed to a function such as
+    `sum` -- it's taken from `xs.view` instead. (A comprehension over
+    a view would yield a view, so those still copy.)
+
+    Negative bounds, constant or negated, count from the end, as
+    python's do (see `slice_indices` in the runtime): `xs[-n:]` is
+    `slice_of(xs, Some(-n), None)`, which keeps the type of xs, String
+    included. Slices with a step take their items through a view:
+    `xs[::2]` is `slice_view(xs, None, None, 2)`, copied with
+    `.toVector` (`.mkString` for a String) unless only read.
+    `xs[::-1]` is `xs.reverse`.
+    '''
+    reading_functions = ('sum', 'min', 'max', 'any', 'all', 'len',
+                         'sorted', 'list', 'set')
+
+    def __init__(self):
+        self._read_only = set()
+
+    def read_only(self, expr, users=()):
+        '''Note that a slice or list comprehension is only read,
+        unless its sequence is mentioned in users, which might change it.
+        '''
+        if isinstance(expr, ast.ListComp):
+            self._read_only.add(id(expr))
+            return
+        if not (isinstance(expr, ast.Subscript) and
+                isinstance(expr.slice, ast.Slice)):
+            return
+        base = expr.value
+        while isinstance(base, (ast.Attribute, ast.Subscript)):
+            base = base.value
+        if not (isinstance(base, ast.Name) and
+                [1 for user in users if mentions(user, base.id)]):
+            self._read_only.add(id(expr))
+
+    def read_only_iter(self, it, users):
+        self.read_only(it, users)
+        if (isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and
+                it.func.id in ('enumerate', 'zip', 'reversed')):
+            for arg in it.args:
+                self.read_only(arg, users)
+
+    def slice_load(self, wr, node):
+        def given(expr):
+            return (None if expr is None or
+                    tmatch(expr, ast.Name(id='None', ctx=None)) else expr)
+        lower, upper, step = [given(getattr(node.slice, field))
+                              for field in ('lower', 'upper', 'step')]
+        step_n = step.n if isinstance(step, ast.Num) else None
+        if step_n == 1:
+            step = None
+        viewed = id(node) in self._read_only
+        is_str = self.expr_type(node.value) == 'String'
+
+        def bounds():
+            for bound in (lower, upper):
+                wr(', ')
+                if bound:
+                    wr('Some(')
+                    self.visit(bound)
+                    wr(')')
+                else:
+                    wr('None')
+
+        if step is None and not [
+                bound for bound in (lower, upper) if negative(bound)]:
+            self.operand(node.value, self.simple)
+            if viewed and (lower or upper):
+                wr('.view')
+            if upper:
+                wr('.slice(')
+                if lower:
+                    self.visit(lower)
+                else:
+                    wr('0')
+                wr(', ')
+                self.visit(upper)
+            elif lower:
+                wr('.drop(')
+                self.visit(lower)
+            else:
+                wr('.drop(0')
+            wr(')')
+        elif step is None:
+            wr('slice_of(')
+            self.operand(node.value, self.simple)
+            if viewed and not is_str:
+                wr('.view')
+            bounds()
+            wr(')')
+        elif step_n == -1 and not lower and not upper:
+            self.operand(node.value, self.simple)
+            wr('.view.reverse' if viewed and not is_str else '.reverse')
+        else:
+            wr('slice_view(')
+            self.visit(node.value)
+            bounds()
+            wr(', ')
+            if step:
+                self.visit(step)
+            else:
+                wr('1')
+            wr(')' if viewed else
+               ').mkString' if is_str else ').toVector')
+
+
+def negative(bound):
+    '''Is a slice bound a negative literal, or negated?
+    '''
+    return (isinstance(bound, ast.Num) and bound.n < 0 or
+            isinstance(bound, ast.UnaryOp) and isinstance(bound.op, ast.USub))
+
+
+class Comprehensions(object):
+    '''Comprehensions as scala `for ... yield`.
+
+    `passes.FuseComprehensions` has merged chains of them, binding
+    intermediate values with `for x in [e]`; here such a generator is
+    the value definition `x = e`, and each `if` is a guard, so the
+    filters chain through `withFilter`. A comprehension only read by
+    its consumer (a generator expression, or a list passed to `sum`
+    and the like, or iterated by a for loop) is taken over a view, and
+    nothing is built until the consumer steps through it. One with
+    value definitions is built by `.toVector` from a view otherwise,
+    since a strict `map` would build a collection of the bound values
+    first::
+
+      (for (y <- ys.view; x = g(y) if p(x)) yield f(x)).toVector
+
+    Dict and set comprehensions add to a builder, `dict_builder` from
+    the runtime or `Set.newBuilder`, in a for loop, so no collection
+    of pairs is made along the way. Where every item of the first
+    source is added, the builder gets a `sizeHint` from it, which
+    takes effect when the source knows its size (on one line; wrapped
+    here)::
+
+      { val b1 = dict_builder[String, Int](); b1.sizeHint(words);
+        for (w <- words) b1 += w -> len(w); b1.result() }
+
+    A source other than a name is evaluated once, into a val, first:
+    `{ val s2 = range(n); val b1 = ...; b1.sizeHint(s2); for (x <- s2) ...`
+    '''
+    def comprehension(self, node, lazy):
+        wr = self._sync(node)
+        binds = [gen for gen in node.generators[1:] if self.binding(gen)]
+        viewed = lazy or bool(binds)
+        wr('(for (')
+        self.enumerators(wr, node.generators, viewed)
+        wr(') yield ')
+        self.visit(node.elt)
+        wr(')')
+        if viewed and not lazy:
+            wr('.toVector')
+
+    def built(self, node, results):
+        '''Write a dict or set comprehension.
+
+        :param results: key and value, or element
         '''
-        names = [getName(expr)
-                 for (cls, getName) in
-                 [(ast.Name, lambda n: n.id),
-                  (ast.Attribute, lambda n: n.attr)]
-                 if isinstance(expr, cls)]
-        return len([name for name in names if name[0].isupper()]) > 0
+        wr = self._sync(node)
+        gens = node.generators
+        self._scope_types.append({})
+        for gen in gens:
+            self.declare_targets(gen.target,
+                                 self.binding(gen) and
+                                 self.expr_type(gen.iter.elts[0]) or
+                                 self.element_type(gen.iter))
+        types = ', '.join(self.expr_type(expr) or 'Any' for expr in results)
+        builder = self._fresh('b')
+        hint = not [gen for (ix, gen) in enumerate(gens)
+                    if gen.ifs or ix > 0 and not self.binding(gen)]
+        wr('{ ')
+        if hint and not isinstance(gens[0].iter, ast.Name):
+            source = self._fresh('s')
+            wr('val %s = ' % source)
+            self.visit(gens[0].iter)
+            wr('; ')
+            gens = [ast.comprehension(
+                target=gens[0].target, ifs=gens[0].ifs,
+                iter=loc(ast.Name(id=source, ctx=ast.Load()),
+                         gens[0].iter))] + gens[1:]
+        wr('val %s = ' % builder)
+        wr(('dict_builder[%s]()' if len(results) == 2 else
+            'Set.newBuilder[%s]') % types)
+        if hint:
+            wr('; %s.sizeHint(' % builder)
+            self.visit(gens[0].iter)
+            wr(')')
+        wr('; for (')
+        self.enumerators(wr, gens)
+        wr(') %s += ' % builder)
+        if len(results) == 2:
+            self.infix_operands(wr, results[0], '->', results[1])
+        else:
+            self.visit(results[0])
+        wr('; %s.result() }' % builder)
+        self._scope_types.pop()
+
+    def enumerators(self, wr, generators, viewed=False):
+        for ix, gen in enumerate(generators):
+            if ix > 0:
+                wr('; ')
+            self.visit(gen.target)
+            if ix > 0 and self.binding(gen):
+                wr(' = ')
+                self.visit(gen.iter.elts[0])
+            else:
+                wr(' <- ')
+                if viewed and ix == 0:
+                    self.operand(gen.iter, self.simple)
+                    wr('.view')
+                else:
+                    self.visit(gen.iter)
+            for cond in gen.ifs:
+                wr(' if ')
+                self.visit(cond)
+
+    @classmethod
+    def binding(cls, gen):
+        return isinstance(gen.iter, ast.List) and len(gen.iter.elts) == 1
 
 
 class PyToScala(ast.NodeVisitor,
-                Reify, Assignment, ClassStructure, TypeDecls, ReRaise,
+                Reify, Precedence, NumericOps, Slices, Comprehensions,
+                ProjectSigs, Assignment, ClassStructure, TypeDecls,
+                ContextManagers, StringFormat, Accumulators, LoopJumps,
+                LoopShapes, TailCalls, LogGuards, HoistedPatterns,
+                Incremental, ReRaise,
                 APIFilter, PyRunTime,
                 ModuleAttributes, LineSyntax):
     def __init__(self, modname, out, token_lines, find_package,
-                 pkg=None, api=False,
-                 partial_app='pf_', batteries_pfx='py',
+                 pkg=None, api=False, sigs=None, package_object=False,
+                 source_map=None, splice=None, mk_pool=None,
+                 observed=None, partial_app='pf_', batteries_pfx='py',
                  py2scala='com.madmode.py2scala'):
-        LineSyntax.__init__(self, out, token_lines)
+        LineSyntax.__init__(self, out, token_lines, source_map)
         PyRunTime.__init__(self, find_package, batteries_pfx, py2scala)
         APIFilter.__init__(self, api)
-        TypeDecls.__init__(self)
+        TypeDecls.__init__(self, observed)
+        ContextManagers.__init__(self)
+        Accumulators.__init__(self)
+        LoopJumps.__init__(self)
+        Slices.__init__(self)
+        HoistedPatterns.__init__(self)
+        Incremental.__init__(self, splice, mk_pool)
         Reify.__init__(self, partial_app)
+        Precedence.__init__(self)
+        ProjectSigs.__init__(self, sigs)
         self._pkg = pkg
         self._modname = modname
+        self._package_object = package_object
+        self._fresh_ix = 0
+        self.diagnostics = []
 
     def visit_Module(self, node):
         '''Module(stmt* body)
@@ -548,13 +2735,19 @@ class PyToScala(ast.NodeVisitor,
             wr('import %s\n' % target)
 
         _, body, _ = self._doc(node)
-        wr('object %s ' % self._modname)
+        self.scan_context_classes(body)
+        self.scan_hoist_prefixes(body)
+        wr('%sobject %s ' % ('package ' if self._package_object else '',
+                             self._modname))
 
         with self._block():
             self.mod_attrs(wr, self._pkg, self._modname)
+            self.flush()
+            if self._ahead:
+                self.convert_parallel(body)
 
             for stmt in body:
-                self.visit(stmt)
+                self.top_level(stmt)
 
         self.newline()
 
@@ -576,8 +2769,28 @@ class PyToScala(ast.NodeVisitor,
 
     def _suite(self, body):
         with self._block():
-            for stmt in body:
+            self._stmts(body)
+
+    def _stmts(self, body):
+        inits, loops = self.plan_accumulators(body)
+        outer = dict(self._builders)
+        self._planned_stmts(body, inits, loops)
+        self._builders = outer
+
+    def _planned_stmts(self, body, inits, loops):
+        for ix, stmt in enumerate(body):
+            if id(stmt) in inits:
+                self.init_builder(stmt, inits[id(stmt)])
+            elif id(stmt) in loops:
+                self.accumulate(stmt, loops[id(stmt)])
+            else:
                 self.visit(stmt)
+            rest = body[ix + 1:]
+            if rest and self.may_jump(stmt):
+                self._out.write('if (%s) ' % self.continuing())
+                with self._block():
+                    self._planned_stmts(rest, inits, loops)
+                return
 
     def _items(self, wr, items, parens=False):
         if parens:
@@ -594,6 +2807,21 @@ class PyToScala(ast.NodeVisitor,
             wr(', ')
             self.visit(node)
 
+    def diagnostic(self, node, msg, *args):
+        '''Note something about the python source that limits
+        the quality of the conversion.
+        '''
+        lineno = getattr(node, 'lineno', None)
+        txt = msg % args
+        log.warning('%s:%s: %s', self._modname, lineno, txt)
+        self.diagnostics.append((lineno, txt))
+
+    def _fresh(self, prefix):
+        '''Make up a name for a local variable.
+        '''
+        self._fresh_ix += 1
+        return '%s%d' % (prefix, self._fresh_ix)
+
     def visit_FunctionDef(self, node):
         '''FunctionDef(identifier name, arguments args,
                             stmt* body, expr* decorator_list)
@@ -603,9 +2831,18 @@ class PyToScala(ast.NodeVisitor,
         except ImplementationDetail:
             pass
         else:
-            self._decorators(node)
-            rtype, body = self.fun_sig(node)
-            self.fun_body(body, rtype)
+            with self.hoisting(node), self.own_builders():
+                self._decorators(node)
+                tail_body = self.tail_recursion(node)
+                if tail_body is None:
+                    rtype, body, arg_types = self.fun_sig(node)
+                    self.fun_body(body, rtype, arg_types)
+                elif node.args.defaults:
+                    rtype, _, arg_types = self.fun_sig(node)
+                    self.tail_helper(node, tail_body, rtype, arg_types)
+                else:
+                    rtype, _, arg_types = self.fun_sig(node, tailrec=True)
+                    self.fun_body(tail_body, rtype, arg_types)
 
     def _decorators(self, node):
         wr = self._sync(node)
@@ -620,9 +2857,10 @@ class PyToScala(ast.NodeVisitor,
 
         .. note: TODO: test setting attributes in __new__.
         '''
-        self._decorators(node)
-        wr, ctors, body = self.class_sig(node)
-        self.class_body(wr, ctors, body)
+        with self.hoisting(node), self.own_builders():
+            self._decorators(node)
+            wr, ctors, body = self.class_sig(node)
+            self.class_body(wr, ctors, body)
 
     def visit_Return(self, node):
         '''Return(expr? value)
@@ -643,7 +2881,7 @@ class PyToScala(ast.NodeVisitor,
                                          ctx=ast.Del())]))
         wr = self._sync(node)
         target = node.targets[0]
-        self.visit(target.value)
+        self.operand(target.value, self.simple)
         wr('.__delitem__(')
         self.visit(target.slice.value)
         wr(')')
@@ -651,24 +2889,42 @@ class PyToScala(ast.NodeVisitor,
 
     def visit_Assign(self, node):
         '''Assign(expr* targets, expr value)
-
-        TODO: skip _xyz in API mode
         '''
         wr = self._sync(node)
-        x = self.assign_targets(wr, node)
-        wr(' = ')
-        self.visit(x)
-        self.newline()
+        for x in option_iter(self.assign_targets(wr, node)):
+            wr(' = ')
+            self.visit(x)
+            self.newline()
 
     def visit_AugAssign(self, node):
         '''AugAssign(expr target, operator op, expr value)
         '''
+        if (isinstance(node.target, ast.Name) and
+                node.target.id in self._builders):
+            wr = self._sync(node)
+            wr('%s.append(' % self._builders[node.target.id])
+            self.visit(node.value)
+            wr(')')
+            self.newline()
+            return
+
+        value = loc(ast.BinOp(left=loc(ast.Name(id=node.target.id,
+                                                ctx=ast.Load()), node.target),
+                              op=node.op, right=node.value), node
+                    ) if isinstance(node.target, ast.Name) else None
         self.visit(node.target)
         wr = self._sync(node)
-        wr(' ')
-        wr(self._op(node.op))
-        wr('= ')
-        self.visit(node.value)
+        # A bounded name is declared wide enough for all its values.
+        if value and (node.op.__class__ not in self.operator or
+                      (self.checked_op(value) and
+                       not self.bounded(node.target.id))):
+            wr(' = ')
+            self.visit(value)
+        else:
+            wr(' ')
+            wr(self._op(node.op))
+            wr('= ')
+            self.visit(node.value)
         self.newline()
 
     def visit_Print(self, node):
@@ -685,41 +2941,41 @@ class PyToScala(ast.NodeVisitor,
     def visit_For(self, node):
         '''For(expr target, expr iter, stmt* body, stmt* orelse)
 
-        Use local boolean to implement orelse.
+        As in python, orelse runs unless the loop is broken out of;
+        with no break in the body, it always runs after the loop.
         '''
         wr = self._sync(node)
-        elsevar_ = ['any_iter%s' % id(s)
-                    for s in [node.orelse] if node.orelse]
-
-        for elsevar in elsevar_:
-            wr('var %s = false' % elsevar)
-            self.newline()
+        self.read_only_iter(node.iter, [node.target] + node.body + node.orelse)
+        if self.jumps(node.body) or self.special_iteration(node):
+            self.while_loop(wr, node)
+            return
 
+        if isinstance(node.target, ast.Name):
+            self.declare_type(node.target.id, self.element_type(node.iter))
         wr('for (')
         self.visit(node.target)
         wr(' <- ')
         self.visit(node.iter)
         wr(') ')
         with self._block():
-            for elsevar in elsevar_:
-                wr('%s = true' % elsevar)
-                self.newline()
             for stmt in node.body:
                 self.visit(stmt)
-
-        for elsevar in elsevar_:
-            wr('if (! %s)' % elsevar)
-            self._suite(node.orelse)
+        self._stmts(node.orelse)
 
     def visit_While(self, node):
         '''While(expr test, stmt* body, stmt* orelse)
+
+        orelse runs as for `visit_For`.
         '''
-        limitation(not node.orelse)
         wr = self._sync(node)
+        if self.jumps(node.body):
+            self.while_loop(wr, node)
+            return
         wr('while (')
         self.visit(node.test)
         wr(') ')
         self._suite(node.body)
+        self._stmts(node.orelse)
 
     def visit_If(self, node):
         '''If(expr test, stmt* body, stmt* orelse)
@@ -739,8 +2995,17 @@ class PyToScala(ast.NodeVisitor,
 
     def visit_With(self, node):
         '''With(expr context_expr, expr? optional_vars, stmt* body)
+
+        Use try/finally where we know how to exit the context;
+        otherwise, fall back to `with_ (expr) { case x => ... }`.
         '''
         wr = self._sync(node)
+        resource, exit = self.context_exit(node.context_expr)
+        if exit and (node.optional_vars is None or
+                     isinstance(node.optional_vars, ast.Name)):
+            self.with_try(wr, node, resource, exit)
+            return
+
         wr('with_ (')
         self.visit(node.context_expr)
         wr(') ')
@@ -821,6 +3086,8 @@ class PyToScala(ast.NodeVisitor,
     def visit_Import(self, node):
         """Import(alias* names)"""
         wr = self._sync(node)
+        self.import_module_sigs(node)
+        self.note_re_import(node)
         for name in node.names:
             wr('import ')
             path = self.adjust_pkg_path(name.name)
@@ -835,8 +3102,10 @@ class PyToScala(ast.NodeVisitor,
         """ImportFrom(identifier? module, alias* names, int? level)"""
         wr = self._sync(node)
         limitation(node.module)
+        self.note_re_import(node)
 
         for node in self.skip_special_imports(node):
+            self.import_from_sigs(node)
             wr('import ')
             wr('.'.join(self.adjust_pkg_path(node.module, node.level)))
             wr('.')
@@ -856,10 +3125,11 @@ class PyToScala(ast.NodeVisitor,
         self.newline()
 
     def visit_Expr(self, node):
-        self._sync(node)
+        wr = self._sync(node)
         if tmatch(node.value, ast.Str(s=None)):
             pass  # Skip docstrings and other inert string exprs.
         else:
+            self.log_guard(wr, node.value)
             self.visit(node.value)
             self.newline()
 
@@ -870,13 +3140,11 @@ class PyToScala(ast.NodeVisitor,
 
     def visit_Break(self, node):
         wr = self._sync(node)
-        wr('break')
-        self.newline()
+        self.jump(wr, 0)
 
     def visit_Continue(self, node):
         wr = self._sync(node)
-        wr('continue')
-        self.newline()
+        self.jump(wr, 1)
 
     def visit_BoolOp(self, node):
         '''BoolOp(boolop op, expr* values)
@@ -884,21 +3152,24 @@ class PyToScala(ast.NodeVisitor,
         '''
         wr = self._sync(node)
         sym = {ast.And: '&&', ast.Or: '||'}[node.op.__class__]
-        sep = ''
-        for expr in node.values:
-            wr(sep)
-            self.visit(expr)
-            sep = ' ' + sym + ' '
+        prec = self.infix(sym)
+        with self._grouped(node, prec):
+            for ix, expr in enumerate(node.values):
+                if ix > 0:
+                    wr(' ' + sym + ' ')
+                self.operand(expr, prec if ix == 0 else prec + 1)
 
     operator = {ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
-                ast.Mod: '%', ast.Pow: '**',
+                ast.Mod: '%',
                 ast.LShift: '<<', ast.RShift: '>>',
                 ast.BitOr: '|',
-                #ast.BitXor: '@@',
+                ast.BitXor: '^',
                 ast.BitAnd: '&',
-                #ast.FloorDiv: '@@'
                 }
 
+    prefix_operator = {ast.Not: '!', ast.USub: '-', ast.UAdd: '+',
+                       ast.Invert: '~'}
+
     def _op(self, op):
         cls = op.__class__
         limitation(cls in self.operator)
@@ -910,23 +3181,23 @@ class PyToScala(ast.NodeVisitor,
                  | RShift | BitOr | BitXor | BitAnd | FloorDiv
         '''
         wr = self._sync(node)
-        wr('(')  # parens necessary?
-        self.visit(node.left)
-        wr(' ')
-        wr(self._op(node.op))
-        wr(' ')
-        self.visit(node.right)
-        wr(')')
+        for node in self.numeric_binop(wr, self.format_literal(wr, [node])):
+            op = self._op(node.op)
+            with self._grouped(node, self.infix(op)):
+                self.infix_operands(wr, node.left, op, node.right)
 
     def visit_UnaryOp(self, node):
         '''UnaryOp(unaryop op, expr operand)
         unaryop = Invert | Not | UAdd | USub
         '''
-        limitation(isinstance(node.op, ast.Not))
-
         wr = self._sync(node)
-        wr('! ')
-        self.visit(node.operand)
+        op = self.prefix_operator[node.op.__class__]
+        with self._grouped(node, self.prefix):
+            wr(op)
+            if op == '!':
+                wr(' ')
+            # Scala takes one prefix operator per operand: -(-x).
+            self.operand(node.operand, self.simple)
 
     def visit_Lambda(self, node):
         '''Lambda(arguments args, expr body)
@@ -938,19 +3209,21 @@ class PyToScala(ast.NodeVisitor,
                   and we don't have a convention for overriding that.
         '''
         wr = self._sync(node)
-        self.lambda_expr(wr, node)
+        with self._grouped(node, self.simple if node.args.defaults
+                           else self.lowest):
+            self.lambda_expr(wr, node)
 
     def visit_IfExp(self, node):
         '''IfExp(expr test, expr body, expr orelse)
         '''
         wr = self._sync(node)
-        wr('if (')
-        self.visit(node.test)
-        wr(') { ')
-        self.visit(node.body)
-        wr(' } else { ')
-        self.visit(node.orelse)
-        wr(' }')
+        with self._grouped(node, self.lowest):
+            wr('if (')
+            self.visit(node.test)
+            wr(') ')
+            self.operand(node.body, self.lowest + 1)
+            wr(' else ')
+            self.operand(node.orelse, self.lowest + 1)
 
     def visit_Dict(self, node):
         wr = self._sync(node)
@@ -958,9 +3231,7 @@ class PyToScala(ast.NodeVisitor,
         for ix, (k, v) in enumerate(zip(node.keys, node.values)):
             if ix > 0:
                 wr(', ')
-            self.visit(k)
-            wr(' -> ')
-            self.visit(v)
+            self.infix_operands(wr, k, '->', v)
         wr(')')
 
     def visit_ListComp(self, node):
@@ -968,25 +3239,22 @@ class PyToScala(ast.NodeVisitor,
 
         comprehension = (expr target, expr iter, expr* ifs)
         '''
-        wr = self._sync(node)
-        wr('(for (')
-        first = True
-        for gen in node.generators:
-            if not first:
-                wr('; ')
-            else:
-                first = False
-            self.visit(gen.target)
-            wr(' <- ')
-            self.visit(gen.iter)
-            if gen.ifs:
-                limitation(len(gen.ifs) == 1)
-                wr(' if ')
-                self.visit(gen.ifs[0])
+        self.comprehension(node, lazy=id(node) in self._read_only)
 
-        wr(') yield ')
-        self.visit(node.elt)
-        wr(')')
+    def visit_GeneratorExp(self, node):
+        '''GeneratorExp(expr elt, comprehension* generators)
+        '''
+        self.comprehension(node, lazy=True)
+
+    def visit_DictComp(self, node):
+        '''DictComp(expr key, expr value, comprehension* generators)
+        '''
+        self.built(node, [node.key, node.value])
+
+    def visit_SetComp(self, node):
+        '''SetComp(expr elt, comprehension* generators)
+        '''
+        self.built(node, [node.elt])
 
     def visit_Yield(self, node):
         '''Yield(expr? value)
@@ -1002,32 +3270,39 @@ class PyToScala(ast.NodeVisitor,
         compop = Eq | NotEq | Lt | LtE | Gt | GtE | Is | IsNot | In | NotIn
         '''
         wr = self._sync(node)
-        sep = ''
-        left = node.left
-        for op, expr in zip(node.ops, node.comparators):
-            wr(sep)
-            if op.__class__ in (ast.In, ast.NotIn):
-                if op.__class__ == ast.NotIn:
-                    wr('! ')
-                self.visit(expr)
-                # TODO: consider __contains__ and implicit mapping to PySeq
-                wr('.contains(')
-                self.visit(node.left)
-                wr(')')
-            else:
-                sym = {ast.Eq: '==',
-                       ast.NotEq: '!=',
-                       ast.Lt: '<',
-                       ast.LtE: '<=',
-                       ast.Gt: '>',
-                       ast.GtE: '>=',
-                       ast.Is: 'eq',
-                       ast.IsNot: '!='}[op.__class__]
-                self.visit(left)
-                wr(' ' + sym + ' ')
-                self.visit(expr)
-            left = expr
-            sep = ' && '
+        chained = len(node.ops) > 1
+        and_prec = self.infix('&&')
+        syms = [{ast.Eq: '==',
+                 ast.NotEq: '!=',
+                 ast.Lt: '<',
+                 ast.LtE: '<=',
+                 ast.Gt: '>',
+                 ast.GtE: '>=',
+                 ast.Is: 'eq',
+                 ast.IsNot: '!=',
+                 ast.NotIn: '!',
+                 ast.In: '.'}[op.__class__] for op in node.ops]
+        precs = [self.prefix if sym == '!' else
+                 self.simple if sym == '.' else
+                 self.infix(sym) for sym in syms]
+        with self._grouped(node, and_prec if chained else precs[0]):
+            left = node.left
+            for ix, (sym, expr) in enumerate(zip(syms, node.comparators)):
+                if ix > 0:
+                    wr(' && ')
+                with self._paren(chained and precs[ix] <= and_prec):
+                    if sym in ('!', '.'):
+                        if sym == '!':
+                            wr('! ')
+                        self.operand(expr, self.simple)
+                        # TODO: consider __contains__ and implicit
+                        # mapping to PySeq
+                        wr('.contains(')
+                        self.visit(node.left)
+                        wr(')')
+                    else:
+                        self.infix_operands(wr, left, sym, expr)
+                left = expr
 
     def visit_Call(self, node):
         '''Call(expr func, expr* args, keyword* keywords,
@@ -1035,10 +3310,16 @@ class PyToScala(ast.NodeVisitor,
            keyword = (identifier arg, expr value)'''
 
         wr = self._sync(node)
-
-        for node in self.reify(wr, self.typed_expr(wr, [node])):
+        if (isinstance(node.func, ast.Name) and
+                node.func.id in self.reading_functions):
+            for arg in node.args:
+                self.read_only(arg)
+
+        for node in self.builder_calls(
+                wr, self.reify(wr, self.typed_expr(
+                    wr, self.hoisted_pattern(wr, [node])))):
             self.adjust_class_call(wr, node.func)
-            self.visit(node.func)
+            self.operand(node.func, self.simple)
             wr('(')
             ax = len(node.args)
             self._items(wr, node.args)
@@ -1067,17 +3348,19 @@ class PyToScala(ast.NodeVisitor,
 
     def visit_Num(self, node):
         wr = self._sync(node)
-        wr(str(node.n))
+        with self._grouped(node, self.prefix if node.n < 0 else self.simple):
+            wr(scala_int(node.n) if type(node.n) in (int, long)
+               else repr(node.n))
 
     def visit_Str(self, node):
         wr = self._sync(node)
-        wr('"' + node.s.encode("string_escape").replace('"', '\\"') + '"')
+        wr(scala_str(node.s))
 
     def visit_Attribute(self, node):
         '''Attribute(expr value, identifier attr, expr_context ctx)
         '''
         wr = self._sync(node)
-        self.visit(node.value)
+        self.operand(node.value, self.simple)
         wr('.')
         wr(fix_kw(node.attr))
 
@@ -1085,16 +3368,11 @@ class PyToScala(ast.NodeVisitor,
         '''Subscript(expr value, slice slice, expr_context ctx)
         '''
         wr = self._sync(node)
-        self.visit(node.value)
         slice = node.slice
         sk = slice.__class__
         ctxk = node.ctx.__class__
-
-        def lower0():
-            if slice.lower:
-                self.visit(slice.lower)
-            else:
-                wr('0')
+        if sk != ast.Slice:
+            self.operand(node.value, self.simple)
 
         if sk == ast.Index and ctxk in (ast.Load, ast.Store):
             wr('(')
@@ -1104,18 +3382,7 @@ class PyToScala(ast.NodeVisitor,
             wr(' -= ')
             self.visit(slice.value)
         elif sk == ast.Slice and ctxk == ast.Load:
-            limitation(not slice.step)
-            if slice.upper:
-                wr('.slice(')
-                lower0()
-                wr(', ')
-                self.visit(slice.upper)
-            elif slice.lower:
-                wr('.drop(')
-                self.visit(slice.lower)
-            else:
-                wr('.drop(0')
-            wr(')')
+            self.slice_load(wr, node)
         else:
             limitation(True)
 
@@ -1186,11 +3453,98 @@ class PyToScala(ast.NodeVisitor,
             wr(node.name)
 
     def generic_visit(self, node):
-        import pdb; pdb.set_trace()
+        if _debugging[-1]:
+            import pdb; pdb.set_trace()
         raise NotImplementedError('need visitor for: %s %s' %
                                   (node.__class__.__name__, node))
 
 
+def scala_str(s):
+    return '"' + s.encode("string_escape").replace('"', '\\"') + '"'
+
+
+def scala_int(n):
+    '''Scala literal for a python integer, by its size.
+
+    >>> scala_int(7), scala_int(2 ** 40), scala_int(2 ** 70)
+    ('7', '1099511627776L', 'BigInt("1180591620717411303424")')
+    '''
+    width = ranges.width((n, n))
+    return (str(n) if width == 'Int' else
+            str(n) + 'L' if width == 'Long' else
+            'BigInt("%d")' % n)
+
+
+def is_int_constant(expr):
+    '''Is expr integer arithmetic on literals only?
+    '''
+    return not [node for node in ast.walk(expr)
+                if not isinstance(node, (ast.BinOp, ast.UnaryOp, ast.Num,
+                                         ast.operator, ast.unaryop)) or
+                (isinstance(node, ast.Num) and
+                 type(node.n) not in (int, long))]
+
+
+def tuple_types(t):
+    '''Types of the parts of a scala tuple type.
+
+    >>> tuple_types('(Int, Dict[String, (Int, Long)])')
+    ['Int', 'Dict[String, (Int, Long)]']
+    >>> tuple_types('Seq[Int]')
+    []
+    '''
+    if not (t.startswith('(') and t.endswith(')')):
+        return []
+    parts, depth, start = [], 0, 1
+    for ix, c in enumerate(t[1:-1], 1):
+        if c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            parts.append(t[start:ix].strip())
+            start = ix + 1
+    return parts + [t[start:-1].strip()]
+
+
+def class_ref_name(expr):
+    '''KLUDGE: distinguish f() from new F() by capitalization.
+    '''
+    names = [getName(expr)
+             for (cls, getName) in
+             [(ast.Name, lambda n: n.id),
+              (ast.Attribute, lambda n: n.attr)]
+             if isinstance(expr, cls)]
+    return len([name for name in names if name[0].isupper()]) > 0
+
+
+def dotted_name(expr):
+    '''Dotted name of a chain of attributes, or None.
+
+    >>> dotted_name(ast.parse('StringIO.StringIO').body[0].value)
+    'StringIO.StringIO'
+    '''
+    if isinstance(expr, ast.Name):
+        return expr.id
+    if isinstance(expr, ast.Attribute):
+        base = dotted_name(expr.value)
+        return base + '.' + expr.attr if base else None
+    return None
+
+
+def mentions(node, name):
+    return [1 for n in ast.walk(node)
+            if isinstance(n, ast.Name) and n.id == name]
+
+
+def nested_mentions(stmts, name):
+    '''Functions and classes defined in stmts that mention name.
+    '''
+    return [n for stmt in stmts for n in ast.walk(stmt)
+            if isinstance(n, (ast.FunctionDef, ast.ClassDef, ast.Lambda)) and
+            mentions(n, name)]
+
+
 def fix_kw(n):
     return n + ('_' if n in ('match',) else '')
 
@@ -1213,9 +3567,26 @@ def tmatch(candidate, pattern):
         if not tmatch(getattr(candidate, n), getattr(pattern, n))]
 
 
+_debugging = [True]
+
+
+@contextmanager
+def debugging(interactive):
+    '''Whether `limitation` and unhandled nodes stop in the debugger.
+
+    Worker processes forked by `convert` inherit the setting.
+    '''
+    _debugging.append(interactive)
+    try:
+        yield
+    finally:
+        _debugging.pop()
+
+
 def limitation(t):
     if not t:
-        import pdb; pdb.set_trace()
+        if _debugging[-1]:
+            import pdb; pdb.set_trace()
         raise NotImplementedError
 
 
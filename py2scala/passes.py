@@ -0,0 +1,395 @@
+'''passes -- rewrite python syntax trees before conversion
+
+Passes are `ast.NodeTransformer` classes, registered by name and
+run in order of registration between parsing and emission::
+
+  >>> t = ast.parse('x = 2 * 3 + 1\\nif x:\\n    "inert"\\n')
+  >>> stats = []
+  >>> t = run(t, ['fold', 'inert'], stats)
+  >>> t.body[0].value.n
+  7
+  >>> t.body[1].body[0].__class__.__name__
+  'Pass'
+  >>> [(name, delta) for (name, seconds, delta) in stats]
+  [('fold', -6), ('inert', -1)]
+
+'''
+
+import ast
+import logging
+import operator
+import time
+from ast import copy_location as loc
+
+log = logging.getLogger(__name__)
+
+registry = []
+
+
+def register(name, default=True):
+    '''Class decorator: add a pass to the registry.
+    '''
+    def add(cls):
+        registry.append((name, cls, default))
+        return cls
+    return add
+
+
+def selected(enable=(), disable=()):
+    '''Names of the passes to run: the defaults, plus enable,
+    less disable.
+
+    >>> selected(disable=['inert'])
+    ['fold', 'fp-idioms', 'fuse']
+    '''
+    unknown = [name for name in list(enable) + list(disable)
+               if name not in [n for (n, _, _) in registry]]
+    if unknown:
+        raise ValueError('unknown passes: %s' % ', '.join(unknown))
+    return [name for (name, _, default) in registry
+            if (default or name in enable) and name not in disable]
+
+
+def run(tree, names, stats=None, clock=time.time, skip=()):
+    '''Run the named passes over tree.
+
+    Passes give each node they make a location (`ast.copy_location`).
+
+    A top-level statement can be left alone, to be rewritten later on
+    its own: apart from the imports before it, what passes do to a
+    statement does not depend on the rest of the module::
+
+      >>> t = ast.parse('x = 1 + 1\\ndef f():\\n    return 2 + 2\\n')
+      >>> t = run(t, ['fold'], skip=set([id(t.body[1])]))
+      >>> t.body[0].value.n, t.body[1].body[0].value.__class__.__name__
+      (2, 'BinOp')
+
+    :param stats: list to which (name, seconds, node count delta)
+                  is appended for each pass
+    :param skip: ids of top-level statements to leave alone
+    '''
+    held = {}
+    for (ix, stmt) in enumerate(tree.body):
+        if id(stmt) in skip:
+            tree.body[ix] = loc(ast.Pass(), stmt)
+            held[id(tree.body[ix])] = stmt
+    tree = _run(tree, names, stats, clock)
+    if held:
+        tree.body = [held.get(id(stmt), stmt) for stmt in tree.body]
+    return tree
+
+
+def _run(tree, names, stats, clock):
+    for (name, cls, _) in registry:
+        if name not in names:
+            continue
+        if stats is None:
+            tree = cls().visit(tree)
+            continue
+        before, t0 = node_count(tree), clock()
+        tree = cls().visit(tree)
+        seconds, delta = clock() - t0, node_count(tree) - before
+        log.debug('pass %s: %.4fs, %+d nodes', name, seconds, delta)
+        stats.append((name, seconds, delta))
+    return tree
+
+
+def node_count(tree):
+    return sum(1 for _ in ast.walk(tree))
+
+
+@register('fold')
+class FoldConstants(ast.NodeTransformer):
+    '''Fold arithmetic on numeric literals and concatenation of
+    string literals.
+
+    Folding follows python semantics; results that do not fit a
+    scala Int (or are not finite) are left alone.
+
+    >>> t = FoldConstants().visit(ast.parse('-(1 + 2)'))
+    >>> t.body[0].value.n
+    -3
+    >>> t = FoldConstants().visit(ast.parse('"a" + "b"'))
+    >>> t.body[0].value.s
+    'ab'
+    >>> t = FoldConstants().visit(ast.parse('2 ** 40'))
+    >>> t.body[0].value.__class__.__name__
+    'BinOp'
+    '''
+    binary = {ast.Add: operator.add, ast.Sub: operator.sub,
+              ast.Mult: operator.mul, ast.FloorDiv: operator.floordiv,
+              ast.Mod: operator.mod, ast.Pow: operator.pow,
+              ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+              ast.BitOr: operator.or_, ast.BitAnd: operator.and_,
+              ast.BitXor: operator.xor}
+    unary = {ast.USub: operator.neg, ast.UAdd: operator.pos,
+             ast.Invert: operator.invert}
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        left, right = node.left, node.right
+        if isinstance(left, ast.Str) and isinstance(right, ast.Str):
+            if isinstance(node.op, ast.Add):
+                return loc(ast.Str(s=left.s + right.s), node)
+        elif (isinstance(left, ast.Num) and isinstance(right, ast.Num) and
+              node.op.__class__ in self.binary):
+            try:
+                n = self.binary[node.op.__class__](left.n, right.n)
+            except (ArithmeticError, ValueError):
+                return node
+            return self._num(n, node)
+        return node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if (isinstance(node.operand, ast.Num) and
+                node.op.__class__ in self.unary):
+            return self._num(self.unary[node.op.__class__](node.operand.n),
+                             node)
+        return node
+
+    @classmethod
+    def _num(cls, n, node,
+             lo=-2 ** 31, hi=2 ** 31):
+        if isinstance(n, float):
+            ok = abs(n) < float('inf')
+        else:
+            ok = isinstance(n, int) and lo <= n < hi
+        return loc(ast.Num(n=n), node) if ok else node
+
+
+@register('inert')
+class DropInertStrings(ast.NodeTransformer):
+    '''Drop string expression statements other than docstrings.
+
+    Only statements are visited; expressions cannot contain them.
+    '''
+    def generic_visit(self, node):
+        doc_ok = isinstance(node, (ast.Module, ast.FunctionDef,
+                                   ast.ClassDef))
+        for field in ('body', 'orelse', 'finalbody', 'handlers'):
+            body = getattr(node, field, None)
+            if not isinstance(body, list) or not body:
+                continue
+            for stmt in body:
+                self.visit(stmt)
+            if field == 'handlers':
+                continue
+            kept = [stmt for (ix, stmt) in enumerate(body)
+                    if not (isinstance(stmt, ast.Expr) and
+                            isinstance(stmt.value, ast.Str) and
+                            not (doc_ok and field == 'body' and ix == 0))]
+            if not kept and not isinstance(node, ast.Module):
+                kept = [loc(ast.Pass(), body[0])]
+            setattr(node, field, kept)
+        return node
+
+
+@register('fp-idioms')
+class FpIdioms(ast.NodeTransformer):
+    '''Normalize uses of `partial` and of the `fp` module to the forms
+    the emitter recognizes: `pf_(f)`, `typed(x, 'T')` and `classOf(C)`.
+
+    Imports that only serve these idioms are dropped.
+
+    >>> t = FpIdioms().visit(ast.parse(
+    ...     'from functools import partial\\n'
+    ...     'from py2scala import fp\\n'
+    ...     'g = partial(f)\\n'
+    ...     'x = fp.typed(y, "Int")\\n'))
+    >>> [stmt.value.func.id for stmt in t.body[1:]]
+    ['pf_', 'typed']
+    '''
+    idioms = ('typed', 'classOf')
+
+    def __init__(self, partial_app='pf_'):
+        self._partial_app = partial_app
+        self._partial = set(['functools.partial'])
+        self._fp_modules = set()
+        self._idiom_names = {}
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.name == 'functools':
+                self._partial.add((alias.asname or alias.name) + '.partial')
+            if alias.name.split('.')[-1] == 'fp':
+                self._fp_modules.add(alias.asname or alias.name)
+        return node
+
+    def visit_ImportFrom(self, node):
+        names = node.names
+        if node.module == 'functools' and node.level == 0:
+            for alias in names:
+                if alias.name == 'partial':
+                    self._partial.add(alias.asname or alias.name)
+            names = [alias for alias in names if alias.name != 'partial']
+        elif (node.module or '').split('.')[-1] == 'fp':
+            for alias in names:
+                if alias.name in self.idioms:
+                    self._idiom_names[alias.asname or alias.name] = alias.name
+            names = [alias for alias in names if alias.name not in self.idioms]
+        else:
+            for alias in names:
+                if alias.name == 'fp':
+                    self._fp_modules.add(alias.asname or alias.name)
+        if not names:
+            return None
+        node.names = names
+        return node
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        name = dotted(node.func)
+        if name in self._partial and len(node.args) == 1 and not (
+                node.keywords or node.starargs or node.kwargs):
+            node.func = loc(ast.Name(id=self._partial_app, ctx=ast.Load()),
+                            node.func)
+        elif name in self._idiom_names:
+            node.func = loc(ast.Name(id=self._idiom_names[name],
+                                     ctx=ast.Load()), node.func)
+        elif (name and '.' in name and
+              name.rsplit('.', 1)[0] in self._fp_modules and
+              name.rsplit('.', 1)[1] in self.idioms):
+            node.func = loc(ast.Name(id=name.rsplit('.', 1)[1],
+                                     ctx=ast.Load()), node.func)
+        return node
+
+
+@register('fuse')
+class FuseComprehensions(ast.NodeTransformer):
+    '''Fuse chains of comprehensions, `map` and `filter` into one
+    comprehension, so the emitter makes one pass with no intermediate
+    collections.
+
+    `map` and `filter` of a one-parameter lambda become comprehensions
+    (`filter` only where its result is iterated, since python gives
+    back a string or tuple when filtering one), and a comprehension
+    over another is merged into it. The inner element is bound by
+    iterating over a one-item list, which the emitter writes as a
+    value definition::
+
+      >>> def shape(comp):
+      ...     return [(g.target.id, g.iter.__class__.__name__, len(g.ifs))
+      ...             for g in comp.generators]
+      >>> t = FuseComprehensions().visit(ast.parse(
+      ...     '[f(x) for x in [g(y) for y in ys] if p(x)]'))
+      >>> shape(t.body[0].value)  # [f(x) for y in ys for x in [g(y)] if p(x)]
+      [('y', 'Name', 0), ('x', 'List', 1)]
+      >>> t = FuseComprehensions().visit(ast.parse(
+      ...     'map(lambda x: x * 2, filter(lambda x: x > 0, xs))'))
+      >>> shape(t.body[0].value)  # [x * 2 for x in xs if x > 0]
+      [('x', 'Name', 1)]
+
+    Where the inner comprehension binds a name the outer one also
+    uses for something else, the two are left apart.
+    '''
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if not ((_call_of(node, 'map') or _call_of(node, 'filter')) and
+                len(node.args) == 2):
+            return node
+        node.args[1] = self._filter_iterated(node.args[1])
+        if node.func.id == 'map' and isinstance(node.args[0], ast.Lambda):
+            return self._fuse(self._from_lambda(node, node.args[0],
+                                                filtered=False))
+        return node
+
+    def visit_ListComp(self, node):
+        self.generic_visit(node)
+        for gen in node.generators:
+            gen.iter = self._filter_iterated(gen.iter)
+        return self._fuse(node)
+
+    visit_GeneratorExp = visit_SetComp = visit_DictComp = visit_ListComp
+
+    def visit_For(self, node):
+        self.generic_visit(node)
+        node.iter = self._filter_iterated(node.iter)
+        return node
+
+    def _filter_iterated(self, expr):
+        '''Rewrite filter(lambda x: ..., xs) where it is iterated.
+        '''
+        if not (_call_of(expr, 'filter') and len(expr.args) == 2 and
+                isinstance(expr.args[0], ast.Lambda)):
+            return expr
+        return self._fuse(self._from_lambda(expr, expr.args[0],
+                                            filtered=True))
+
+    def _from_lambda(self, call, lam, filtered):
+        args = lam.args
+        if (len(args.args) != 1 or args.vararg or args.kwarg or
+                args.defaults or not isinstance(args.args[0], ast.Name)):
+            return call
+        name = args.args[0].id
+        gen = ast.comprehension(
+            target=loc(ast.Name(id=name, ctx=ast.Store()), lam),
+            iter=call.args[1],
+            ifs=[lam.body] if filtered else [])
+        elt = (loc(ast.Name(id=name, ctx=ast.Load()), lam) if filtered
+               else lam.body)
+        return loc(ast.ListComp(elt=elt, generators=[gen]), call)
+
+    def _fuse(self, node):
+        if not isinstance(node, (ast.ListComp, ast.GeneratorExp,
+                                 ast.SetComp, ast.DictComp)):
+            return node
+        generators = []
+        for (ix, gen) in enumerate(node.generators):
+            inner = gen.iter
+            if not (isinstance(inner, (ast.ListComp, ast.GeneratorExp)) and
+                    self._fusible(node, ix)):
+                generators.append(gen)
+                continue
+            generators.extend(inner.generators)
+            if _same_name(gen.target, inner.elt):
+                inner.generators[-1].ifs.extend(gen.ifs)
+            else:
+                generators.append(ast.comprehension(
+                    target=gen.target,
+                    iter=loc(ast.List(elts=[inner.elt], ctx=ast.Load()),
+                             inner.elt),
+                    ifs=gen.ifs))
+        node.generators = generators
+        return node
+
+    def _fusible(self, node, ix):
+        '''Would names bound by the comprehension that generator ix
+        iterates over capture any used by the rest of node?
+        '''
+        gen = node.generators[ix]
+        inner = gen.iter
+        bound = set(name for g in inner.generators
+                    for name in _names(g.target))
+        if _same_name(gen.target, inner.elt):
+            bound.discard(gen.target.id)
+        results = ([node.key, node.value] if isinstance(node, ast.DictComp)
+                   else [node.elt])
+        rest = results + [gen.target] + gen.ifs + [
+            part for (jx, other) in enumerate(node.generators) if jx != ix
+            for part in [other.target, other.iter] + other.ifs]
+        return not [part for part in rest if bound & _names(part)]
+
+
+def _names(node):
+    return set(n.id for n in ast.walk(node) if isinstance(n, ast.Name))
+
+
+def _same_name(target, expr):
+    return (isinstance(target, ast.Name) and isinstance(expr, ast.Name) and
+            target.id == expr.id)
+
+
+def _call_of(expr, name):
+    return (isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name) and
+            expr.func.id == name and
+            not (expr.keywords or expr.starargs or expr.kwargs))
+
+
+def dotted(expr):
+    if isinstance(expr, ast.Name):
+        return expr.id
+    if isinstance(expr, ast.Attribute):
+        base = dotted(expr.value)
+        return base and base + '.' + expr.attr
+    return None
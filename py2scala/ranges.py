@@ -0,0 +1,388 @@
+r'''ranges -- bounds of integer variables, to choose their scala types
+
+Python integers do not overflow; scala's `Int` and `Long` do. Rather
+than use `BigInt` throughout, which is slow, each variable of a
+function gets the narrowest type that holds every value it takes, as
+far as literals, `range()` limits, `len()` and arithmetic on such
+values show::
+
+  >>> body = ast.parse('n = len(xs)\n'
+  ...                  'for i in range(n):\n'
+  ...                  '    last = i + 1\n'
+  ...                  'big = 1 << 40\n'
+  ...                  'var, total = None, 0\n'
+  ...                  'for x in xs:\n'
+  ...                  '    total += x\n').body
+  >>> sorted((name, width(iv)) for (name, iv) in analyze(body).items())
+  ... # doctest: +NORMALIZE_WHITESPACE
+  [('big', 'Long'), ('i', 'Int'), ('last', 'Int'), ('n', 'Int'),
+   ('total', None), ('var', None), ('x', None)]
+
+A width of None means the analysis found no bound; the converter then
+checks arithmetic for overflow rather than widen to `BigInt`.
+
+Each variable's interval covers all the values assigned to it anywhere
+in the function, so loops are analysed by iterating to a fixed point,
+with bounds that keep moving taken as unbounded. One kind of loop
+keeps a bound: a counter stepped up by a bounded amount under a
+`while` test against a bounded limit::
+
+  >>> body = ast.parse('var, ix = None, 0\n'
+  ...                  'while ix < len(xs):\n'
+  ...                  '    ix += 1\n').body
+  >>> width(analyze(body)['ix'])
+  'Int'
+
+Likewise a count of the items of a collection, one at a time::
+
+  >>> body = ast.parse('var, n = None, 0\n'
+  ...                  'for x in xs:\n'
+  ...                  '    if x:\n'
+  ...                  '        n += 1\n').body
+  >>> width(analyze(body)['n'])
+  'Int'
+
+'''
+
+import ast
+
+INF = float('inf')
+TOP = (-INF, INF)
+INT = (-2 ** 31, 2 ** 31 - 1)
+LONG = (-2 ** 63, 2 ** 63 - 1)
+
+#: Rounds of analysis before moving bounds are taken as unbounded.
+WIDEN_AFTER = 3
+
+
+def width(iv):
+    '''Narrowest scala integer type for an interval, or None if it's
+    unbounded.
+
+      >>> width((0, 10)), width((0, 2 ** 40)), width((0, 2 ** 70))
+      ('Int', 'Long', 'BigInt')
+    '''
+    if iv is None or within(iv, INT):
+        return 'Int'
+    if within(iv, LONG):
+        return 'Long'
+    return None if INF in (-iv[0], iv[1]) else 'BigInt'
+
+
+def within(iv, bounds):
+    return iv is not None and bounds[0] <= iv[0] and iv[1] <= bounds[1]
+
+
+def join(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), max(a[1], b[1])
+
+
+def analyze(stmts, known={}):
+    '''Find the interval of each name assigned in a function body.
+
+    :param known: intervals of names from outside, such as parameters
+    :return: {name: (lo, hi)}; None for names never assigned a value
+    '''
+    binds = list(bindings(stmts))
+    env = dict(known)
+    env.update((name, known.get(name)) for (name, _) in binds)
+    for round in range(WIDEN_AFTER + 4):
+        before = dict(env)
+        for name, value in binds:
+            env[name] = join(env[name], value(env))
+        if env == before:
+            break
+        if round >= WIDEN_AFTER:
+            for name in env:
+                env[name] = widen(before[name], env[name])
+
+    # Widening overshoots bounds such as those of while loop counters;
+    # recomputing each value from the result recovers them.
+    for _ in range(2):
+        narrowed = dict(known)
+        narrowed.update((name, known.get(name)) for (name, _) in binds)
+        for name, value in binds:
+            narrowed[name] = join(
+                narrowed[name],
+                counted(name, value, binds, env, known)
+                if hasattr(value, 'counted') else value(env))
+        env = narrowed
+    return dict((name, env[name]) for (name, _) in binds)
+
+
+def widen(before, after):
+    if before is None or after is None:
+        return after
+    return (-INF if after[0] < before[0] else after[0],
+            INF if after[1] > before[1] else after[1])
+
+
+def constant(iv):
+    return lambda env: iv
+
+
+def bindings(stmts, loops=()):
+    '''Assignments to names in a suite, outside nested definitions.
+
+    :param loops: enclosing loops
+    :return: (name, value) pairs; value is a function from intervals
+             of names to the interval of the value assigned
+    '''
+    for stmt in stmts:
+        for comp in comprehensions(stmt):
+            for gen in comp.generators:
+                for found in bind_iter(gen.target, gen.iter):
+                    yield found
+        if isinstance(stmt, (ast.FunctionDef, ast.ClassDef)):
+            yield stmt.name, constant(TOP)
+            continue
+        if isinstance(stmt, ast.Assign):
+            for target in stmt.targets:
+                for found in bind(target, stmt.value):
+                    yield found
+        elif (isinstance(stmt, ast.AugAssign) and
+              isinstance(stmt.target, ast.Name)):
+            yield stmt.target.id, augmented(stmt, loops)
+        elif isinstance(stmt, ast.For):
+            for found in bind_iter(stmt.target, stmt.iter):
+                yield found
+        elif isinstance(stmt, ast.With) and stmt.optional_vars:
+            for found in bind(stmt.optional_vars, None):
+                yield found
+        elif isinstance(stmt, (ast.Import, ast.ImportFrom)):
+            for alias in stmt.names:
+                yield (alias.asname or alias.name.split('.')[0],
+                       constant(TOP))
+
+        inner = (loops + (stmt,) if isinstance(stmt, (ast.While, ast.For))
+                 else loops)
+        for field in ('body', 'orelse', 'finalbody'):
+            for found in bindings(getattr(stmt, field, []), inner):
+                yield found
+        for handler in getattr(stmt, 'handlers', []):
+            if handler.name:
+                for found in bind(handler.name, None):
+                    yield found
+            for found in bindings(handler.body, inner):
+                yield found
+
+
+def comprehensions(stmt):
+    for _, value in ast.iter_fields(stmt):
+        for expr in (value if isinstance(value, list) else [value]):
+            if isinstance(expr, ast.expr):
+                for node in ast.walk(expr):
+                    if isinstance(node, (ast.ListComp, ast.GeneratorExp,
+                                         ast.SetComp, ast.DictComp)):
+                        yield node
+
+
+def bind(target, value):
+    if isinstance(target, ast.Name):
+        yield target.id, (constant(TOP) if value is None else
+                          lambda env: interval(value, env))
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        values = (value.elts if isinstance(value, (ast.Tuple, ast.List)) and
+                  len(value.elts) == len(target.elts)
+                  else [None] * len(target.elts))
+        for elt, elt_value in zip(target.elts, values):
+            for found in bind(elt, elt_value):
+                yield found
+
+
+def bind_iter(target, it):
+    '''Bind the target of a for loop or comprehension.
+    '''
+    call = it.func.id if (isinstance(it, ast.Call) and
+                          isinstance(it.func, ast.Name)) else None
+    if isinstance(target, ast.Name) and call in ('range', 'xrange'):
+        yield target.id, lambda env: range_interval(it.args, env)
+    elif (isinstance(target, ast.Tuple) and len(target.elts) == 2 and
+          call == 'enumerate'):
+        for found in bind(target.elts[0], None):
+            yield found[0], constant((0, INT[1]))
+        for found in bind(target.elts[1], None):
+            yield found
+    else:
+        for found in bind(target, None):
+            yield found
+
+
+def range_interval(args, env):
+    ivs = [interval(arg, env) for arg in args]
+    if None in ivs:
+        return None
+    if len(ivs) == 1:
+        return 0, ivs[0][1] - 1
+    start, stop = ivs[:2]
+    step = ivs[2] if len(ivs) > 2 else (1, 1)
+    if step[0] > 0:
+        return start[0], stop[1] - 1
+    if step[1] < 0:
+        return stop[0] + 1, start[1]
+    return join(start, stop)
+
+
+def augmented(stmt, loops):
+    '''Interval of `x op= value`, bounded by the test of a `while`
+    loop in which that is the only assignment to x.
+
+    Where that is the only assignment to x in the one loop over a
+    collection around it, x counts, and the value notes the step; see
+    `counted`.
+    '''
+    name = stmt.target.id
+    expr = ast.BinOp(left=ast.Name(id=name, ctx=ast.Load()),
+                     op=stmt.op, right=stmt.value)
+
+    def sole(loop):
+        return len([1 for (found, _) in bindings(loop.body)
+                    if found == name]) == 1
+
+    limits = [(loop.test.ops[0].__class__, loop.test.comparators[0])
+              for loop in loops
+              if isinstance(loop, ast.While) and
+              isinstance(loop.test, ast.Compare) and
+              len(loop.test.ops) == 1 and
+              isinstance(loop.test.left, ast.Name) and
+              loop.test.left.id == name and sole(loop)]
+
+    def value(env):
+        iv, step = interval(expr, env), interval(stmt.value, env)
+        if iv is None or step is None:
+            return iv
+        lo, hi = iv
+        for op, limit in limits:
+            bound = interval(limit, env)
+            if bound is None:
+                continue
+            if isinstance(stmt.op, ast.Add) and step[0] >= 0:
+                if op is ast.Lt:
+                    hi = min(hi, bound[1] - 1 + step[1])
+                elif op is ast.LtE:
+                    hi = min(hi, bound[1] + step[1])
+            elif isinstance(stmt.op, ast.Sub) and step[0] >= 0:
+                if op is ast.Gt:
+                    lo = max(lo, bound[0] + 1 - step[1])
+                elif op is ast.GtE:
+                    lo = max(lo, bound[0] - step[1])
+        return lo, hi
+
+    if (len(loops) == 1 and isinstance(loops[0], ast.For) and
+            isinstance(loops[0].iter, (ast.Name, ast.Attribute)) and
+            isinstance(stmt.op, ast.Add) and sole(loops[0])):
+        value.counted = stmt.value
+    return value
+
+
+def counted(name, value, binds, env, known):
+    '''Bound a count of the items of a collection, of which there are
+    no more than the largest Int, by the values of x before the loop.
+    '''
+    iv, step = value(env), interval(value.counted, env)
+    if iv is None or step is None or step[0] < 0:
+        return iv
+    start = reduce(join, [other(env) for (found, other) in binds
+                          if found == name and other is not value],
+                   known.get(name))
+    if start is None:
+        return iv
+    return iv[0], min(iv[1], start[1] + step[1] * INT[1])
+
+
+def interval(expr, env):
+    '''Interval of the values of an integer expression.
+
+      >>> interval(ast.parse('(x + 1) * 2 - len(s) % 3').body[0].value,
+      ...          {'x': (0, 9)})
+      (0, 20)
+
+    :param env: intervals of names; others are unbounded
+    :return: (lo, hi), with INF for no bound, or None where a name
+             has no value yet
+    '''
+    if isinstance(expr, ast.Num):
+        n = expr.n
+        return (n, n) if type(n) in (int, long) else TOP
+    if isinstance(expr, ast.Name):
+        return env.get(expr.id, TOP)
+    if isinstance(expr, ast.BinOp):
+        left, right = interval(expr.left, env), interval(expr.right, env)
+        if left is None or right is None:
+            return None
+        return arithmetic(expr.op, left, right)
+    if isinstance(expr, ast.UnaryOp):
+        iv = interval(expr.operand, env)
+        if iv is None or isinstance(expr.op, ast.Not):
+            return iv and (0, 1)
+        lo, hi = iv
+        return {ast.UAdd: (lo, hi), ast.USub: (-hi, -lo),
+                ast.Invert: (-hi - 1, -lo - 1)}[expr.op.__class__]
+    if isinstance(expr, ast.IfExp):
+        body, orelse = interval(expr.body, env), interval(expr.orelse, env)
+        return None if body is None or orelse is None else join(body, orelse)
+    if isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name):
+        return call_interval(expr.func.id, expr.args, env)
+    return TOP
+
+
+def call_interval(name, args, env):
+    if name == 'len':
+        return 0, INT[1]
+    if name == 'ord':
+        return 0, 0x10ffff
+    ivs = [interval(arg, env) for arg in args]
+    if None in ivs:
+        return None
+    if name == 'abs' and len(ivs) == 1:
+        lo, hi = ivs[0]
+        return (max(lo, -hi, 0), max(-lo, hi))
+    if name in ('min', 'max') and len(ivs) > 1:
+        pick = min if name == 'min' else max
+        return pick(lo for (lo, _) in ivs), pick(hi for (_, hi) in ivs)
+    return TOP
+
+
+def arithmetic(op, left, right):
+    '''Interval of a python integer operation.
+    '''
+    (l0, l1), (r0, r1) = left, right
+    if isinstance(op, ast.Add):
+        return l0 + r0, l1 + r1
+    if isinstance(op, ast.Sub):
+        return l0 - r1, l1 - r0
+    if isinstance(op, ast.Mult):
+        products = [0 if a * b != a * b else a * b   # 0 * INF is nan
+                    for a in (l0, l1) for b in (r0, r1)]
+        return min(products), max(products)
+    if isinstance(op, ast.FloorDiv) and r0 > 0:
+        quotients = [a if abs(a) == INF else
+                     a // b if abs(b) != INF else 0 if a >= 0 else -1
+                     for a in (l0, l1) for b in (r0, r1)]
+        return min(quotients), max(quotients)
+    if isinstance(op, ast.Mod) and r0 > 0:
+        return 0, r1 - 1
+    if isinstance(op, ast.BitAnd) and (l0 >= 0 or r0 >= 0):
+        return 0, min(hi for (lo, hi) in (left, right) if lo >= 0)
+    if isinstance(op, (ast.LShift, ast.RShift, ast.Pow)):
+        return shift(op, left, right)
+    return TOP
+
+
+def shift(op, (l0, l1), (r0, r1)):
+    '''Intervals of shifts and powers of non-negative operands, by
+    constant amounts.
+    '''
+    if l0 < 0 or r0 < 0 or r0 != r1 or r0 > 128:
+        return TOP
+    r0 = int(r0)
+    if isinstance(op, ast.RShift):
+        return (l0 if l0 == INF else int(l0) >> r0,
+                l1 if l1 == INF else int(l1) >> r0)
+    if isinstance(op, ast.LShift):
+        return (l0 * 2 ** r0, l1 * 2 ** r0)
+    return (l0 ** r0, l1 ** r0) if l1 != INF else (l0 ** r0, INF)
@@ -0,0 +1,301 @@
+r'''scala_ir -- layout of scala output, built during conversion
+
+`PyToScala` no longer writes text as it walks the python syntax tree;
+it builds a small tree of scala layout:
+
+ - text fragments (plain strings),
+ - `NEWLINE`,
+ - `Block`: `{ ... }` with its contents indented,
+ - `Paren`: parenthesized contents,
+ - `Sync`: the python location of what follows; the printer puts
+   python comments up to that line here and notes the location in
+   the source map (if it has a column),
+ - `Decls`: declarations added, once each, while converting what
+   follows, such as the vals that p2s.HoistedPatterns puts before a
+   definition.
+
+Expressions are still text: the IR can put declarations ahead of
+the code that needs them and share them, but it cannot reorder or
+rewrite expressions; that is left to rewrite passes (see passes).
+
+A `Printer` turns the layout into text, handling indentation::
+
+  >>> import StringIO
+  >>> b = Builder()
+  >>> b.write('object m ')
+  >>> with b.block():
+  ...     b.write('val x = ')
+  ...     with b.paren():
+  ...         b.write('1 + 2')
+  ...     b.newline()
+  >>> out = StringIO.StringIO()
+  >>> b.flush(Printer(out, []))
+  >>> print out.getvalue()
+  object m {
+    val x = (1 + 2)
+    }
+  <BLANKLINE>
+
+Declarations are printed where their `Decls` was made, each after a
+blank line::
+
+  >>> b = Builder()
+  >>> decls = b.decls()
+  >>> b.write('def f = x1 + x1')
+  >>> decls.add('1', 'x1', 'val x1 = 1')
+  >>> decls.add('1', 'x1', 'val x1 = 1')
+  >>> decls.get('1'), len(decls)
+  ('x1', 1)
+  >>> out = StringIO.StringIO()
+  >>> b.flush(Printer(out, []))
+  >>> print out.getvalue()
+  <BLANKLINE>
+  val x1 = 1
+  def f = x1 + x1
+
+Nodes use `__slots__`, so each takes a fraction of the memory of an
+`ast` node, and layout is discarded as soon as it is printed:
+`flush` prints what has been built so far, even inside a block that
+is still open, so a module can be emitted one top-level statement at
+a time.
+
+'''
+
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+import tokenize
+
+
+class Newline(object):
+    __slots__ = ()
+
+
+class Close(object):
+    '''End of a block whose start was already flushed.
+    '''
+    __slots__ = ()
+
+
+NEWLINE = Newline()
+CLOSE = Close()
+
+
+class Block(object):
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+
+class Paren(object):
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+
+class Sync(object):
+    __slots__ = ('line', 'col')
+
+    def __init__(self, line, col):
+        self.line = line
+        self.col = col
+
+
+class Decls(object):
+    '''Declarations by key, in the order added.
+    '''
+    __slots__ = ('names', 'items')
+
+    def __init__(self):
+        self.names = {}
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        return self.names.get(key)
+
+    def add(self, key, name, txt):
+        '''Declare name by txt, unless key is already declared.
+        '''
+        if key not in self.names:
+            self.names[key] = name
+            self.items.append(txt)
+
+
+class Builder(object):
+    def __init__(self):
+        self._stack = [[]]
+        self._parens = 0
+        self._opened = 0
+
+    def write(self, txt):
+        self._stack[-1].append(txt)
+
+    def newline(self):
+        self._stack[-1].append(NEWLINE)
+
+    def sync(self, line, col):
+        self._stack[-1].append(Sync(line, col))
+
+    def comments(self, line):
+        '''Put python comments up to line here.
+        '''
+        self._stack[-1].append(Sync(line, None))
+
+    def decls(self):
+        '''Make a place here for declarations added later.
+
+        :rtype: Decls
+        '''
+        decls = Decls()
+        self._stack[-1].append(decls)
+        return decls
+
+    @contextmanager
+    def block(self):
+        self._stack.append([])
+        yield
+        level = len(self._stack) - 1
+        items = self._stack.pop()
+        if level <= self._opened:
+            self._opened = level - 1
+            self._stack[-1].extend(items)
+            self._stack[-1].append(CLOSE)
+        else:
+            self._stack[-1].append(Block(items))
+
+    @contextmanager
+    def paren(self, needed=True):
+        if not needed:
+            yield
+            return
+        self._stack.append([])
+        self._parens += 1
+        yield
+        self._parens -= 1
+        items = self._stack.pop()
+        self._stack[-1].append(Paren(items))
+
+    def flush(self, printer):
+        '''Print and discard all layout built so far.
+        '''
+        assert self._parens == 0, 'cannot flush inside parentheses'
+        for (level, items) in enumerate(self._stack):
+            if level > self._opened:
+                printer.open()
+                self._opened = level
+            printer.emit(items)
+            del items[:]
+
+
+class Printer(object):
+    def __init__(self, out, token_lines, source_map=None,
+                 indent=2, depth=0):
+        self._out = out
+        self._lines = list(token_lines)
+        self._rows = None
+        self._line_ix = 0
+        self._source_map = source_map
+        self._indent = indent
+        self._depth = depth
+        self._line = 1
+        self.pos = 0
+        self.marks = None
+
+    @property
+    def line(self):
+        return self._line
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def token_lines(self, first, last):
+        '''Token lines from first through last.
+        '''
+        if self._rows is None:
+            self._rows = [row for (row, _) in self._lines]
+        return self._lines[bisect_left(self._rows, first):
+                           bisect_right(self._rows, last)]
+
+    def write(self, txt):
+        self._line += txt.count('\n')
+        self.pos += len(txt)
+        self._out.write(txt)
+
+    def open(self):
+        self._depth += self._indent
+        self.write('{\n' + ' ' * self._depth)
+
+    def close(self):
+        self._depth -= self._indent
+        self.write('}\n' + ' ' * self._depth)
+
+    def newline(self):
+        self.write('\n' + ' ' * self._depth)
+
+    def emit(self, items):
+        for item in items:
+            if isinstance(item, basestring):
+                self.write(item)
+            elif item is NEWLINE:
+                self.newline()
+            elif isinstance(item, Sync):
+                self.sync(item.line, item.col)
+            elif isinstance(item, Block):
+                self.open()
+                self.emit(item.items)
+                self.close()
+            elif isinstance(item, Paren):
+                self.write('(')
+                self.emit(item.items)
+                self.write(')')
+            elif item is CLOSE:
+                self.close()
+            elif isinstance(item, Decls):
+                if item.items:
+                    self.newline()
+                for txt in item.items:
+                    self.write(txt)
+                    self.newline()
+            else:
+                raise TypeError(item)
+
+    def sync(self, line, col):
+        '''Print python comments up to line; note where line went.
+
+        Where `marks` is a srcmap.SourceMap, the location is recorded
+        there too.
+        '''
+        self._comments(line)
+        if col is None:
+            return
+        if self._source_map is not None:
+            self._source_map.record(self._line, line, col)
+        if self.marks is not None:
+            self.marks.record(self._line, line, col)
+
+    def splice(self, txt, marks, line):
+        '''Print txt from an earlier conversion of python source up to
+        line, which includes its comments.
+
+        :param marks: (scala line, python line, col), with scala lines
+                      counted from the start of txt
+        '''
+        self._comments(line, skip=True)
+        if self._source_map is not None:
+            for (scala_line, py_line, col) in marks:
+                self._source_map.record(self._line + scala_line, py_line, col)
+        self.write(txt)
+
+    def _comments(self, line, skip=False):
+        while (self._line_ix < len(self._lines) and
+               line >= self._lines[self._line_ix][0]):
+            for tok in self._lines[self._line_ix][1]:
+                if tok[0] == tokenize.COMMENT and not skip:
+                    self.write('//' + tok[1][1:])
+                    self.newline()
+            self._line_ix += 1
@@ -0,0 +1,165 @@
+r'''sigindex -- project-level index of function and class signatures
+
+A first pass over each module of a project extracts the signatures
+declared in docstrings, using the same conventions as conversion
+(`TypeDecls.parse_types`, `ClassStructure._find_constructors`), so
+that converting one module can consult the types declared in another.
+
+The index is kept on disk as JSON lines, one entry per module.
+Updates are appended; the last entry for a module wins::
+
+  >>> M1 = 'def f(x):\n    """:type x: Int\n    :rtype: Int"""\n'
+  >>> idx = SigIndex()
+  >>> changed, todo = idx.update([module_sigs('m1', M1)])
+  >>> todo
+  ['m1']
+  >>> idx.get('m1')['functions']['f']['rtype']
+  'Int'
+
+Each entry carries a digest of its source and of its signatures.
+Only modules whose source changed are reconverted, along with the
+importers of modules whose signatures changed::
+
+  >>> m2 = module_sigs('m2', 'from m1 import f')
+  >>> idx.update([m2])[1]
+  ['m2']
+  >>> idx.update([module_sigs('m1', M1 + '# comment')])[1]
+  ['m1']
+  >>> idx.update([module_sigs('m1', M1.replace('Int', 'Long'))])[1]
+  ['m1', 'm2']
+
+A module that fails to convert is discarded, so that it is
+reconverted next time even though its source is unchanged::
+
+  >>> idx.discard('m2')
+  >>> idx.update([m2])[1]
+  ['m2']
+
+'''
+
+import ast
+import hashlib
+import json
+
+from p2s import TypeDecls, ClassStructure
+
+
+def module_sigs(modname, src, filename='<unknown>'):
+    '''Extract an index entry from the source of a module.
+    '''
+    t = ast.parse(src, filename)
+    functions, classes = {}, {}
+    for stmt in t.body:
+        if isinstance(stmt, ast.FunctionDef):
+            functions[stmt.name] = fun_sig(stmt)
+        elif isinstance(stmt, ast.ClassDef):
+            classes[stmt.name] = class_sig(stmt)
+
+    imports = sorted(set(
+        [alias.name for node in ast.walk(t) if isinstance(node, ast.Import)
+         for alias in node.names] +
+        [node.module for node in ast.walk(t)
+         if isinstance(node, ast.ImportFrom) and node.module]))
+
+    sigs = dict(functions=functions, classes=classes)
+    return dict(sigs,
+                module=modname,
+                imports=imports,
+                src_digest=digest(src),
+                sig_digest=digest(dump(sigs)))
+
+
+def fun_sig(node):
+    arg_types, rtype, foralls = TypeDecls.parse_types(
+        ast.get_docstring(node) or '')
+    return dict(args=arg_names(node.args.args),
+                types=dict(arg_types),
+                rtype=rtype,
+                forall=foralls)
+
+
+def class_sig(node):
+    ctors, _, arg_types, foralls = ClassStructure()._find_constructors(
+        node.body, ast.get_docstring(node))
+    return dict(args=[name for fd in ctors
+                      for name in arg_names(fd.args.args)[1:]],
+                types=dict(arg_types),
+                forall=foralls)
+
+
+def arg_names(args):
+    return [arg.id for arg in args if isinstance(arg, ast.Name)]
+
+
+def digest(txt):
+    return hashlib.md5(txt).hexdigest()
+
+
+def dump(entry):
+    return json.dumps(entry, sort_keys=True, separators=(',', ':'))
+
+
+class SigIndex(object):
+    def __init__(self, entries=()):
+        self._entries = {}
+        self._lines = 0
+        for entry in entries:
+            self._entries[entry['module']] = entry
+            self._lines += 1
+
+    @classmethod
+    def load(cls, lines):
+        return cls(json.loads(line) for line in lines if line.strip())
+
+    def get(self, modname):
+        '''Look up a module by dotted name, or failing that,
+        by its last component.
+        '''
+        return (self._entries.get(modname) or
+                self._entries.get(modname.split('.')[-1]))
+
+    def update(self, entries):
+        '''Add or replace entries.
+
+        :return: (changed entries, names of modules to reconvert)
+        '''
+        changed, new_sigs = [], []
+        for entry in entries:
+            old = self._entries.get(entry['module'])
+            if old and old['src_digest'] == entry['src_digest']:
+                continue
+            changed.append(entry)
+            if not old or old['sig_digest'] != entry['sig_digest']:
+                new_sigs.append(entry['module'])
+            self._entries[entry['module']] = entry
+
+        importers = [modname for (modname, entry) in self._entries.items()
+                     if [imp for imp in entry['imports']
+                         if imp in new_sigs or
+                         imp.split('.')[-1] in new_sigs]]
+        return changed, sorted(set([entry['module'] for entry in changed] +
+                                   importers))
+
+    def discard(self, modname):
+        '''Forget a module, e.g. one that failed to convert.
+
+        Since the on-disk index can only be appended to, save all
+        entries afterwards.
+        '''
+        self._entries.pop(modname, None)
+
+    def needs_compaction(self):
+        return self._lines > 2 * len(self._entries)
+
+    def save(self, out, entries=None):
+        '''Write entries (by default, all of them) to out, one per line.
+
+        Pass the changed entries from `update` and a file opened for
+        appending to update the index incrementally.
+        '''
+        if entries is None:
+            entries = [self._entries[k] for k in sorted(self._entries)]
+            self._lines = 0
+        for entry in entries:
+            out.write(dump(entry) + '\n')
+            self._lines += 1
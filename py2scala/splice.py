@@ -0,0 +1,231 @@
+r'''splice -- reconvert only the top-level definitions that changed
+
+A module is converted one top-level statement at a time (see
+scala_ir). The scala for a function or class definition at the top
+level -- a *chunk* -- depends only on
+
+ - its *region* of python source: from the line after the code of
+   the statement before it through the last line of its own code,
+   comments included, and
+ - the module *context*: the other top-level statements, imports
+   anywhere in the module, signatures of imported modules and
+   conversion options.
+
+Each region has a digest::
+
+  >>> src = ('import os\n'
+  ...        'def f(x):\n'
+  ...        '    return x  # same\n'
+  ...        '\n'
+  ...        '# g is trivial\n'
+  ...        'def g():\n'
+  ...        '    pass\n')
+  >>> def mk(src, previous=None):
+  ...     tokens = tokenize.generate_tokens(StringIO.StringIO(src).readline)
+  ...     sp = Splice(src, ast.parse(src).body, tokens, previous)
+  ...     sp.set_context('state')
+  ...     return sp
+  >>> sp = mk(src)
+  >>> [sp.region(stmt) for stmt in sp.body]
+  [(1, 1), (2, 3), (4, 7)]
+
+The record of a conversion notes the digest of each chunk, where its
+output went, and its source map marks and diagnostics, relative to
+the chunk::
+
+  >>> for stmt, (start, end) in zip(sp.body[1:], [(30, 60), (60, 80)]):
+  ...     sp.add(stmt, start, end, [(0, 1, 4)], [])
+  >>> previous = ('.' * 80, sp.record)
+
+Given the output and record of an earlier conversion in the same
+context, a chunk whose region did not change is copied verbatim::
+
+  >>> sp = mk(src.replace('pass', 'return 1'), previous)
+  >>> [sp.reusable(stmt) is not None for stmt in sp.body[1:]]
+  [True, False]
+  >>> txt, chunk = sp.reusable(sp.body[1])
+  >>> len(txt), chunk['marks']
+  (30, [[0, 1, 4]])
+
+Regions can move; only their text, less leading blank lines, counts.
+Any change to the context
+rules out reuse::
+
+  >>> sp = mk('\n\n' + src, previous)
+  >>> [sp.reusable(stmt) is not None for stmt in sp.body[1:]]
+  [True, True]
+  >>> sp = mk(src.replace('os', 'sys'), previous)
+  >>> [sp.reusable(stmt) is not None for stmt in sp.body[1:]]
+  [False, False]
+
+'''
+
+from bisect import bisect_left
+from itertools import dropwhile
+from os.path import dirname, join
+import StringIO
+import ast
+import hashlib
+import tokenize
+
+from fp import option_iter
+
+#: Modules whose source determines the output of a conversion.
+CONVERTER = ['observe', 'p2s', 'passes', 'ranges', 'scala_ir', 'splice',
+             'srcmap']
+
+
+def source_digest(modules, read=lambda name: open(name, 'rb').read()):
+    '''Digest the source of modules in this package.
+
+    >>> (source_digest(['a'], lambda name: 'x = 1') ==
+    ...  source_digest(['a'], lambda name: 'x = 2'))
+    False
+    '''
+    h = hashlib.md5()
+    for module in modules:
+        h.update(read(join(dirname(__file__), module + '.py')) + '\0')
+    return h.hexdigest()
+
+
+#: Records made by any other version of the converter are not used.
+FORMAT = source_digest(CONVERTER)
+
+chunk_types = (ast.FunctionDef, ast.ClassDef)
+
+
+class Splice(object):
+    def __init__(self, src, body, tokens, previous=None, options=()):
+        '''
+        :param body: top-level statements of the module
+        :param tokens: python tokens of src
+        :param previous: (scala text, record) of an earlier conversion
+        :param options: conversion options, part of the context
+        '''
+        self.body = body
+        self._options = options
+        self._lines = src.splitlines(True)
+        self._previous = previous
+        self._reusable = {}
+        self.record = dict(format=FORMAT, context=None, chunks=[])
+
+        code, imports = scan(tokens)
+        code = sorted(code)
+        self._import_rows = sorted(imports)
+        self._imports = {}
+        self._regions = {}
+        after = 0
+        for stmt, nxt in zip(body, body[1:] + [None]):
+            upto = len(self._lines) + 1 if nxt is None else nxt.lineno
+            ix = bisect_left(code, upto) - 1
+            last = max(code[ix] if ix >= 0 else 0, after)
+            self._regions[id(stmt)] = (after + 1, last)
+            after = last
+
+        self._keys = {}
+        seen = {}
+        for stmt in body:
+            if isinstance(stmt, chunk_types):
+                seen[stmt.name] = seen.get(stmt.name, 0) + 1
+                self._keys[id(stmt)] = (
+                    stmt.name if seen[stmt.name] == 1
+                    else '%s#%d' % (stmt.name, seen[stmt.name]))
+
+    def region(self, stmt):
+        '''First and last line of the region of a top-level statement.
+        '''
+        return self._regions[id(stmt)]
+
+    def text(self, stmt):
+        '''Source of the region of stmt, less leading blank lines.
+        '''
+        first, last = self.region(stmt)
+        return ''.join(dropwhile(lambda line: not line.strip(),
+                                 self._lines[first - 1:last]))
+
+    def imports(self, stmt):
+        '''Import statements in a top-level statement, in source order.
+
+        Only statements whose region has an `import` token are walked.
+        '''
+        key = id(stmt)
+        if key not in self._imports:
+            first, last = self.region(stmt)
+            ix = bisect_left(self._import_rows, first)
+            self._imports[key] = (
+                sorted([node for node in ast.walk(stmt)
+                        if isinstance(node, (ast.Import, ast.ImportFrom))],
+                       key=lambda node: (node.lineno, node.col_offset))
+                if self._import_rows[ix:ix + 1] and
+                self._import_rows[ix] <= last
+                else [])
+        return self._imports[key]
+
+    def set_context(self, *parts):
+        '''Digest the context of chunks: statements other than
+        definitions, imports in definitions, options, and parts such as
+        what the converter found in a scan of the module.
+        '''
+        h = hashlib.md5(str(FORMAT))
+        for stmt in self.body:
+            if not isinstance(stmt, chunk_types):
+                h.update(self.text(stmt) + '\0')
+                continue
+            for node in self.imports(stmt):
+                h.update(ast.dump(node) + '\0')
+        for part in (self._options,) + parts:
+            h.update(repr(part) + '\0')
+        self.record['context'] = context = h.hexdigest()
+
+        for (_, record) in option_iter(self._previous):
+            if (record.get('format') == FORMAT and
+                    record['context'] == context):
+                self._reusable = dict((chunk['key'], chunk)
+                                      for chunk in record['chunks'])
+
+    def reusable(self, stmt):
+        '''Find the earlier output of an unchanged definition.
+
+        :return: (scala text, chunk record) or None
+        '''
+        chunk = self._reusable.get(self._keys.get(id(stmt)))
+        if chunk is None or chunk['digest'] != digest(self.text(stmt)):
+            return None
+        text, _ = self._previous
+        return text[chunk['start']:chunk['end']], chunk
+
+    def add(self, stmt, start, end, marks, diagnostics):
+        '''Note the output of a definition.
+
+        :param start: offset of the chunk in the scala output
+        :param end: offset just past the chunk
+        :param marks: (scala line, python line, col) source map marks,
+                      with lines counted from the start of the chunk
+                      and of the region
+        :param diagnostics: (line number, message) pairs, with lines
+                            counted from the start of the region
+        '''
+        self.record['chunks'].append(dict(
+            key=self._keys[id(stmt)], digest=digest(self.text(stmt)),
+            start=start, end=end,
+            marks=[list(mark) for mark in marks],
+            diagnostics=[list(d) for d in diagnostics]))
+
+
+def scan(tokens):
+    '''Find rows that hold python code, as opposed to comments and
+    space, and rows with an `import` keyword.
+    '''
+    rows, imports = set(), set()
+    for tok in tokens:
+        if tok[0] not in (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE,
+                          tokenize.INDENT, tokenize.DEDENT,
+                          tokenize.ENDMARKER):
+            rows.update(range(tok[2][0], tok[3][0] + 1))
+            if tok[0] == tokenize.NAME and tok[1] == 'import':
+                imports.add(tok[2][0])
+    return rows, imports
+
+
+def digest(txt):
+    return hashlib.md5(txt).hexdigest()
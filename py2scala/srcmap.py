@@ -0,0 +1,95 @@
+'''srcmap -- map lines of generated scala back to python source
+
+As it prints, `scala_ir.Printer` records the python location of
+each statement and expression at the scala line where its conversion
+starts. Consecutive scala lines from the same python location form
+one run, so the map holds one entry per run::
+
+  >>> smap = SourceMap('m.py')
+  >>> smap.record(3, 1, 0)
+  >>> smap.record(4, 2, 4)
+  >>> smap.record(4, 2, 8)
+  >>> smap.record(7, 5, 0)
+  >>> smap.lookup(5)
+  (2, 4)
+  >>> smap.lookup(1) is None
+  True
+
+Compiler messages about the scala file can then be reported against
+the python source::
+
+  >>> print remap('m.scala:6: error: not found: value x\\n', 'm.scala', smap),
+  m.py:2:4: error: not found: value x
+
+'''
+
+from bisect import bisect_right
+from os.path import basename
+import json
+import re
+
+
+class SourceMap(object):
+    def __init__(self, source, entries=()):
+        self.source = source
+        self._scala_lines = []
+        self._locations = []
+        for (scala_line, py_line, col) in entries:
+            self.record(scala_line, py_line, col)
+
+    def record(self, scala_line, py_line, col):
+        '''Note that scala_line (and those after it, up to the next
+        entry) came from python py_line, col.
+        '''
+        if self._scala_lines:
+            if scala_line <= self._scala_lines[-1]:
+                return
+            if self._locations[-1] == (py_line, col):
+                return
+        self._scala_lines.append(scala_line)
+        self._locations.append((py_line, col))
+
+    def lookup(self, scala_line):
+        '''Find the python location of a scala line, by binary search.
+
+        :return: (line, col) or None
+        '''
+        ix = bisect_right(self._scala_lines, scala_line) - 1
+        return self._locations[ix] if ix >= 0 else None
+
+    def entries(self):
+        return [(scala_line, py_line, col)
+                for (scala_line, (py_line, col))
+                in zip(self._scala_lines, self._locations)]
+
+    @classmethod
+    def load(cls, fp):
+        data = json.load(fp)
+        lines = data['lines']
+        return cls(data['source'],
+                   [lines[ix:ix + 3] for ix in range(0, len(lines), 3)])
+
+    def save(self, out):
+        json.dump(dict(source=self.source,
+                       lines=[n for entry in self.entries() for n in entry]),
+                  out, sort_keys=True, separators=(',', ':'))
+        out.write('\n')
+
+
+message = re.compile(r'^(?P<file>[^:\n]+\.scala):(?P<line>\d+):(?P<rest>.*)$',
+                     re.MULTILINE)
+
+
+def remap(messages, scala_fn, smap):
+    '''Rewrite `file.scala:line:` locations in compiler messages
+    about scala_fn as python locations.
+    '''
+    def location(m):
+        found = (smap.lookup(int(m.group('line')))
+                 if basename(m.group('file')) == basename(scala_fn)
+                 else None)
+        if found is None:
+            return m.group(0)
+        return '%s:%d:%d:%s' % ((smap.source,) + found + (m.group('rest'),))
+
+    return message.sub(location, messages)
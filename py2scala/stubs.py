@@ -0,0 +1,178 @@
+'''stubs -- generate scala stubs for third-party modules
+
+Modules that a project imports from neither the standard library
+(see batteries.scala) nor the project itself need scala stubs. Rather
+than writing them by hand, convert their public signatures in `--api`
+mode. Imports of those modules get stubs too, making a stub tree;
+packages become scala package objects.
+
+Stubs are cached by module path and modification time, so only new
+or changed modules, or those whose stubs went missing, are converted
+again. A module that cannot be found or converted is logged and
+skipped; it is tried again next time.
+
+'''
+
+import StringIO
+import ast
+import imp
+import json
+import logging
+
+import p2s
+
+log = logging.getLogger(__name__)
+
+
+class StubCache(object):
+    '''Stubs generated so far, as JSON lines, by module path.
+
+    >>> cache = StubCache()
+    >>> cache.fresh('/lib/m.py', 10)
+    False
+    >>> cache.add('/lib/m.py', 10, 'm', ['n'])
+    >>> cache.fresh('/lib/m.py', 10), cache.fresh('/lib/m.py', 11)
+    (True, False)
+
+    A stub that was since deleted is not fresh::
+
+    >>> cache.fresh('/lib/m.py', 10, stub_exists=lambda module: False)
+    False
+    '''
+    def __init__(self, entries=()):
+        self._entries = dict((entry['path'], entry) for entry in entries)
+
+    @classmethod
+    def load(cls, lines):
+        return cls(json.loads(line) for line in lines if line.strip())
+
+    def fresh(self, path, mtime, stub_exists=lambda module: True):
+        entry = self._entries.get(path)
+        return (entry is not None and entry['mtime'] == mtime and
+                stub_exists(entry['module']))
+
+    def imports(self, path):
+        return self._entries[path]['imports']
+
+    def add(self, path, mtime, module, imports):
+        self._entries[path] = dict(path=path, mtime=mtime,
+                                   module=module, imports=imports)
+
+    def save(self, out):
+        for path in sorted(self._entries):
+            out.write(json.dumps(self._entries[path], sort_keys=True) + '\n')
+
+
+def mk_find_source(find_module, path_join, sys_path):
+    '''Find the source of a (dotted) module on the python path.
+
+    :return: (path, is_package) or (None, False) for modules
+             not written in python
+    '''
+    def find_source(name):
+        path, kind = None, None
+        search = sys_path[1:]
+        for part in name.split('.'):
+            fp, path, (_, _, kind) = find_module(part, search)
+            if fp:
+                fp.close()
+            search = [path]
+        if kind == imp.PKG_DIRECTORY:
+            return path_join(path, '__init__.py'), True
+        return (path, False) if kind == imp.PY_SOURCE else (None, False)
+
+    return find_source
+
+
+def imported_names(tree, modname, is_pkg):
+    '''Absolute names of modules imported by a module.
+
+    >>> t = ast.parse('import a.b; from .c import d; from . import e')
+    >>> imported_names(t, 'p.q', False)
+    ['a.b', 'p.c']
+    '''
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            if node.level:
+                pkg = modname.split('.')
+                pkg = pkg if is_pkg else pkg[:-1]
+                pkg = pkg[:len(pkg) - (node.level - 1)]
+                names.append('.'.join(pkg + [node.module]))
+            else:
+                names.append(node.module)
+    return sorted(set(names))
+
+
+def third_party(mod_file, names, find_package):
+    '''Select the modules that are neither standard nor local.
+    '''
+    found = []
+    for name in names:
+        try:
+            is_std, is_local, _ = find_package(mod_file, name)
+        except ImportError:
+            log.warning('%s: cannot find %s', mod_file, name)
+            continue
+        if not (is_std or is_local):
+            found.append(name)
+    return found
+
+
+def update_stubs(sources, cache, find_package, find_source,
+                 read, getmtime, save_stub_fp, stub_exists):
+    '''Generate stubs for third-party modules imported by sources.
+
+    :param sources: source text by filename
+    :param save_stub_fp: dotted module name parts => writable file
+    :param stub_exists: dotted module name => whether its stub exists
+    :return: names of modules whose stubs were (re-)generated
+    '''
+    queue = [name for (fn, src) in sorted(sources.items())
+             for name in third_party(
+                 fn, imported_names(ast.parse(src, fn), '', False),
+                 find_package)]
+    seen, done = set(), []
+    while queue:
+        name = queue.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        try:
+            path, is_pkg = find_source(name)
+        except ImportError as ex:
+            log.error('cannot find %s: %s; skipping stub', name, ex)
+            continue
+        if path is None:
+            log.warning('no python source for %s; skipping stub', name)
+            continue
+
+        mtime = getmtime(path)
+        if not cache.fresh(path, mtime, stub_exists):
+            src = read(path)
+            parts = name.split('.')
+            out = StringIO.StringIO()
+            try:
+                p2s.convert(path, src, out, find_package,
+                            pkg='.'.join(parts[:-1]) or None,
+                            api=True,
+                            modname=parts[-1],
+                            package_object=is_pkg,
+                            interactive=False)
+                imports = imported_names(ast.parse(src, path), name, is_pkg)
+            except Exception as ex:
+                log.error('%s: stub generation failed: %r', path, ex)
+                continue
+            with save_stub_fp(parts) as stub_out:
+                stub_out.write(out.getvalue())
+            cache.add(path, mtime, name, imports)
+            done.append(name)
+
+        # Within a third-party package, local imports need stubs too.
+        queue += [imported for imported in cache.imports(path)
+                  if imported not in seen and
+                  (imported.split('.')[0] == name.split('.')[0] or
+                   third_party(path, [imported], find_package))]
+    return done
@@ -0,0 +1,80 @@
+'''
+Strings accumulated in a loop use a StringBuilder.
+'''
+
+
+def report(lines):
+    '''
+    :type lines: Seq[String]
+    '''
+    out = ''
+    for line in lines:
+        if line:
+            out += line
+            out += '\n'
+    return out
+
+
+def keep_going(lines):
+    '''
+    :type lines: Seq[String]
+    '''
+    var, out = None, '> '
+    var, ix = None, 0
+    while ix < len(lines):
+        out += lines[ix]
+        ix += 1
+    out += '.'
+    return out
+
+
+def joined(lines):
+    '''
+    :type lines: Seq[String]
+    '''
+    parts = []
+    for line in lines:
+        parts.append(line.strip())
+    return ''.join(parts)
+
+
+def not_only_appended(lines):
+    '''
+    :type lines: Seq[String]
+    '''
+    parts = []
+    for line in lines:
+        parts.append(line)
+    print len(parts)
+    return ''.join(parts)
+
+
+def nested(lines):
+    '''
+    :type lines: Seq[String]
+    '''
+    parts = []
+    for line in lines:
+        parts.append(line)
+
+    def more(extra):
+        ''':type extra: Seq[String]'''
+        parts = []
+        for x in extra:
+            parts.append(x)
+        return parts
+    print ''.join(parts)
+    return more(lines)
+
+
+def joined_later(lines):
+    '''
+    :type lines: Seq[String]
+    '''
+    parts = []
+    for line in lines:
+        parts.append(line)
+
+    def text():
+        return ''.join(parts)
+    return text
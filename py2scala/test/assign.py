@@ -21,6 +21,27 @@ def fact(n):
     return x
 
 
+def fib(n):
+    '''Parallel assignment, without a tuple.
+
+    :type n: Int
+    '''
+    var, a, b = None, 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+def divide(n, d):
+    '''Unpack a call result.
+
+    :type n: Int
+    :type d: Int
+    '''
+    q, r = divmod(n, d)
+    return q * d + r
+
+
 def colors():
     x = ['red', 'yellow', 'green']
     x[1] = 'blue'
@@ -0,0 +1,22 @@
+def doubled_positives(xs):
+    ''':type xs: Seq[Int]'''
+    return map(lambda x: x * 2, filter(lambda x: x > 0, xs))
+
+
+def scaled(ys, k):
+    ''':type ys: Seq[Int]
+    :type k: Int
+    '''
+    return [x + 1 for x in [y * k for y in ys] if x > 0 if x % 2 == 0]
+
+
+def total(ys):
+    ''':type ys: Seq[Int]'''
+    return sum(y * y for y in ys if y) + max([abs(y) for y in ys])
+
+
+def pairs(ys):
+    ''':type ys: Seq[Int]'''
+    for p in [(y, y + 1) for y in ys]:
+        print p
+    return sorted([z for z in [y * 2 for y in ys]])
@@ -0,0 +1,18 @@
+def lengths(words):
+    ''':type words: Seq[String]'''
+    return {w: len(w) for w in words}
+
+
+def index(words):
+    ''':type words: Seq[String]'''
+    return {w: ix for ix, w in enumerate(words) if w}
+
+
+def initials(words):
+    ''':type words: Seq[String]'''
+    return {w[0] for w in words if w}
+
+
+def squares(n):
+    ''':type n: Int'''
+    return {y: y * y for y in [x + 1 for x in range(n)]}
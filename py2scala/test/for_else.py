@@ -2,7 +2,15 @@ from ..fp import typed
 
 # Note: [] isn't well-typed unless we constrain the parameter type
 # TODO: use has_type([], 'Iterable[Int]')
+# With no break, else runs after the loop whether or not it iterated.
 for x in typed([], 'Iterable[Int]'):
     print "some"
 else:
     print "none"
+
+# else runs unless the loop is broken out of.
+for x in typed([], 'Iterable[Int]'):
+    if x > 1:
+        break
+else:
+    print "no big one"
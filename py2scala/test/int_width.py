@@ -0,0 +1,42 @@
+'''
+Integers get the narrowest scala type that holds their values.
+'''
+
+MASK = (1 << 40) - 1
+HUGE = 2 ** 70
+HALF = 7 / 2
+GOOGOL = 10 ** 100
+TENTH = 10 ** -1
+
+
+def area(w, h):
+    '''
+    :type w: Int
+    :type h: Int
+    '''
+    side = min(w, 65536)
+    wide = side * 65536
+    var, total = None, 0
+    for i in range(1000):
+        total = total + i * 3000000
+    return total + wide
+
+
+def checksum(data):
+    '''
+    :type data: Seq[Int]
+    :rtype: Int
+    '''
+    var, total, n = None, 0, 0
+    for b in data:
+        total += b
+        n += 1
+    return total % 65521 + n
+
+
+def inverse(y):
+    '''
+    :type y: Double
+    :rtype: Double
+    '''
+    return y ** -1
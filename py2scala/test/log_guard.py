@@ -0,0 +1,12 @@
+import logging
+
+log = logging.getLogger(__name__)
+
+
+def work(xs):
+    ''':type xs: Seq[Int]'''
+    log.debug('working on %s', len(xs))
+    log.info('start')
+    sub = logging.getLogger('sub')
+    sub.debug('%d items', sum(xs))
+    log.warn('careful')
@@ -0,0 +1,64 @@
+'''
+Loops with break and continue become while loops with flags.
+'''
+
+
+def first_negative(xs):
+    '''
+    :type xs: Seq[Int]
+    :rtype: Int
+    '''
+    var, found = None, 0
+    for x in xs:
+        if x < 0:
+            found = x
+            break
+    return found
+
+
+def count_odd(xs):
+    '''
+    :type xs: Seq[Int]
+    :rtype: Int
+    '''
+    var, n = None, 0
+    for x in xs:
+        if x % 2 == 0:
+            continue
+        n += 1
+    return n
+
+
+def has_pair(xs, ys, total):
+    '''
+    :type xs: Seq[Int]
+    :type ys: Seq[Int]
+    :type total: Int
+    :rtype: Boolean
+    '''
+    var, found = None, False
+    for x in xs:
+        for y in ys:
+            if x + y == total:
+                found = True
+                break
+        else:
+            continue
+        break
+    return found
+
+
+def countdown(n):
+    '''
+    :type n: Int
+    '''
+    var, ix = None, n
+    while ix > 0:
+        ix -= 1
+        if ix == 3:
+            continue
+        if ix == 1:
+            break
+        print ix
+    else:
+        print "liftoff"
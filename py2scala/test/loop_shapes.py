@@ -0,0 +1,48 @@
+'''
+enumerate, zip and dict items loops bind their variables directly.
+'''
+
+
+def numbered(lines):
+    '''
+    :type lines: Seq[String]
+    '''
+    for ix, line in enumerate(lines, 1):
+        print ix, line
+
+
+def dot(xs, ys):
+    '''
+    :type xs: Seq[Int]
+    :type ys: Seq[Int]
+    :rtype: Int
+    '''
+    var, total = None, 0
+    for x, y in zip(xs, ys):
+        total += x * y
+    return total
+
+
+def show(d):
+    '''
+    :type d: Dict[String, Int]
+    '''
+    for k, v in d.items():
+        if v == 0:
+            continue
+        print k, v
+
+
+def until_negative(xs):
+    '''
+    :type xs: Seq[Int]
+    :rtype: Int
+    '''
+    var, total = None, 0
+    for x in xs:
+        if x < 0:
+            break
+        if x == 0:
+            continue
+        total += x * 2
+    return total
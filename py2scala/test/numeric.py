@@ -0,0 +1,49 @@
+'''
+Arithmetic that scala spells differently.
+'''
+
+THIRD = 0.1 * 3
+ROOT2 = 2.0 ** 0.5
+
+
+def halves(n, x):
+    '''
+    :type n: Int
+    :type x: Double
+    :rtype: (Int, Double)
+    '''
+    return n // 2, x // 2
+
+
+def parity(a, b):
+    '''
+    :type a: Long
+    :type b: Long
+    :rtype: Long
+    '''
+    return -(a ^ b) & ~a
+
+
+def norm(x, y):
+    '''
+    :type x: Double
+    :type y: Double
+    :rtype: Double
+    '''
+    return (x ** 2 + y ** 2) ** 0.5
+
+
+def cube(n):
+    '''
+    :type n: Int
+    :rtype: Int
+    '''
+    return -n ** 3 + - -n
+
+
+def powers(y, k):
+    '''
+    :type y: Int
+    :type k: Int
+    '''
+    return (y + 1) ** 2, y ** 10, y ** k, (y * 0.5) ** 3
@@ -0,0 +1,39 @@
+import re
+import re as rx
+from re import search as find
+
+WORD = re.compile(r'\w+')
+
+
+def headers(lines):
+    ''':type lines: Seq[String]'''
+    for line in lines:
+        if re.match(r'^#+ ', line):
+            print line
+        m = re.search(r'\d+', line)
+        if m and re.match(r'^#+ ', line):
+            print m.group(0)
+
+
+class Parser(object):
+    def parse(self, txt, pat):
+        ''':type txt: String
+        :type pat: String
+        '''
+        return re.compile(r'\s+').split(txt) + re.findall(pat, txt)
+
+
+def numbered(lines):
+    ''':type lines: Seq[String]
+    :rtype: Int
+    '''
+    return len([line for line in lines if rx.match(r'\d+\. ', line)])
+
+
+def numbered(lines, pat):
+    ''':type lines: Seq[String]
+    :type pat: String
+    :rtype: Int
+    '''
+    return len([line for line in lines
+                if find(r'\d+\. ', line) and rx.match(pat, line)])
@@ -0,0 +1,53 @@
+'''
+Slices that are only read are views; steps take python's indices.
+'''
+
+
+def tail_total(xs):
+    '''
+    :type xs: Seq[Int]
+    :rtype: Int
+    '''
+    total = sum(xs[1:])
+    for x in xs[1:-1]:
+        print x
+    return total
+
+
+def evens_reversed(xs):
+    '''
+    :type xs: Seq[Int]
+    :rtype: Seq[Int]
+    '''
+    for ix, x in enumerate(xs[::2]):
+        print ix, x
+    odds = xs[::-2]
+    return xs[::-1]
+
+
+def rotate(xs):
+    '''
+    :type xs: Seq[Int]
+    '''
+    for x in xs[1:]:
+        xs.append(x)
+    return max(xs[:3])
+
+
+def last(xs, n):
+    '''
+    :type xs: Seq[Int]
+    :type n: Int
+    :rtype: Seq[Int]
+    '''
+    return xs[-n:]
+
+
+def module_name(name):
+    '''
+    :type name: String
+    :rtype: String
+    '''
+    if name[-3:] == '.py':
+        return name[:-3]
+    return name[::2] + name[::-1]
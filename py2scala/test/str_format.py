@@ -0,0 +1,33 @@
+'''
+"fmt" % args with a literal format is specialized at conversion time.
+'''
+
+
+def report(name, qty, price):
+    '''
+    :type name: String
+    :type qty: Int
+    :type price: Double
+    '''
+    print '%s: %d @ %.2f' % (name, qty, price)
+    print 'total: %8.2f%%' % (qty * price)
+    return '<%s>' % name
+
+
+def mismatched(price, n):
+    '''
+    :type price: Double
+    :type n: Int
+    '''
+    return '%d items at %d' % (n, price), '%.1f' % n, '%c' % n
+
+
+def dynamic(fmt, x):
+    '''
+    :type fmt: String
+    '''
+    return fmt % (x, x)
+
+
+def keyed(x):
+    return '%(x)s' % dict(x=x)
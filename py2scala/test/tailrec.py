@@ -0,0 +1,28 @@
+def fact(n, acc=1):
+    ''':type n: Int
+    :type acc: Int
+    :rtype: Int
+    '''
+    if n <= 1:
+        return acc
+    return fact(n - 1, acc=acc * n)
+
+
+def gcd(a, b):
+    ''':type a: Int
+    :type b: Int
+    :rtype: Int
+    '''
+    if b == 0:
+        return a
+    else:
+        return gcd(b, a % b)
+
+
+def depth(tree):
+    ''':type tree: Seq[Any]
+    :rtype: Int
+    '''
+    if not tree:
+        return 0
+    return 1 + depth(tree[1:])
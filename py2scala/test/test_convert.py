@@ -2,6 +2,7 @@ import pkg_resources as pkg
 import unittest
 
 from .. import p2s
+from ..srcmap import SourceMap
 
 
 def main(argv, exit,
@@ -86,10 +87,13 @@ def test_convert_each(with_caps=_with_find_save,
 
     def runTest(res, err):
         scala_fn = res.split('.')[0] + '.scala'
+        source_map = SourceMap(res)
         with save_scala_fp(scala_fn, err) as out:
             fn = pkg.resource_filename(__name__, res)
             src = pkg.resource_string(__name__, res)
-            p2s.convert(fn, src, out, find_package)
+            p2s.convert(fn, src, out, find_package, source_map=source_map)
+        with save_scala_fp(scala_fn + '.map', err) as map_out:
+            source_map.save(map_out)
         return out.name
 
     ok_filenames = read_manifest(manifest_ok_fn)
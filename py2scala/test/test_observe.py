@@ -0,0 +1,82 @@
+'''Check that types observed at run time reach the scala output.
+'''
+
+import StringIO
+import sys
+import unittest
+
+from .. import p2s
+from ..observe import Observer
+
+import test_convert
+
+src = '''
+def add(x, y):
+    return x + y
+
+def show(x):
+    return str(x)
+
+def total(*xs):
+    """:rtype: Long"""
+    return sum(xs)
+
+class Point(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def scale(self, k):
+        return Point(self.x * k, self.y * k)
+'''
+
+
+def observe(src):
+    ns = {}
+    exec compile(src, 'm.py', 'exec') in ns
+    obs = Observer(['m.py'])
+    with obs.profiling(sys.setprofile):
+        ns['add'](1, 2)
+        ns['show'](1)
+        ns['show']('one')
+        ns['total'](1, 2, 3)
+        ns['Point'](1.0, 2.0).scale(2.0)
+    return obs.types('m.py', src)
+
+
+def convert(src, observed):
+    find_package = test_convert._with_find_save(
+        lambda find_package, save_scala_fp: find_package)
+    out = StringIO.StringIO()
+    diagnostics = p2s.convert('m.py', src, out, find_package,
+                              observed=observed)
+    return out.getvalue(), diagnostics
+
+
+class ObservedTypesTest(unittest.TestCase):
+    def test_observed(self):
+        types = observe(src)
+        self.assertEqual(types['Point.scale'],
+                         dict(args={'self': ['Point'], 'k': ['Double']},
+                              returns=['Point']))
+        self.assertEqual(types['total']['args'], {'xs': ['Int']})
+
+    def test_converted(self):
+        txt, diagnostics = convert(src, observe(src))
+        self.assertIn('def add(x: Int, y: Int): Int', txt)
+        self.assertIn('def total(xs: Int*): Long', txt)
+        self.assertIn('class Point(x: Double, y: Double)', txt)
+        self.assertIn('def scale(k: Double): Point', txt)
+        self.assertIn('def show(x: Any): String', txt)
+        self.assertIn((5, 'observed x of show as Int | String'),
+                      diagnostics)
+
+    def test_docstring_first(self):
+        typed = src.replace('return x + y',
+                            '""":type x: Long"""\n    return x + y')
+        txt, _ = convert(typed, observe(typed))
+        self.assertIn('def add(x: Long, y: Int): Int', txt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+'''Check that operator expressions keep their grouping in scala.
+
+Each python operator expression is converted on its own, with its
+operands replaced by names. The scala text is parsed back by scala's
+precedence rules, and the grouping compared with the python tree.
+'''
+
+import ast
+import itertools
+import re
+import StringIO
+import unittest
+
+import pkg_resources as pkg
+
+from .. import p2s
+from ..p2s import Precedence
+
+import test_convert
+
+token = re.compile(r'\s*(?:(?P<name>\w+)|(?P<op>[-!#%&*+/:<=>?@\\^|~]+)'
+                   r'|(?P<paren>[()]))')
+
+
+def scala_shape(txt):
+    '''Parse infix and prefix scala operators over names.
+
+    >>> scala_shape('a + b * c == d')
+    ('==', ('+', 'a', ('*', 'b', 'c')), 'd')
+    >>> scala_shape('! (a || b) && c')
+    ('&&', ('!', ('||', 'a', 'b')), 'c')
+    >>> scala_shape('a - -(-b)')
+    ('-', 'a', ('-', ('-', 'b')))
+
+    A prefix operator applies only to a name or parenthesized
+    expression, as in scala:
+
+    >>> scala_shape('- -b')
+    Traceback (most recent call last):
+      ...
+    AssertionError: -
+    '''
+    tokens = [(m.lastgroup, m.group(m.lastgroup))
+              for m in token.finditer(txt.strip())]
+
+    def simple(ix):
+        kind, tok = tokens[ix]
+        if tok == '(':
+            shape, ix = expr(ix + 1, 0)
+            assert tokens[ix] == ('paren', ')')
+            return shape, ix + 1
+        assert kind == 'name', tok
+        return tok, ix + 1
+
+    def primary(ix):
+        tok = tokens[ix][1]
+        if tok in ('!', '-', '~'):
+            shape, ix = simple(ix + 1)
+            return (tok, shape), ix
+        return simple(ix)
+
+    def expr(ix, min_prec):
+        left, ix = primary(ix)
+        while ix < len(tokens) and tokens[ix][1] != ')':
+            op = tokens[ix][1]
+            prec = Precedence.infix(op)
+            if prec < min_prec:
+                break
+            right, ix = expr(ix + 1, prec + 1)
+            left = (op, left, right)
+        return left, ix
+
+    shape, ix = expr(0, 0)
+    assert ix == len(tokens), txt
+    return shape
+
+
+def python_shape(node):
+    '''The grouping that the scala conversion of node should have.
+    '''
+    if isinstance(node, ast.BinOp):
+        return (p2s.PyToScala.operator[node.op.__class__],
+                python_shape(node.left), python_shape(node.right))
+    if isinstance(node, ast.BoolOp):
+        sym = {ast.And: '&&', ast.Or: '||'}[node.op.__class__]
+        return reduce(lambda l, r: (sym, l, r),
+                      [python_shape(v) for v in node.values])
+    if isinstance(node, ast.Compare):
+        syms = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=',
+                ast.Gt: '>', ast.GtE: '>=', ast.Is: 'eq', ast.IsNot: '!='}
+        operands = [node.left] + node.comparators
+        return reduce(lambda l, r: ('&&', l, r),
+                      [(syms[op.__class__], python_shape(l), python_shape(r))
+                       for (op, l, r) in zip(node.ops, operands,
+                                             operands[1:])])
+    if isinstance(node, ast.UnaryOp):
+        return (p2s.PyToScala.prefix_operator[node.op.__class__],
+                python_shape(node.operand))
+    return node.id
+
+
+def is_operator(node):
+    if isinstance(node, ast.BinOp):
+        return (node.op.__class__ in p2s.PyToScala.operator and
+                not (isinstance(node.op, ast.Mod) and
+                     isinstance(node.left, ast.Str)))
+    if isinstance(node, ast.Compare):
+        return not [op for op in node.ops
+                    if isinstance(op, (ast.In, ast.NotIn))]
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, (ast.Not, ast.USub, ast.Invert))
+    return isinstance(node, ast.BoolOp)
+
+
+class Leaves(ast.NodeTransformer):
+    '''Replace operands of operator expressions with names.
+    '''
+    def __init__(self):
+        self._names = ('v%d' % ix for ix in itertools.count())
+
+    def visit(self, node):
+        if is_operator(node) or not isinstance(node, ast.expr):
+            return self.generic_visit(node)
+        return ast.copy_location(ast.Name(id=next(self._names),
+                                          ctx=ast.Load()), node)
+
+
+def to_scala(expr):
+    out = StringIO.StringIO()
+    conv = p2s.PyToScala('m', out, [], find_package=None)
+    conv.visit(expr)
+    conv.flush()
+    return out.getvalue()
+
+
+def operator_exprs(tree):
+    '''Outermost operator expressions in tree.
+    '''
+    found = []
+
+    def walk(node, inside):
+        here = is_operator(node)
+        if here and not inside:
+            found.append(node)
+        for child in ast.iter_child_nodes(node):
+            walk(child, inside or here)
+    walk(tree, False)
+    return found
+
+
+class GroupingTest(unittest.TestCase):
+    def check(self, expr):
+        expr = Leaves().visit(expr)
+        txt = to_scala(expr)
+        self.assertEqual(scala_shape(txt), python_shape(expr), txt)
+
+    def test_fixtures(self):
+        checked = 0
+        for res in test_convert.read_manifest('manifest_ok.txt'):
+            tree = ast.parse(pkg.resource_string(test_convert.__name__, res))
+            for expr in operator_exprs(tree):
+                self.check(expr)
+                checked += 1
+        self.assertTrue(checked > 0)
+
+    def test_mismatched_precedence(self):
+        for src in ['a & b == c', '(a or b) and c', 'a or b and c',
+                    'not a == b', 'not (a and b)', 'a - (b - c)',
+                    'a - b - c', 'a ** b ** c', 'a * b ** c',
+                    'a << b + c', '(a << b) + c', 'a < b < c',
+                    '-a * b', '-(a * b)', 'a - -b', '~(a | b) ^ c',
+                    'a ^ b | c', '(a | b) ^ c', 'not -a', '- -a',
+                    'not not a',
+                    'a is b and c', '(a is b) == c', 'a | b & c',
+                    '(a | b) & c', 'a == (b < c)']:
+            self.check(ast.parse(src).body[0].value)
+
+    def test_every_pair(self):
+        ops = ['+', '-', '*', '/', '%', '<<', '|', '^', '&', '==', '<',
+               'and', 'or']
+        for op1, op2 in itertools.product(ops, ops):
+            for src in ['(a %s b) %s c' % (op1, op2),
+                        'a %s (b %s c)' % (op1, op2)]:
+                self.check(ast.parse(src).body[0].value)
+
+    def test_redundant_parens_dropped(self):
+        self.assertEqual(to_scala(ast.parse('a + b * c').body[0].value),
+                         'a + b * c')
+
+
+if __name__ == '__main__':
+    unittest.main()
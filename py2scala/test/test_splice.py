@@ -0,0 +1,130 @@
+'''Check that incremental conversion matches conversion from scratch.
+'''
+
+from functools import partial
+import ast
+import StringIO
+import multiprocessing
+import unittest
+
+import pkg_resources as pkg
+
+from .. import p2s
+from ..srcmap import SourceMap
+
+import test_convert
+
+
+def convert(src, previous=None, mk_pool=None):
+    find_package = test_convert._with_find_save(
+        lambda find_package, save_scala_fp: find_package)
+    out = StringIO.StringIO()
+    source_map = SourceMap('m.py')
+    chunks = {}
+    diagnostics = p2s.convert('m.py', src, out, find_package,
+                              source_map=source_map,
+                              chunks=chunks, previous=previous,
+                              mk_pool=mk_pool)
+    return out.getvalue(), chunks, source_map.entries(), diagnostics
+
+
+def touch(src, stmt):
+    '''Add a comment before a top-level statement.
+    '''
+    lines = src.splitlines(True)
+    return ''.join(lines[:stmt.lineno - 1] + ['# touched\n'] +
+                   lines[stmt.lineno - 1:])
+
+
+def fixtures():
+    for res in test_convert.read_manifest('manifest_ok.txt'):
+        yield res, pkg.resource_string(test_convert.__name__, res)
+
+
+class SpliceTest(unittest.TestCase):
+    def test_unchanged(self):
+        for res, src in fixtures():
+            txt, chunks, smap, diagnostics = convert(src)
+            again = convert(src, (txt, chunks))
+            self.assertEqual(again, (txt, chunks, smap, diagnostics), res)
+
+    def test_one_changed(self):
+        for res, src in fixtures():
+            txt, chunks, _, _ = convert(src)
+            defs = [stmt for stmt in ast.parse(src).body
+                    if isinstance(stmt, (ast.FunctionDef, ast.ClassDef))]
+            for stmt in defs:
+                changed = touch(src, stmt)
+                scratch = convert(changed)
+                self.assertEqual(convert(changed, (txt, chunks)), scratch,
+                                 '%s: %s' % (res, stmt.name))
+                self.assertIn('// touched', scratch[0])
+
+    def test_reused_verbatim(self):
+        src = 'def f():\n    return 1\n\ndef g():\n    return 2\n'
+        txt, chunks, _, _ = convert(src)
+        poisoned = txt.replace('1', 'one')
+        changed = src.replace('2', '3')
+        new_txt, _, _, _ = convert(changed, (poisoned, chunks))
+        self.assertIn('one', new_txt)
+        self.assertIn('3', new_txt)
+
+
+class SerialPool(object):
+    '''Run pool jobs in this process, noting them.
+    '''
+    jobs = []
+
+    def __init__(self, initializer, initargs):
+        initializer(*initargs)
+        self.jobs.extend(initargs[0])
+
+    def map(self, f, items):
+        return map(f, items)
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        p2s.PyToScala.parallel_min_lines = 0
+
+    def tearDown(self):
+        del p2s.PyToScala.parallel_min_lines
+
+    def test_fixtures(self):
+        for res, src in fixtures():
+            mk_pool = partial(multiprocessing.Pool, 2)
+            self.assertEqual(convert(src, mk_pool=mk_pool), convert(src),
+                             res)
+
+    def test_jobs(self):
+        src = ('import os\n'
+               'x = os.sep\n'
+               'def f(y):\n'
+               '    for z in y:\n'
+               '        if z:\n'
+               '            break\n'
+               '    return x\n'
+               '# g\n'
+               'def g():\n'
+               '    import re\n'
+               '    return re\n')
+        del SerialPool.jobs[:]
+        self.assertEqual(convert(src, mk_pool=SerialPool), convert(src))
+        self.assertEqual([job[0][0].name for job in SerialPool.jobs], ['f'])
+
+    def test_small_module_serial(self):
+        del p2s.PyToScala.parallel_min_lines
+        del SerialPool.jobs[:]
+        convert('def f():\n    return 1\n', mk_pool=SerialPool)
+        self.assertEqual(SerialPool.jobs, [])
+        p2s.PyToScala.parallel_min_lines = 0
+
+
+if __name__ == '__main__':
+    unittest.main()
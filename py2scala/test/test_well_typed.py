@@ -1,7 +1,9 @@
 import logging
 import unittest
+from subprocess import CalledProcessError
 
 from .. import p2s
+from ..srcmap import SourceMap, remap
 
 import test_convert
 
@@ -13,7 +15,7 @@ def _with_run(f,
     from imp import find_module
     from os import path as os_path
     from os import mkdir
-    from subprocess import check_call
+    from subprocess import check_output, STDOUT
     from sys import path as sys_path
 
     logging.basicConfig(level=logging.INFO)
@@ -22,16 +24,20 @@ def _with_run(f,
     target = maven_path('target', scala_version, '.')
     scala_src = maven_path('src', 'main', 'scala')
 
-    return f(run_scalac=mk_run_scalac(check_call, target, scala_src),
+    def run_and_capture(args):
+        return check_output(args, stderr=STDOUT)
+
+    return f(run_scalac=mk_run_scalac(run_and_capture, target, scala_src),
+             load_map=lambda fn: SourceMap.load(open(fn)),
              find_package=p2s.mk_find_package(find_module,
                                               os_path.split, sys_path),
              save_scala_fp=test_convert.mk_save_scala_fp(open, maven_path))
 
 
 def test_well_typed(with_run=_with_run):
-    run_scalac, find, save = with_run(
-        lambda run_scalac, find_package, save_scala_fp: (
-            run_scalac, find_package, save_scala_fp))
+    run_scalac, load_map, find, save = with_run(
+        lambda run_scalac, load_map, find_package, save_scala_fp: (
+            run_scalac, load_map, find_package, save_scala_fp))
 
     def with_caps(f):
         return f(find_package=find, save_scala_fp=save)
@@ -41,7 +47,9 @@ def test_well_typed(with_run=_with_run):
 
         try:
             run_scalac(scala_fn)
-        except:
+        except CalledProcessError as ex:
+            log.info('%s', remap(ex.output, scala_fn,
+                                 load_map(scala_fn + '.map')))
             actual_err = True
         else:
             actual_err = False
@@ -55,6 +63,10 @@ def test_well_typed(with_run=_with_run):
 
 
 def mk_run_scalac(check_call, target, scala_src, fsc_path='fsc'):
+    '''
+    :param check_call: run a command, raising CalledProcessError
+                       (with output) if it fails
+    '''
     def run_scalac(fn):
         args = [fsc_path,
                 '-d', target,
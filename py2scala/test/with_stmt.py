@@ -0,0 +1,74 @@
+'''
+with statements become try/finally when we know how to exit
+the context; otherwise we use with_ from the runtime.
+'''
+from contextlib import closing
+import StringIO
+
+
+class Resource(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ty, value, tb):
+        pass
+
+
+def first_lines(paths):
+    '''
+    :type paths: Seq[String]
+    :rtype: String
+    '''
+    for path in paths:
+        with open(path) as fp:
+            line = fp.readline()
+            if line:
+                return line
+    return ''
+
+
+def both(a, b):
+    '''
+    :type a: String
+    :type b: String
+    '''
+    with open(a) as fp:
+        print fp.readline()
+    with open(b) as fp:
+        print fp.readline()
+
+
+def declared(fp):
+    '''
+    :type fp: File
+    '''
+    with fp:
+        print fp.readline()
+
+
+def managed():
+    with Resource() as r:
+        print r
+    with closing(StringIO.StringIO()) as buf:
+        buf.write('x')
+
+
+class Quiet(object):
+    def __enter__(self):
+        ''':rtype: String'''
+        return 'quiet'
+
+    def __exit__(self, ty, value, tb):
+        return True
+
+
+def quietly():
+    with Quiet() as label:
+        raise ValueError(label.upper())
+    with Quiet():
+        print 'done'
+
+
+def unknown(lock):
+    with lock:
+        print 'locked'
@@ -10,7 +10,10 @@ object __builtin__ {
 
   /* types */
   /* scala compiler suggested +V. hmm */
-  class Dict[K, V] extends mutable.HashMap[K, V] {
+  class Dict[K, V](expected: Int = 0) extends mutable.HashMap[K, V] {
+    /** Room for the expected number of entries without rehashing. */
+    override protected def initialSize = math.max(16, expected * 4 / 3 + 1)
+
     def update(x: Dict[K, V]): Unit = {
       this ++= x
     }
@@ -19,8 +22,59 @@ object __builtin__ {
     def items(): Iterable[(K, V)] = TODO
     override def keys(): Seq[K] = TODO
     def pop(k: K): String = TODO
+
+    /** Step through the hash entries themselves; no tuple per item. */
+    def item_cursor: ItemCursor[K, V] = new ItemCursor[K, V] {
+      private val entries = entriesIterator
+      private var entry: mutable.DefaultEntry[K, V] = _
+      def hasNext = entries.hasNext
+      def next() { entry = entries.next() }
+      def key = entry.key
+      def value = entry.value
+    }
   }
 
+  /**
+   * Items of a map, one at a time, for
+   * `for k, v in d.items()` loops.
+   */
+  trait ItemCursor[K, V] {
+    def hasNext: Boolean
+    def next(): Unit
+    def key: K
+    def value: V
+  }
+
+  def item_cursor[K, V](m: collection.Map[K, V]): ItemCursor[K, V] = m match {
+    case d: Dict[K, V] => d.item_cursor
+    case _ => new ItemCursor[K, V] {
+      private val items = m.iterator
+      private var item: (K, V) = _
+      def hasNext = items.hasNext
+      def next() { item = items.next() }
+      def key = item._1
+      def value = item._2
+    }
+  }
+
+  /**
+   * Builds a Dict, for dict comprehensions; a size hint given before
+   * the first entry sizes its table.
+   */
+  def dict_builder[K, V](): mutable.Builder[(K, V), Dict[K, V]] =
+    new mutable.Builder[(K, V), Dict[K, V]] {
+      private var expected = 0
+      private var d: Dict[K, V] = null
+      override def sizeHint(size: Int) { if (d == null) expected = size }
+      def +=(kv: (K, V)) = {
+        if (d == null) d = new Dict[K, V](expected)
+        d += kv
+        this
+      }
+      def clear() { d = null }
+      def result() = if (d == null) new Dict[K, V](expected) else d
+    }
+
   object Dict {
     def apply[K, V]() = new Dict[K, V]()
     def apply[K, V](elems: (K, V)*): Dict[K, V] = TODO // mutable.Map(elems:_*)
@@ -90,7 +144,47 @@ object __builtin__ {
     def endswith(suffix: String) = s.endsWith(suffix)
 
 
-    def %(items: Any*): String = TODO
+    /* p2s specializes literal formats; this is the fallback */
+    def %(items: Any*): String = percent_format(s, items)
+  }
+
+  private val conversion =
+    """%(\([^)]*\))?([-#0 +]*)(\*|\d*)(?:\.(\*|\d+))?[hlL]?([diouxXeEfFgGcrs%])""".r
+
+  def percent_format(fmt: String, items: Seq[Any]): String = {
+    val args = (items match {
+      case Seq(t: Product) if t.getClass.getName.startsWith("scala.Tuple") =>
+        t.productIterator.toSeq
+      case _ => items
+    }).iterator
+    val out = new StringBuilder
+    var last = 0
+    for (m <- conversion.findAllMatchIn(fmt)) {
+      out.append(fmt.substring(last, m.start))
+      last = m.end
+      if (m.group(1) != null || m.group(3) == "*" || m.group(4) == "*") TODO
+      m.group(5) match {
+        case "%" => out.append('%')
+        case conv =>
+          val jconv = conv match {
+            case "i" | "u" => "d"
+            case "r" => "s"
+            case c => c
+          }
+          val prec = if (m.group(4) == null) "" else "." + m.group(4)
+          // python converts numbers to suit; java.util.Formatter won't
+          val arg = (jconv, args.next()) match {
+            case ("d" | "o" | "x" | "X", x: Double) => x.toLong
+            case ("e" | "E" | "f" | "g" | "G", n: Int) => n.toDouble
+            case ("e" | "E" | "f" | "g" | "G", n: Long) => n.toDouble
+            case ("c", n: Int) => n.toChar
+            case (_, x) => x
+          }
+          out.append(("%" + m.group(2) + m.group(3) + prec + jconv).format(arg))
+      }
+    }
+    out.append(fmt.substring(last))
+    out.toString
   }
 
   implicit def test_dict[K, V](d: Dict[K, V]): Boolean = d != null && !d.isEmpty
@@ -175,6 +269,13 @@ object __builtin__ {
     blk(obj)
   }
 
+  /** Whether the result of `__exit__` suppresses an exception:
+    * only true does; None (Unit) and the like let it propagate. */
+  def exit_suppresses(result: Any): Boolean = result match {
+    case b: Boolean => b
+    case _ => false
+  }
+
 
   val True = true
   val False = false
@@ -190,6 +291,44 @@ object __builtin__ {
   def `[...]`[T](xs: T*): mutable.IndexedSeq[T] = TODO
 
   def range(lo: Int, hi: Int) = lo to hi
+  def range(hi: Int) = 0 until hi
+
+  /**
+   * Indices that python's xs[lower:upper:step] takes from a sequence
+   * of the given length; bounds may be negative or missing.
+   */
+  def slice_indices(length: Int, lower: Option[Int], upper: Option[Int],
+                    step: Int): Range = {
+    if (step == 0) throw new ValueError("slice step cannot be zero")
+    val (first, last) = if (step > 0) (0, length) else (-1, length - 1)
+    def clamp(ix: Int) =
+      if (ix < 0) math.max(ix + length, first) else math.min(ix, last)
+    val start = lower.map(clamp).getOrElse(if (step > 0) first else last)
+    val stop = upper.map(clamp).getOrElse(if (step > 0) last else first)
+    Range(start, stop, step)
+  }
+
+  /** xs[lower:upper], keeping the type of xs. */
+  def slice_of[T, R](xs: collection.SeqLike[T, R], lower: Option[Int],
+                     upper: Option[Int]): R = {
+    val r = slice_indices(xs.length, lower, upper, 1)
+    xs.slice(r.start, r.end)
+  }
+
+  def slice_of(s: String, lower: Option[Int], upper: Option[Int]): String = {
+    val r = slice_indices(s.length, lower, upper, 1)
+    s.substring(r.start, math.max(r.start, r.end))
+  }
+
+  /** xs[lower:upper:step] as a view: nothing is copied. */
+  def slice_view[T](xs: Seq[T], lower: Option[Int], upper: Option[Int],
+                    step: Int): collection.SeqView[T, Seq[_]] =
+    slice_indices(xs.length, lower, upper, step).view.map(xs)
+
+  def divmod(n: Int, d: Int) = {
+    val q = n / d - (if (n % d != 0 && (n < 0) != (d < 0)) 1 else 0)
+    (q, n - q * d)
+  }
 
   def sum(xs: Iterable[Int]) = xs.reduce(_ + _)
 
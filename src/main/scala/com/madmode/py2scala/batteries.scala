@@ -373,6 +373,12 @@ ConfigParser -- responsible for parsing a list of
     def basicConfig(level: Int): Unit = TODO
     def getLogger(which: String): Logger = TODO
     class Logger {
+      var level = NOTSET
+      def setLevel(level: Int): Unit = { this.level = level }
+      def getEffectiveLevel(): Int = if (level == NOTSET) WARNING else level
+      /** p2s checks this before debug and info calls with arguments. */
+      def isEnabledFor(level: Int): Boolean = level >= getEffectiveLevel()
+
       def debug(msg: String, args: Any*): Unit = TODO
       def info(msg: String, args: Any*): Unit = TODO
       def warn(msg: String, args: Any*): Unit = TODO
@@ -432,19 +438,41 @@ ConfigParser -- responsible for parsing a list of
     import scala.util.matching
     import java.util.regex.Matcher
 
-    def compile(s: String): RegexObject = {
-      new RegexObject(s)
+    /** As in python, the most recently used patterns stay compiled. */
+    val MAXCACHE = 100
+    private val cache = new java.util.LinkedHashMap[String, RegexObject](
+      16, 0.75f, true) {
+      override def removeEldestEntry(
+          eldest: java.util.Map.Entry[String, RegexObject]) =
+        size() > MAXCACHE
+    }
+
+    def compile(s: String): RegexObject = cache.synchronized {
+      val found = cache.get(s)
+      if (found != null) found
+      else {
+        val compiled = new RegexObject(s)
+        cache.put(s, compiled)
+        compiled
+      }
     }
-    def match_(pattern: String, repl: String): Match = TODO
+    def purge(): Unit = cache.synchronized { cache.clear() }
+
+    def match_(pattern: String, s: String): Match = compile(pattern).match_(s)
+    def search(pattern: String, s: String): Match = compile(pattern).search(s)
 
     class RegexObject(regex: String) extends matching.Regex(regex) {
-      def match_(s: String): Match = TODO /* {
+      /** As python's match, anchored at the start but not the end. */
+      def match_(s: String): Match = match_(s, 0)
+      def match_(s: String, offset: Int): Match = {
         val m = this.pattern matcher s
-        runMatcher(m)
-        new JavaMatch(m)
-      }*/
-      def match_(s: String, offset: Int): Match = match_(s.drop(offset))
-      
+        // As in python, ^ matches at the start of s, not at offset.
+        m.region(offset, s.length)
+        m.useAnchoringBounds(false)
+        m.useTransparentBounds(true)
+        new JavaMatch(m, m.lookingAt())
+      }
+
       def search(s: String): Match = {
         new ScalaMatch(this.findFirstMatchIn(s))
       }
@@ -459,9 +487,9 @@ ConfigParser -- responsible for parsing a list of
     }
     implicit def test_matcher(m: Match): Boolean = m != null && m.test()
 
-    class JavaMatch(impl: Matcher) extends Match {
-      def test() = impl.matches()
-      def start(i: Int) = TODO
+    class JavaMatch(impl: Matcher, found: Boolean) extends Match {
+      def test() = found
+      def start(i: Int) = impl.start(i)
       def end(i: Int) = impl.end(i)
       def group(i: Int) = impl.group(i)
       def groups() = 1 to impl.groupCount map impl.group
@@ -470,8 +498,8 @@ ConfigParser -- responsible for parsing a list of
     class ScalaMatch(impl: Option[matching.Regex.Match]) extends Match {
       def test() = !impl.isEmpty
       def group(i: Int) = impl.get.group(i)
-      def start(i: Int) = TODO
-      def end(i: Int) = TODO
+      def start(i: Int) = impl.get.start(i)
+      def end(i: Int) = impl.get.end(i)
       def groups() = {
         val m = impl.get
         1 to m.groupCount map m.group